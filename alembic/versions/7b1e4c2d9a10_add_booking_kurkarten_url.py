@@ -0,0 +1,28 @@
+"""add_booking_kurkarten_url
+
+Revision ID: 7b1e4c2d9a10
+Revises: 42ce90daf3fe
+Create Date: 2026-10-19 10:12:41.530114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7b1e4c2d9a10'
+down_revision: Union[str, None] = '42ce90daf3fe'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('bookings', sa.Column('kurkarten_url', sa.String(), nullable=True))
+    op.add_column('bookings', sa.Column('kurkarten_url_fetched_at', sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('bookings', 'kurkarten_url_fetched_at')
+    op.drop_column('bookings', 'kurkarten_url')
@@ -0,0 +1,32 @@
+"""add_token_revocations
+
+Revision ID: a4c8e2f6b9d3
+Revises: f2b7d9e4a6c1
+Create Date: 2026-10-19 16:08:44.917253
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4c8e2f6b9d3'
+down_revision: Union[str, None] = 'f2b7d9e4a6c1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'token_revocations',
+        sa.Column('booking_id', sa.Integer(), nullable=False),
+        sa.Column('min_version', sa.Integer(), nullable=False),
+        sa.Column('revoked_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('booking_id'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('token_revocations')
@@ -0,0 +1,30 @@
+"""add_row_change_stamps
+
+Revision ID: b5d1f3a7c2e8
+Revises: a4c8e2f6b9d3
+Create Date: 2026-10-19 17:21:09.384652
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b5d1f3a7c2e8'
+down_revision: Union[str, None] = 'a4c8e2f6b9d3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('bookings', sa.Column('updated_at', sa.DateTime(), nullable=True))
+    op.add_column('invoice_snapshots', sa.Column('modified_at', sa.DateTime(), nullable=True))
+    op.execute("UPDATE bookings SET updated_at = modified_at")
+    op.execute("UPDATE invoice_snapshots SET modified_at = created_at")
+
+
+def downgrade() -> None:
+    op.drop_column('invoice_snapshots', 'modified_at')
+    op.drop_column('bookings', 'updated_at')
@@ -0,0 +1,34 @@
+"""add_scheduler_leases
+
+Revision ID: c3d5a8f1e2b4
+Revises: 7b1e4c2d9a10
+Create Date: 2026-10-19 11:02:17.284615
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3d5a8f1e2b4'
+down_revision: Union[str, None] = '7b1e4c2d9a10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'scheduler_leases',
+        sa.Column('job_name', sa.String(), nullable=False),
+        sa.Column('owner', sa.String(), nullable=True),
+        sa.Column('locked_until', sa.DateTime(), nullable=True),
+        sa.Column('last_completed_key', sa.String(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('job_name'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('scheduler_leases')
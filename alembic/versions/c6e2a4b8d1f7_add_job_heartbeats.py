@@ -0,0 +1,28 @@
+"""add_job_heartbeats
+
+Revision ID: c6e2a4b8d1f7
+Revises: b5d1f3a7c2e8
+Create Date: 2026-10-19 19:02:47.615203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c6e2a4b8d1f7'
+down_revision: Union[str, None] = 'b5d1f3a7c2e8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('jobs', sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('jobs', sa.Column('heartbeat_at', sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('jobs', 'heartbeat_at')
+    op.drop_column('jobs', 'attempts')
@@ -0,0 +1,26 @@
+"""add_job_run_after
+
+Revision ID: d7f3b5c9e2a4
+Revises: c6e2a4b8d1f7
+Create Date: 2026-10-19 20:11:38.402915
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd7f3b5c9e2a4'
+down_revision: Union[str, None] = 'c6e2a4b8d1f7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('jobs', sa.Column('run_after', sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('jobs', 'run_after')
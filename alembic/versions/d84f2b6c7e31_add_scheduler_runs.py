@@ -0,0 +1,43 @@
+"""add_scheduler_runs
+
+Revision ID: d84f2b6c7e31
+Revises: c3d5a8f1e2b4
+Create Date: 2026-10-19 11:48:53.902147
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd84f2b6c7e31'
+down_revision: Union[str, None] = 'c3d5a8f1e2b4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'scheduler_runs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('job_name', sa.String(), nullable=False),
+        sa.Column('run_key', sa.String(), nullable=False),
+        sa.Column('owner', sa.String(), nullable=True),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.Column('duration_seconds', sa.Float(), nullable=True),
+        sa.Column('items_processed', sa.Integer(), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(op.f('ix_scheduler_runs_id'), 'scheduler_runs', ['id'], unique=False)
+    op.create_index(op.f('ix_scheduler_runs_job_name'), 'scheduler_runs', ['job_name'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_scheduler_runs_job_name'), table_name='scheduler_runs')
+    op.drop_index(op.f('ix_scheduler_runs_id'), table_name='scheduler_runs')
+    op.drop_table('scheduler_runs')
@@ -0,0 +1,33 @@
+"""add_scheduler_checkpoints
+
+Revision ID: e1a9c47b3f58
+Revises: d84f2b6c7e31
+Create Date: 2026-10-19 13:27:05.661390
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e1a9c47b3f58'
+down_revision: Union[str, None] = 'd84f2b6c7e31'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'scheduler_checkpoints',
+        sa.Column('job_name', sa.String(), nullable=False),
+        sa.Column('run_key', sa.String(), nullable=False),
+        sa.Column('last_booking_id', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('job_name', 'run_key'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('scheduler_checkpoints')
@@ -1,14 +1,20 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 
+from app.config.config import get_email_config
 from app.database import get_db
 from app.models import UnitPrice, PriceType
 from app.schemas import (
     UnitPriceResponse,
     ElectricityPriceCreate, StayPriceCreate, 
-    GasPriceCreate, FirewoodPriceCreate
+    GasPriceCreate, FirewoodPriceCreate,
+    GuestMailingCreate, GuestMailingResponse,
+    SchedulerRunResponse, SchedulerJobStats
 )
+from app.services.bulk_mail_service import BulkMailService, get_mailing
+from app.services.communication_service import CommunicationService
+from app.services.scheduler_run_service import SchedulerRunService
 from app.auth_dependencies import get_current_admin
 
 router = APIRouter(prefix="/admin", tags=["admin"])
@@ -129,3 +135,61 @@ def list_firewood_prices(
         UnitPrice.price_type == PriceType.FIREWOOD_PER_BOX
     ).order_by(UnitPrice.effective_from.desc()).all()
 
+
+# Guest mailing endpoints
+@router.post("/mailings", response_model=GuestMailingResponse, status_code=202)
+def create_guest_mailing(
+    mailing_data: GuestMailingCreate,
+    db: Session = Depends(get_db),
+    current_admin = Depends(get_current_admin)
+):
+    """Queue a templated email to every guest with a booking in the given segment; a job runner sends it."""
+    bulk_mail_service = BulkMailService(db, CommunicationService(get_email_config()))
+    try:
+        mailing = bulk_mail_service.queue_mailing(
+            template_name=mailing_data.template_name,
+            subject=mailing_data.subject,
+            message=mailing_data.message,
+            check_in_from=mailing_data.check_in_from,
+            check_in_to=mailing_data.check_in_to,
+            statuses=mailing_data.statuses,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return mailing
+
+
+@router.get("/mailings/{mailing_id}", response_model=GuestMailingResponse)
+def get_guest_mailing(
+    mailing_id: str,
+    db: Session = Depends(get_db),
+    current_admin = Depends(get_current_admin)
+):
+    """Get the progress of a guest mailing."""
+    mailing = get_mailing(db, mailing_id)
+    if not mailing:
+        raise HTTPException(status_code=404, detail="Mailing not found")
+    return mailing
+
+
+# Scheduler endpoints
+@router.get("/scheduler/runs", response_model=List[SchedulerRunResponse])
+def list_scheduler_runs(
+    job_name: Optional[str] = None,
+    limit: int = 50,
+    db: Session = Depends(get_db),
+    current_admin = Depends(get_current_admin)
+):
+    """List the most recent scheduled job runs, optionally for one job."""
+    return SchedulerRunService(db).get_runs(job_name=job_name, limit=min(limit, 500))
+
+
+@router.get("/scheduler/stats", response_model=List[SchedulerJobStats])
+def get_scheduler_stats(
+    days: int = 30,
+    db: Session = Depends(get_db),
+    current_admin = Depends(get_current_admin)
+):
+    """Get run counts and duration percentiles per scheduled job over the last days."""
+    return SchedulerRunService(db).get_stats(days=days)
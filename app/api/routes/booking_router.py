@@ -1,21 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request, Response
 from sqlalchemy.orm import Session
 
 from app.booking_repository import BookingRepository
-from app.config.config import get_email_config, get_payment_config
+from app.config.config import get_email_config
 from app.database import get_db
 from app.guest_repository import GuestRepository
 from app.schemas import (
     BookingCreate, BookingResponse, BookingUpdate, BookingPartialUpdate, KurtaxeUpdate,
     MeterReadingCreate, MeterReadingUpdate, MeterReadingResponse,
-    PaymentCreate, PaymentResponse, BookingTokenResponse
+    PaymentCreate, PaymentResponse, BookingTokenResponse, JobResponse
 )
 from app.services.booking_service import BookingService
 from app.services.communication_service import CommunicationService
-from app.services.kurkarten_service import KurkartenService
+from app.services.etag_service import EtagService, etag_matches
+from app.services.job_service import JobService
+from app.services.kurkarten_service import KurkartenService, prefetch_kurkarten_url_in_background
 from app.services.meter_service import MeterService
 from app.services.payment_service import PaymentService
-from app.services.invoice_service import InvoiceService
 from app.services.token_service import TokenService
 from app.auth_dependencies import get_current_admin
 
@@ -49,6 +50,10 @@ def get_kurkarten_service(
     return KurkartenService(db, communication_service)
 
 
+def get_job_service(db: Session = Depends(get_db)):
+    return JobService(db)
+
+
 def get_meter_service(db: Session = Depends(get_db)):
     return MeterService(db)
 
@@ -57,15 +62,6 @@ def get_payment_service(db: Session = Depends(get_db)):
     return PaymentService(db)
 
 
-def get_invoice_service(
-    db: Session = Depends(get_db),
-    communication_service: CommunicationService = Depends(get_communication_service),
-    meter_service: MeterService = Depends(get_meter_service),
-    payment_config=Depends(get_payment_config)
-):
-    return InvoiceService(db, communication_service, meter_service, payment_config)
-
-
 @router.post("/bookings", response_model=BookingResponse)
 def add_booking(
     booking: BookingCreate,
@@ -80,27 +76,51 @@ def add_booking(
 
 @router.get("/bookings", response_model=list[BookingResponse])
 def list_bookings(
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_db),
     booking_service: BookingService = Depends(get_booking_service),
     current_admin = Depends(get_current_admin)
 ):
+    etag_service = EtagService(db)
+    etag = etag_service.bookings_etag()
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
     try:
-        return booking_service.get_all_bookings()
+        bookings = booking_service.get_all_bookings()
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+    # Taken after loading, since loading can update booking statuses
+    response.headers["ETag"] = etag_service.bookings_etag()
+    return bookings
+
 
 @router.get("/booking/{booking_id}", response_model=BookingResponse)
 def get_booking_by_id(
     booking_id: int, 
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_db),
     booking_service: BookingService = Depends(get_booking_service),
     current_admin = Depends(get_current_admin)
 ):
     """Get a specific booking by ID with invoice details."""
+    etag_service = EtagService(db)
+    etag = etag_service.booking_etag(booking_id)
+    if etag and etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
     try:
-        return booking_service.get_booking_by_id_with_invoice(booking_id)
+        booking = booking_service.get_booking_by_id_with_invoice(booking_id)
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
 
+    # Taken after loading, since loading can update the booking status
+    response.headers["ETag"] = etag_service.booking_etag(booking_id)
+    return booking
+
 
 @router.patch("/booking/{booking_id}", response_model=BookingResponse)
 def update_booking(
@@ -131,25 +151,45 @@ def delete_booking(
 @router.patch("/booking/{booking_id}/confirm", response_model=BookingResponse)
 def confirm_booking(
     booking_id: int, 
+    background_tasks: BackgroundTasks,
     booking_service: BookingService = Depends(get_booking_service),
     current_admin = Depends(get_current_admin)
 ):
     try:
-        return booking_service.confirm_booking(booking_id)
+        booking = booking_service.confirm_booking(booking_id)
     except ValueError:
         raise HTTPException(status_code=404)
 
+    # Get the guest link from the AVS portal now, so the kurkarten email later only has to be sent
+    background_tasks.add_task(prefetch_kurkarten_url_in_background, booking_id)
+    return booking
+
 
-@router.post("/booking/{booking_id}/kurkarten/send")
+def queue_booking_job(job_service: JobService, job_type: str, booking_id: int):
+    try:
+        return job_service.enqueue_booking_job(job_type, booking_id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@router.post("/booking/{booking_id}/kurkarten/send", response_model=JobResponse, status_code=202)
 def send_kurkarten_email(
     booking_id: int,
-    kurkarten_service: KurkartenService = Depends(get_kurkarten_service),
+    job_service: JobService = Depends(get_job_service),
+    current_admin = Depends(get_current_admin)
+):
+    """Queue the kurkarten request email; poll GET /jobs/{id} for the outcome."""
+    return queue_booking_job(job_service, "kurkarten_email", booking_id)
+
+
+@router.post("/booking/{booking_id}/kurkarten/resend", response_model=JobResponse, status_code=202)
+def resend_kurkarten_email(
+    booking_id: int,
+    job_service: JobService = Depends(get_job_service),
     current_admin = Depends(get_current_admin)
 ):
-    """Send kurkarten request email to guest (for testing)."""
-    if kurkarten_service.send_kurkarten_request_email(booking_id):
-        return {"message": "Kurkarten email sent successfully"}
-    raise HTTPException(status_code=400, detail="Failed to send kurkarten email")
+    """Queue sending the kurkarten request email again, reusing the stored guest link."""
+    return queue_booking_job(job_service, "kurkarten_email_resend", booking_id)
 
 
 @router.post("/booking/{booking_id}/pre-arrival/send")
@@ -164,38 +204,24 @@ def send_pre_arrival_email(
     raise HTTPException(status_code=400, detail="Failed to send pre-arrival email")
 
 
-@router.post("/booking/{booking_id}/invoice/generate")
+@router.post("/booking/{booking_id}/invoice/generate", response_model=JobResponse, status_code=202)
 def generate_invoice(
     booking_id: int,
-    invoice_service: InvoiceService = Depends(get_invoice_service),
+    job_service: JobService = Depends(get_job_service),
     current_admin = Depends(get_current_admin)
 ):
-    """Generate invoice data for a booking (does not send email)."""
-    try:
-        invoice_data = invoice_service.generate_invoice_data(booking_id)
-        return {
-            "message": "Invoice generated successfully", 
-            "invoice_id": invoice_data['invoice_id'],
-            "invoice_data": invoice_data
-        }
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
+    """Queue invoice generation for a booking (does not send email); the job result holds the invoice data."""
+    return queue_booking_job(job_service, "invoice_generation", booking_id)
 
 
-@router.post("/booking/{booking_id}/invoice/send")
+@router.post("/booking/{booking_id}/invoice/send", response_model=JobResponse, status_code=202)
 def send_invoice_email(
     booking_id: int,
-    invoice_service: InvoiceService = Depends(get_invoice_service),
+    job_service: JobService = Depends(get_job_service),
     current_admin = Depends(get_current_admin)
 ):
-    """Send invoice email for a booking (requires invoice to be generated first)."""
-    try:
-        success = invoice_service.send_invoice_email(booking_id)
-        if success:
-            return {"message": "Invoice email sent successfully"}
-        raise HTTPException(status_code=400, detail="Failed to send invoice email")
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
+    """Queue the invoice email for a booking (requires invoice to be generated first)."""
+    return queue_booking_job(job_service, "invoice_email", booking_id)
 
 
 @router.patch("/booking/{booking_id}/kurtaxe", response_model=BookingResponse)
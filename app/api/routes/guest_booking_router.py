@@ -1,7 +1,8 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from sqlalchemy.orm import Session
 
 from app.database import get_db
+from app.services.etag_service import EtagService, etag_matches
 from app.services.token_service import TokenService
 from app.services.meter_service import MeterService
 from app.schemas import GuestBookingResponse, MeterReadingBase, MeterReadingCreate, MeterReadingResponse
@@ -10,18 +11,23 @@ router = APIRouter(prefix="/guest", tags=["guest"])
 
 
 @router.get("/booking/{token}", response_model=GuestBookingResponse)
-def get_booking_by_token(token: str, db: Session = Depends(get_db)):
+def get_booking_by_token(token: str, request: Request, response: Response, db: Session = Depends(get_db)):
     """Get booking details for guest access via magic link"""
     token_service = TokenService(db)
-    booking = token_service.get_booking_by_token(token)
+    booking_id = token_service.get_booking_id_for_token(token)
+    etag = EtagService(db).guest_booking_etag(booking_id) if booking_id is not None else None
     
-    if not booking:
+    if not etag:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Invalid or expired token"
         )
-    
-    return booking
+
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+    response.headers["ETag"] = etag
+    return token_service.get_guest_booking(booking_id)
 
 
 @router.post("/booking/{token}/readings", response_model=MeterReadingResponse)
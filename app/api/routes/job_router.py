@@ -0,0 +1,22 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+
+from app.database import get_db
+from app.schemas import JobResponse
+from app.services.job_service import JobService
+from app.auth_dependencies import get_current_admin
+
+router = APIRouter()
+
+
+@router.get("/jobs/{job_id}", response_model=JobResponse)
+def get_job(
+    job_id: str,
+    db: Session = Depends(get_db),
+    current_admin = Depends(get_current_admin)
+):
+    """Get the status and, once finished, the result or error of a queued job."""
+    job = JobService(db).get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
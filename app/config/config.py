@@ -1,5 +1,6 @@
 import logging
 import os
+import tempfile
 
 from dotenv import find_dotenv, load_dotenv
 
@@ -13,12 +14,23 @@ load_dotenv(env_file)
 
 
 def get_email_config():
+    # Without SEND_REAL_EMAILS=true, messages are written to a local maildir instead of being sent
+    send_real_emails = os.getenv("SEND_REAL_EMAILS", "false").lower() == "true"
+    default_backend = "smtp" if send_real_emails else "file"
     return {
+        "backend": os.getenv("EMAIL_BACKEND") or default_backend,
+        "file_path": os.getenv("EMAIL_FILE_PATH", "sent_emails"),
+        "file_format": os.getenv("EMAIL_FILE_FORMAT", "maildir"),
         "sender": os.getenv("EMAIL_SENDER_EMAIL"),
+        # Guest emails are copied to the agent; set EMAIL_AGENT_CC to an empty string to turn this off
+        "agent_cc": os.getenv("EMAIL_AGENT_CC", "hausb@mailbox.org"),
         "smtp_server": os.getenv("EMAIL_SMTP_SERVER"),
         "smtp_port": os.getenv("EMAIL_SMTP_PORT"),
         "username": os.getenv("EMAIL_USERNAME"),
         "password": os.getenv("EMAIL_PASSWORD"),
+        "starttls": os.getenv("EMAIL_SMTP_STARTTLS", "true").lower() == "true",
+        "max_concurrency": int(os.getenv("EMAIL_MAX_CONCURRENCY", "5")),
+        "send_timeout": float(os.getenv("EMAIL_SEND_TIMEOUT", "30")),
     }
 
 
@@ -70,4 +82,104 @@ def get_kurkarten_config():
         "passwort": os.getenv("KURKARTEN_PASSWORT"),
         "ort": os.getenv("KURKARTEN_ORT"),
         "hotel": os.getenv("KURKARTEN_HOTEL"),
+        "base_url": os.getenv("KURKARTEN_BASE_URL", "https://meldeschein.avs.de"),
+        "session_max_age": int(os.getenv("KURKARTEN_SESSION_MAX_AGE", "900")),
+        "max_concurrency": int(os.getenv("KURKARTEN_MAX_CONCURRENCY", "4")),
+        "connect_timeout": float(os.getenv("KURKARTEN_CONNECT_TIMEOUT", "5")),
+        "read_timeout": float(os.getenv("KURKARTEN_READ_TIMEOUT", "30")),
+        "max_retries": int(os.getenv("KURKARTEN_MAX_RETRIES", "2")),
+        "retry_budget_ratio": float(os.getenv("KURKARTEN_RETRY_BUDGET_RATIO", "0.2")),
+        "breaker_failure_threshold": int(os.getenv("KURKARTEN_BREAKER_FAILURE_THRESHOLD", "3")),
+        "breaker_reset_timeout": float(os.getenv("KURKARTEN_BREAKER_RESET_TIMEOUT", "120")),
+        "url_ttl_days": int(os.getenv("KURKARTEN_URL_TTL_DAYS", "60")),
+        "prefetch_lead_days": int(os.getenv("KURKARTEN_PREFETCH_LEAD_DAYS", "14")),
+        "prefetch_time": os.getenv("KURKARTEN_PREFETCH_TIME", "03:30"),
+    }
+
+
+def get_template_config():
+    # Templates are compiled once per process; only reload them from disk outside production
+    default_auto_reload = "false" if env == "production" else "true"
+    return {
+        "templates_dir": os.getenv("TEMPLATES_DIR", "templates"),
+        "bytecode_cache_dir": os.getenv(
+            "TEMPLATE_BYTECODE_CACHE_DIR",
+            os.path.join(tempfile.gettempdir(), "amrum-be-jinja-cache"),
+        ),
+        "auto_reload": os.getenv("TEMPLATE_AUTO_RELOAD", default_auto_reload).lower() == "true",
+    }
+
+
+def get_scheduler_config():
+    return {
+        # Web processes can leave the scheduled jobs to a separate worker (python -m app.worker)
+        "enabled": os.getenv("SCHEDULER_ENABLED", "true").lower() == "true",
+        # Threads that run scheduled jobs, so they never block the event loop
+        "workers": int(os.getenv("SCHEDULER_WORKERS", "2")),
+        # How long a process may hold a job before others assume it died; renewed every third of it while the job runs
+        "lease_seconds": int(os.getenv("SCHEDULER_LEASE_SECONDS", "300")),
+        # Run jobs missed while the app was down when it starts again, and retry unfinished runs
+        "catch_up": os.getenv("SCHEDULER_CATCH_UP", "true").lower() == "true",
+        # How often today's failed or abandoned runs are retried
+        "retry_minutes": int(os.getenv("SCHEDULER_RETRY_MINUTES", "30")),
+        # Start of the daily booking pipeline (status updates, confirmations, kurkarten, pre-arrival and invoice
+        # emails). These used to run one by one from 08:45 to 09:45; guests now get all of them from this time on.
+        "pipeline_time": os.getenv("SCHEDULER_PIPELINE_TIME", "09:00"),
+        # Bookings handled per short-lived session in the daily pipeline
+        "chunk_size": int(os.getenv("SCHEDULER_CHUNK_SIZE", "200")),
+    }
+
+
+def get_job_config():
+    return {
+        # Queued jobs (e.g. kurkarten emails sent from the admin UI) run in the worker (python -m app.worker);
+        # set to true to also run them in a web process, e.g. for local development without a worker
+        "runner_enabled": os.getenv("JOB_RUNNER_ENABLED", "false").lower() == "true",
+        # How often an idle runner looks for queued jobs
+        "poll_seconds": float(os.getenv("JOB_POLL_SECONDS", "2")),
+        # A running job whose runner sent no heartbeat for this long is queued again, its runner died
+        "timeout_seconds": float(os.getenv("JOB_TIMEOUT_SECONDS", "120")),
+        # Runs of a job (including ones its runner died in) before it is failed instead of queued again
+        "max_attempts": int(os.getenv("JOB_MAX_ATTEMPTS", "3")),
+    }
+
+
+def get_token_config():
+    config = {
+        # Validated guest tokens kept in memory per process, so portal page views skip the token lookup
+        "cache_size": int(os.getenv("TOKEN_CACHE_SIZE", "1024")),
+        # Upper bound for how long a token revoked in another process stays usable here
+        "cache_ttl_seconds": float(os.getenv("TOKEN_CACHE_TTL_SECONDS", "60")),
+        # last_used_at is collected in memory and written in one batch at most this often
+        "last_used_flush_seconds": float(os.getenv("TOKEN_LAST_USED_FLUSH_SECONDS", "60")),
+        # "signed" issues tokens that are checked without a database lookup; opaque tokens stay valid either way
+        "format": os.getenv("TOKEN_FORMAT", "opaque").lower(),
+        "signing_key": os.getenv("TOKEN_SIGNING_KEY", ""),
+        # Daily deletion of expired tokens, in batches so no transaction holds many row locks
+        "purge_time": os.getenv("TOKEN_PURGE_TIME", "04:15"),
+        "purge_batch_size": int(os.getenv("TOKEN_PURGE_BATCH_SIZE", "500")),
+        # Bloom filter of live tokens that rejects guessed tokens without a query
+        "filter_capacity": int(os.getenv("TOKEN_FILTER_CAPACITY", "100000")),
+        # At most one lookup of newly issued tokens per interval while unknown tokens come in
+        "filter_probe_seconds": float(os.getenv("TOKEN_FILTER_PROBE_SECONDS", "1")),
+        "filter_rebuild_seconds": float(os.getenv("TOKEN_FILTER_REBUILD_SECONDS", "3600")),
+        # Each lookup of new tokens also rereads this far back, for tokens committed out of order elsewhere
+        "filter_overlap_seconds": float(os.getenv("TOKEN_FILTER_OVERLAP_SECONDS", "60")),
+        # Tokens found invalid are rejected from memory for a short while
+        "negative_cache_size": int(os.getenv("TOKEN_NEGATIVE_CACHE_SIZE", "10000")),
+        "negative_cache_ttl_seconds": float(os.getenv("TOKEN_NEGATIVE_CACHE_TTL_SECONDS", "30")),
+    }
+
+    # Checked when the token service is loaded, so a bad setting stops startup instead of failing bookings
+    if config["format"] not in ("opaque", "signed"):
+        raise ValueError(f"TOKEN_FORMAT must be 'opaque' or 'signed', not '{config['format']}'")
+    if config["format"] == "signed" and not config["signing_key"]:
+        raise ValueError("TOKEN_SIGNING_KEY must be set when TOKEN_FORMAT=signed")
+    return config
+
+
+def get_bulk_mail_config():
+    return {
+        "batch_size": int(os.getenv("BULK_MAIL_BATCH_SIZE", "20")),
+        "rate_per_minute": int(os.getenv("BULK_MAIL_RATE_PER_MINUTE", "30")),
     }
@@ -1,6 +1,8 @@
 import datetime
+import json
 import secrets
 from enum import Enum
+from typing import Optional
 
 from sqlalchemy import Boolean, Column, Date, DateTime, ForeignKey, Integer, String, Float, Text, Enum as SQLEnum, CheckConstraint
 from sqlalchemy.orm import relationship, backref
@@ -52,6 +54,8 @@ class Booking(Base):
     # Kurkarten email tracking
     kurkarten_email_sent = Column(Boolean, default=False)
     kurkarten_email_sent_date = Column(DateTime, nullable=True)
+    kurkarten_url = Column(String, nullable=True)
+    kurkarten_url_fetched_at = Column(DateTime, nullable=True)
     
     # Pre-arrival email tracking
     pre_arrival_email_sent = Column(Boolean, default=False)
@@ -66,7 +70,10 @@ class Booking(Base):
     invoice_sent_date = Column(DateTime, nullable=True)
     
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    # Set by the services on status-relevant changes; drives auto-confirmation, so not bumped on every write
     modified_at = Column(DateTime, default=datetime.datetime.utcnow)
+    # Bumped on every write, for ETags
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
 
     # Database constraints
     __table_args__ = (
@@ -93,6 +100,15 @@ class BookingToken(Base):
     booking = relationship("Booking", backref=backref("tokens", cascade="all, delete-orphan"))
 
 
+class TokenRevocation(Base):
+    """Signed tokens of a booking with a version below min_version are revoked."""
+    __tablename__ = "token_revocations"
+
+    booking_id = Column(Integer, primary_key=True)
+    min_version = Column(Integer, nullable=False, default=0)
+    revoked_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+
 class Guest(Base):
     __tablename__ = "guests"
 
@@ -104,7 +120,7 @@ class Guest(Base):
     hashed_password = Column(String, nullable=False)
     is_admin = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
-    modified_at = Column(DateTime, default=datetime.datetime.utcnow)
+    modified_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
 
     bookings = relationship("Booking", back_populates="guest")
 
@@ -127,7 +143,7 @@ class MeterReading(Base):
     firewood_boxes = Column(Integer, nullable=True)
     
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
-    modified_at = Column(DateTime, default=datetime.datetime.utcnow)
+    modified_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
 
     booking = relationship("Booking", back_populates="meter_readings")
 
@@ -145,7 +161,7 @@ class Payment(Base):
     notes = Column(Text, nullable=True)
     
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
-    modified_at = Column(DateTime, default=datetime.datetime.utcnow)
+    modified_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
 
     booking = relationship("Booking", back_populates="payments")
 
@@ -167,7 +183,7 @@ class UnitPrice(Base):
     # Metadata
     description = Column(String, nullable=True)
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
-    modified_at = Column(DateTime, default=datetime.datetime.utcnow)
+    modified_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
 
 
 class InvoiceSnapshot(Base):
@@ -197,6 +213,7 @@ class InvoiceSnapshot(Base):
     total_cost = Column(Float, nullable=False, default=0)
 
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    modified_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
 
     booking = relationship("Booking", back_populates="invoice_snapshot")
 
@@ -212,3 +229,78 @@ class AdminUser(Base):
     is_superuser = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
     last_login = Column(DateTime, nullable=True)
+
+
+class SchedulerLease(Base):
+    __tablename__ = "scheduler_leases"
+
+    job_name = Column(String, primary_key=True)
+    owner = Column(String, nullable=True)
+    locked_until = Column(DateTime, nullable=True)
+    last_completed_key = Column(String, nullable=True)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+
+class SchedulerRun(Base):
+    __tablename__ = "scheduler_runs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    job_name = Column(String, index=True, nullable=False)
+    run_key = Column(String, nullable=False)
+    owner = Column(String, nullable=True)
+    status = Column(String, nullable=False, default="running")
+    started_at = Column(DateTime, default=datetime.datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+    duration_seconds = Column(Float, nullable=True)
+    items_processed = Column(Integer, nullable=True)
+    error = Column(Text, nullable=True)
+
+
+class SchedulerCheckpoint(Base):
+    __tablename__ = "scheduler_checkpoints"
+
+    job_name = Column(String, primary_key=True)
+    run_key = Column(String, primary_key=True)
+    last_booking_id = Column(Integer, nullable=False)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+
+class Job(Base):
+    """A long-running action queued from an API request and run by a job runner."""
+    __tablename__ = "jobs"
+
+    id = Column(String, primary_key=True)
+    job_type = Column(String, nullable=False)
+    status = Column(String, index=True, nullable=False, default="queued")
+    payload_json = Column(Text, nullable=False, default="{}")
+    result_json = Column(Text, nullable=True)
+    error = Column(Text, nullable=True)
+    owner = Column(String, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+    # A queued job is not claimed before this time, e.g. the next batch of a throttled mailing
+    run_after = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    @property
+    def payload(self) -> dict:
+        return json.loads(self.payload_json or "{}")
+
+    @property
+    def result(self):
+        return json.loads(self.result_json) if self.result_json is not None else None
+
+    @property
+    def total(self) -> Optional[int]:
+        """Number of items of a job that reports progress; such jobs put it in their payload."""
+        return self.payload.get("total")
+
+    @property
+    def processed(self) -> Optional[int]:
+        """Items done so far, from the ``processed`` count the handler keeps in the result."""
+        if self.total is None:
+            return None
+        result = self.result
+        return result.get("processed", 0) if isinstance(result, dict) else 0
@@ -227,6 +227,8 @@ class BookingResponse(BookingBase):
     # New fields
     kurkarten_email_sent: bool = False
     kurkarten_email_sent_date: Optional[datetime.datetime] = None
+    kurkarten_url: Optional[str] = None
+    kurkarten_url_fetched_at: Optional[datetime.datetime] = None
     pre_arrival_email_sent: bool = False
     pre_arrival_email_sent_date: Optional[datetime.datetime] = None
     kurtaxe_amount: Optional[float] = None
@@ -291,6 +293,91 @@ class GuestBookingResponse(BaseModel):
         from_attributes = True
 
 
+# Guest Mailing Schemas
+class GuestMailingCreate(BaseModel):
+    """Send a templated message to all guests with a booking in the segment"""
+    template_name: str = "guest_announcement"
+    subject: str
+    message: Optional[str] = None
+    check_in_from: datetime.date
+    check_in_to: datetime.date
+    statuses: Optional[List[BookingStatus]] = None
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "template_name": "guest_announcement",
+                "subject": "Haus B: Neue Hausordnung",
+                "message": "Ab dieser Saison gilt eine neue Hausordnung.",
+                "check_in_from": "2025-01-01",
+                "check_in_to": "2025-12-31",
+                "statuses": ["confirmed", "kurkarten_requested"]
+            }
+        }
+
+
+class GuestMailingResponse(BaseModel):
+    id: str
+    template_name: str
+    subject: str
+    status: str
+    total: int
+    sent: int
+    failed: int
+    errors: List[str] = []
+    created_at: datetime.datetime
+    started_at: Optional[datetime.datetime] = None
+    finished_at: Optional[datetime.datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+class JobResponse(BaseModel):
+    id: str
+    job_type: str
+    status: str
+    payload: dict
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    processed: Optional[int] = None
+    total: Optional[int] = None
+    created_at: datetime.datetime
+    started_at: Optional[datetime.datetime] = None
+    finished_at: Optional[datetime.datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+class SchedulerRunResponse(BaseModel):
+    id: int
+    job_name: str
+    run_key: str
+    owner: Optional[str] = None
+    status: str
+    started_at: datetime.datetime
+    finished_at: Optional[datetime.datetime] = None
+    duration_seconds: Optional[float] = None
+    items_processed: Optional[int] = None
+    error: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+
+class SchedulerJobStats(BaseModel):
+    job_name: str
+    runs: int
+    failed: int
+    items_processed: int
+    avg_duration_seconds: Optional[float] = None
+    p95_duration_seconds: Optional[float] = None
+    max_duration_seconds: Optional[float] = None
+    last_started_at: datetime.datetime
+    last_status: str
+
+
 # Authentication Schemas
 class AdminUserBase(BaseModel):
     username: str
@@ -0,0 +1,367 @@
+import asyncio
+import logging
+import re
+import threading
+import time
+from typing import Optional
+
+import httpx
+
+from app.config.config import get_kurkarten_config
+from app.services.circuit_breaker import CircuitBreaker, RetryBudget, backoff_delay
+
+logger = logging.getLogger(__name__)
+
+GUEST_LINK_PATTERN = r"(https://selfcheck-in-meldeschein\.avs\.de/\?hash=[a-f0-9]+)"
+
+
+class GuestLinkScanner:
+    """Search streamed HTML chunks for the guest link, keeping only a small tail of the page in memory."""
+
+    LOGIN_MARKER = 'name="passwort"'
+
+    def __init__(self, pattern: str = GUEST_LINK_PATTERN, tail_size: int = 512, head_size: int = 300):
+        self.regex = re.compile(pattern)
+        self.tail_size = tail_size
+        self.head_size = head_size
+        self.head = ""
+        self.chars_seen = 0
+        self.login_page_seen = False
+        self._buffer = ""
+
+    def feed(self, chunk: str) -> Optional[str]:
+        """Add a chunk; returns the guest link once it is complete."""
+        self.chars_seen += len(chunk)
+        if len(self.head) < self.head_size:
+            self.head += chunk[:self.head_size - len(self.head)]
+
+        self._buffer += chunk
+        if self.LOGIN_MARKER in self._buffer:
+            self.login_page_seen = True
+
+        match = self.regex.search(self._buffer)
+        # The hash is only complete once a character that cannot belong to it follows
+        if match and match.end() < len(self._buffer):
+            return match.group(1)
+
+        if match:
+            self._buffer = self._buffer[match.start():]
+        else:
+            self._buffer = self._buffer[-self.tail_size:]
+        return None
+
+    def finish(self) -> Optional[str]:
+        """The page ended; returns a guest link right at its end, if any."""
+        match = self.regex.search(self._buffer)
+        return match.group(1) if match else None
+
+
+class AvsSessionExpired(Exception):
+    """The AVS portal answered with its login page instead of the requested form."""
+
+
+# One breaker and retry budget per process, shared by every client talking to the portal
+_circuit_breaker: Optional[CircuitBreaker] = None
+_retry_budget: Optional[RetryBudget] = None
+_resilience_lock = threading.Lock()
+
+
+def get_avs_circuit_breaker(config: dict = None) -> CircuitBreaker:
+    global _circuit_breaker
+    with _resilience_lock:
+        if _circuit_breaker is None:
+            config = config or get_kurkarten_config()
+            _circuit_breaker = CircuitBreaker(
+                "avs",
+                failure_threshold=config.get("breaker_failure_threshold", 3),
+                reset_timeout=config.get("breaker_reset_timeout", 120.0),
+            )
+        return _circuit_breaker
+
+
+def get_avs_retry_budget(config: dict = None) -> RetryBudget:
+    global _retry_budget
+    with _resilience_lock:
+        if _retry_budget is None:
+            config = config or get_kurkarten_config()
+            _retry_budget = RetryBudget(ratio=config.get("retry_budget_ratio", 0.2))
+        return _retry_budget
+
+
+class AvsPortal:
+    """Shared request details of the AVS Meldeschein portal for the sync and async clients."""
+
+    def __init__(self, config: dict = None, circuit_breaker: CircuitBreaker = None, retry_budget: RetryBudget = None):
+        self.config = config or get_kurkarten_config()
+
+        # Validate that all required config values are present
+        if not all([self.config.get("kennung"), self.config.get("passwort"), self.config.get("ort"), self.config.get("hotel")]):
+            raise ValueError("Missing required kurkarten configuration. Please set KURKARTEN_KENNUNG, KURKARTEN_PASSWORT, KURKARTEN_ORT, and KURKARTEN_HOTEL environment variables.")
+
+        base_url = self.config.get("base_url") or "https://meldeschein.avs.de"
+        self.login_url = f"{base_url}/amrum/login.do"
+        self.form_action_url = f"{base_url}/amrum/createGastlink.do"
+        self.session_max_age = self.config.get("session_max_age", 900)
+        self.logged_in_at: Optional[float] = None
+
+        # Configure timeouts: connect (5s), read (30s), write (10s) by default
+        self.timeout = httpx.Timeout(
+            connect=self.config.get("connect_timeout", 5.0),
+            read=self.config.get("read_timeout", 30.0),
+            write=10.0,
+            pool=5.0
+        )
+
+        self.max_retries = self.config.get("max_retries", 2)
+        self.circuit_breaker = circuit_breaker or get_avs_circuit_breaker(self.config)
+        self.retry_budget = retry_budget or get_avs_retry_budget(self.config)
+
+    def _login_data(self) -> dict:
+        return {
+            "event": "verifyLogin",
+            "target": "success",
+            "kennung": self.config["kennung"],
+            "passwort": self.config["passwort"],
+            "ort": self.config["ort"],
+            "hotel": self.config["hotel"],
+        }
+
+    def _form_data(self, guest_email: str) -> dict:
+        return {
+            "event": "Submit",
+            "value(GastEmail)": guest_email,
+            "value(ObjektBezeichnung)": "Brodersen-153031",
+            "value(ObjektId)": "412",
+            "value(hiddenFirmaName)": "Brodersen, Nils-153031",
+            "value(hiddenFirmaId)": "387",
+        }
+
+    def _session_is_fresh(self) -> bool:
+        return self.logged_in_at is not None and time.monotonic() - self.logged_in_at < self.session_max_age
+
+    def _is_transient(self, error: Exception) -> bool:
+        """Timeouts, connection errors and 5xx responses mean the portal itself is struggling."""
+        if isinstance(error, httpx.TransportError):
+            return True
+        if isinstance(error, httpx.HTTPStatusError):
+            return error.response.status_code >= 500
+        return False
+
+    def _retry_delay(self, error: Exception, attempt: int) -> Optional[float]:
+        """Record a failed attempt with the breaker and return the delay before retrying, or None to give up."""
+        if not self._is_transient(error):
+            # The portal answered, it just did not give us a link; retrying will not help
+            self.circuit_breaker.record_success()
+            return None
+
+        self.circuit_breaker.record_failure()
+        if self.circuit_breaker.state == CircuitBreaker.OPEN:
+            return None
+        if attempt >= self.max_retries or not self.retry_budget.try_spend():
+            return None
+
+        delay = backoff_delay(attempt)
+        logger.warning("Kurkarten: attempt %d failed (%s), retrying in %.1fs", attempt + 1, error, delay)
+        return delay
+
+    def _log_login_response(self, login_response: httpx.Response):
+        logger.info("Kurkarten: login response — status=%s, final_url=%s", login_response.status_code, login_response.url)
+
+    def _check_form_response(self, form_response: httpx.Response):
+        """Check the createGastlink response before its body is read."""
+        logger.info("Kurkarten: form response — status=%s, final_url=%s",
+                    form_response.status_code, form_response.url)
+        form_response.raise_for_status()
+
+        # An expired session is redirected to the login page
+        if form_response.url.path.endswith("/login.do"):
+            self.logged_in_at = None
+            raise AvsSessionExpired()
+
+    def _scan_result(self, scanner: GuestLinkScanner, kurkarten_url: Optional[str]) -> str:
+        """Turn the outcome of scanning the createGastlink response into the guest link."""
+        if kurkarten_url is None:
+            kurkarten_url = scanner.finish()
+
+        if kurkarten_url:
+            logger.info("Kurkarten: successfully extracted URL after %d chars: %s", scanner.chars_seen, kurkarten_url)
+            return kurkarten_url
+
+        if scanner.login_page_seen:
+            self.logged_in_at = None
+            raise AvsSessionExpired()
+
+        logger.error(
+            "Kurkarten: URL pattern not found in HTML response (%d chars).\n"
+            "Pattern: %s\n"
+            "HTML start:\n%s",
+            scanner.chars_seen,
+            GUEST_LINK_PATTERN,
+            scanner.head,
+        )
+        raise ValueError("URL pattern not found in HTML response")
+
+
+class AvsClient(AvsPortal):
+    """Authenticated session to the AVS Meldeschein portal, reused for many guest link requests."""
+
+    def __init__(self, config: dict = None, transport: Optional[httpx.BaseTransport] = None,
+                 circuit_breaker: CircuitBreaker = None, retry_budget: RetryBudget = None):
+        super().__init__(config, circuit_breaker, retry_budget)
+        # The client keeps the session cookie and pooled connections between requests
+        self.client = httpx.Client(timeout=self.timeout, follow_redirects=True, transport=transport)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.client.close()
+
+    def login(self):
+        """Authenticate and keep the session cookie for subsequent requests."""
+        logger.info("Kurkarten: POSTing login to %s (kennung=%s)", self.login_url, self.config["kennung"])
+        login_response = self.client.post(self.login_url, data=self._login_data())
+        self._log_login_response(login_response)
+        login_response.raise_for_status()
+        self.logged_in_at = time.monotonic()
+
+    def create_guest_link(self, guest_email: str) -> str:
+        """
+        Create a self check-in link for a guest, retrying transient failures.
+
+        Raises:
+            CircuitOpenError: If the portal failed repeatedly and is not being called right now
+        """
+        self.retry_budget.record_request()
+        attempt = 0
+        while True:
+            self.circuit_breaker.before_call()
+            try:
+                kurkarten_url = self._create_guest_link_once(guest_email)
+            except Exception as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+
+            self.circuit_breaker.record_success()
+            return kurkarten_url
+
+    def _create_guest_link_once(self, guest_email: str) -> str:
+        """Log in only when the session is missing or expired, then request the link."""
+        if not self._session_is_fresh():
+            self.login()
+
+        try:
+            return self._request_guest_link(guest_email)
+        except AvsSessionExpired:
+            logger.info("Kurkarten: session expired, logging in again")
+            self.login()
+            return self._request_guest_link(guest_email)
+
+    def _request_guest_link(self, guest_email: str) -> str:
+        logger.info("Kurkarten: POSTing createGastlink to %s (guest_email=%s)", self.form_action_url, guest_email)
+        # Stop scanning once the link has been seen, but drain the page so the pooled connection can be reused
+        with self.client.stream("POST", self.form_action_url, data=self._form_data(guest_email)) as form_response:
+            self._check_form_response(form_response)
+            scanner = GuestLinkScanner()
+            kurkarten_url = None
+            for chunk in form_response.iter_text():
+                if kurkarten_url is None:
+                    kurkarten_url = scanner.feed(chunk)
+        return self._scan_result(scanner, kurkarten_url)
+
+
+class AsyncAvsClient(AvsPortal):
+    """Async AVS portal session that creates guest links concurrently, up to a configured limit."""
+
+    def __init__(self, config: dict = None, transport: Optional[httpx.AsyncBaseTransport] = None,
+                 circuit_breaker: CircuitBreaker = None, retry_budget: RetryBudget = None):
+        super().__init__(config, circuit_breaker, retry_budget)
+        self.max_concurrency = self.config.get("max_concurrency", 4)
+        self.client = httpx.AsyncClient(timeout=self.timeout, follow_redirects=True, transport=transport)
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._login_lock = asyncio.Lock()
+        self._session_generation = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.aclose()
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    async def login(self):
+        """Authenticate and keep the session cookie for subsequent requests."""
+        logger.info("Kurkarten: POSTing login to %s (kennung=%s)", self.login_url, self.config["kennung"])
+        login_response = await self.client.post(self.login_url, data=self._login_data())
+        self._log_login_response(login_response)
+        login_response.raise_for_status()
+        self.logged_in_at = time.monotonic()
+        self._session_generation += 1
+
+    async def _ensure_session(self, expired_generation: Optional[int] = None):
+        """Log in unless the session is fresh or another request already renewed it."""
+        async with self._login_lock:
+            if expired_generation is not None and expired_generation != self._session_generation:
+                return
+            if expired_generation is None and self._session_is_fresh():
+                return
+            await self.login()
+
+    async def create_guest_link(self, guest_email: str) -> str:
+        """
+        Create a self check-in link for a guest; waits for a free slot first and retries transient failures.
+
+        Raises:
+            CircuitOpenError: If the portal failed repeatedly and is not being called right now
+        """
+        self.retry_budget.record_request()
+        attempt = 0
+        while True:
+            async with self._semaphore:
+                # Checked once a slot is free, so queued requests fail fast as soon as the circuit opens
+                self.circuit_breaker.before_call()
+                try:
+                    kurkarten_url = await self._create_guest_link_once(guest_email)
+                except Exception as e:
+                    delay = self._retry_delay(e, attempt)
+                    if delay is None:
+                        raise
+                else:
+                    self.circuit_breaker.record_success()
+                    return kurkarten_url
+
+            # Back off without holding a slot
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def _create_guest_link_once(self, guest_email: str) -> str:
+        await self._ensure_session()
+
+        generation = self._session_generation
+        try:
+            return await self._request_guest_link(guest_email)
+        except AvsSessionExpired:
+            logger.info("Kurkarten: session expired, logging in again")
+            await self._ensure_session(expired_generation=generation)
+            return await self._request_guest_link(guest_email)
+
+    async def _request_guest_link(self, guest_email: str) -> str:
+        logger.info("Kurkarten: POSTing createGastlink to %s (guest_email=%s)", self.form_action_url, guest_email)
+        # Stop scanning once the link has been seen, but drain the page so the pooled connection can be reused
+        async with self.client.stream("POST", self.form_action_url, data=self._form_data(guest_email)) as form_response:
+            self._check_form_response(form_response)
+            scanner = GuestLinkScanner()
+            kurkarten_url = None
+            async for chunk in form_response.aiter_text():
+                if kurkarten_url is None:
+                    kurkarten_url = scanner.feed(chunk)
+        return self._scan_result(scanner, kurkarten_url)
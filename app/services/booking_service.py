@@ -1,10 +1,12 @@
 import logging
 from datetime import datetime, date, timedelta
+from typing import List, Optional
 
 from app.booking_repository import BookingRepository
 
 logger = logging.getLogger(__name__)
 from app.guest_repository import GuestRepository
+from app.models import Booking
 from app.schemas import BookingCreate, BookingUpdate, BookingPartialUpdate
 from app.services.communication_service import CommunicationService
 from app.services.booking_status_service import BookingStatusService
@@ -115,13 +117,12 @@ class BookingService:
         
         # Attach invoice details: use persisted snapshot if invoice was generated,
         # otherwise calculate on-the-fly for preview purposes only.
-        from app.services.invoice_service import InvoiceService
+        from app.services.invoice_service import InvoiceService, invoice_data_from_snapshot
         from app.services.meter_service import MeterService
         from app.models import InvoiceSnapshot
 
         if booking.invoice_created and booking.invoice_snapshot:
-            invoice_service = InvoiceService(self.booking_repository.db, None, None)
-            booking.invoice_details = invoice_service._invoice_data_from_snapshot(booking.invoice_snapshot)
+            booking.invoice_details = invoice_data_from_snapshot(booking.invoice_snapshot)
         else:
             meter_service = MeterService(self.booking_repository.db)
             invoice_service = InvoiceService(self.booking_repository.db, None, meter_service)
@@ -181,6 +182,8 @@ class BookingService:
         booking.paid = False
         booking.kurkarten_email_sent = False
         booking.kurkarten_email_sent_date = None
+        booking.kurkarten_url = None
+        booking.kurkarten_url_fetched_at = None
         booking.pre_arrival_email_sent = False
         booking.pre_arrival_email_sent_date = None
         booking.kurtaxe_amount = None
@@ -258,22 +261,26 @@ class BookingService:
                 logger.warning("Failed to send cancellation email for booking %d: %s", booking_id, e)
         else:
             logger.warning("No guest found for booking %d (guest_id=%s) — cancellation email skipped", booking_id, booking.guest_id)
+        # The revocation row outlives the booking, so signed tokens stay invalid when the ID is reused
+        TokenService(self.booking_repository.db).revoke_token(booking_id)
         self.booking_repository.delete(booking)
 
-    def check_and_confirm_bookings(self, auto_confirm_delay_hours: int = 36) -> int:
-        """Check for bookings that need automatic confirmation."""
+    def check_and_confirm_bookings(self, auto_confirm_delay_hours: int = 36, bookings: Optional[List[Booking]] = None) -> int:
+        """Check for bookings that need automatic confirmation (or confirm the given candidates)."""
         from datetime import datetime, timedelta
         
-        # Calculate cutoff time
-        cutoff_time = datetime.utcnow() - timedelta(hours=auto_confirm_delay_hours)
-        
-        # Find bookings that haven't been confirmed and were last modified before cutoff
-        bookings_to_confirm = self.booking_repository.db.query(
-            self.booking_repository.model
-        ).filter(
-            self.booking_repository.model.confirmed == False,
-            self.booking_repository.model.modified_at <= cutoff_time
-        ).all()
+        bookings_to_confirm = bookings
+        if bookings_to_confirm is None:
+            # Calculate cutoff time
+            cutoff_time = datetime.utcnow() - timedelta(hours=auto_confirm_delay_hours)
+
+            # Find bookings that haven't been confirmed and were last modified before cutoff
+            bookings_to_confirm = self.booking_repository.db.query(
+                self.booking_repository.model
+            ).filter(
+                self.booking_repository.model.confirmed == False,
+                self.booking_repository.model.modified_at <= cutoff_time
+            ).all()
         
         confirmed_count = 0
         for booking in bookings_to_confirm:
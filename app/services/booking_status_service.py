@@ -1,5 +1,5 @@
 import datetime
-from typing import Optional
+from typing import List, Optional
 from sqlalchemy.orm import Session
 
 from app.models import Booking, BookingStatus
@@ -115,9 +115,10 @@ class BookingStatusService:
             self.db.commit()
         return booking.status
     
-    def update_all_booking_statuses(self) -> int:
-        """Update status for all bookings based on current state."""
-        bookings = self.db.query(Booking).all()
+    def update_all_booking_statuses(self, bookings: Optional[List[Booking]] = None) -> int:
+        """Update status for all bookings (or the given ones) based on current state."""
+        if bookings is None:
+            bookings = self.db.query(Booking).all()
         updated_count = 0
         
         for booking in bookings:
@@ -0,0 +1,181 @@
+import datetime
+import json
+import logging
+import smtplib
+from typing import List, Optional
+
+from sqlalchemy.orm import Session, joinedload
+
+from app.config.config import get_bulk_mail_config
+from app.models import Booking, BookingStatus, Job
+from app.services.communication_service import CommunicationService
+from app.services.email_backends import EmailBackend
+
+logger = logging.getLogger(__name__)
+
+
+class GuestMailing:
+    """Progress of a bulk mailing to a guest segment, read from the job that sends it."""
+
+    JOB_TYPE = "guest_mailing"
+
+    def __init__(self, job: Job):
+        payload = job.payload
+        progress = job.result or {}
+        self.id = job.id
+        self.template_name = payload["template_name"]
+        self.subject = payload["subject"]
+        self.message = payload.get("message")
+        self.booking_ids: List[int] = payload["booking_ids"]
+        self.total = len(self.booking_ids)
+        self.processed = progress.get("processed", 0)
+        # Job statuses, except that a finished mailing keeps reporting "completed" and one waiting for its
+        # next batch counts as running
+        if job.status == "succeeded":
+            self.status = "completed"
+        elif job.status == "queued" and self.processed:
+            self.status = "running"
+        else:
+            self.status = job.status
+        self.sent = progress.get("sent", 0)
+        self.failed = progress.get("failed", 0)
+        self.errors: List[str] = progress.get("errors", [])
+        if job.error:
+            self.errors.append(job.error)
+        self.created_at = job.created_at
+        self.started_at = job.started_at
+        self.finished_at = job.finished_at
+
+    def progress(self) -> dict:
+        return {"processed": self.processed, "sent": self.sent, "failed": self.failed, "errors": self.errors}
+
+
+def get_mailing(db: Session, mailing_id: str) -> Optional[GuestMailing]:
+    job = db.get(Job, mailing_id)
+    if job is None or job.job_type != GuestMailing.JOB_TYPE:
+        return None
+    return GuestMailing(job)
+
+
+class BulkMailService:
+    def __init__(self, db: Session, communication_service: CommunicationService, bulk_mail_config: dict = None):
+        self.db = db
+        self.communication_service = communication_service
+        config = bulk_mail_config or get_bulk_mail_config()
+        self.batch_size = config["batch_size"]
+        self.rate_per_minute = config["rate_per_minute"]
+
+    def get_segment_booking_ids(self, check_in_from: datetime.date, check_in_to: datetime.date,
+                                statuses: Optional[List[BookingStatus]] = None) -> List[int]:
+        """Get one booking per guest for all bookings checking in within the date range."""
+        query = self.db.query(Booking.id, Booking.guest_id).filter(
+            Booking.check_in >= check_in_from,
+            Booking.check_in <= check_in_to,
+        )
+        if statuses:
+            query = query.filter(Booking.status.in_(statuses))
+
+        booking_ids = []
+        seen_guest_ids = set()
+        for booking_id, guest_id in query.order_by(Booking.check_in).all():
+            if guest_id in seen_guest_ids:
+                continue
+            seen_guest_ids.add(guest_id)
+            booking_ids.append(booking_id)
+        return booking_ids
+
+    def queue_mailing(self, template_name: str, subject: str, message: Optional[str],
+                      check_in_from: datetime.date, check_in_to: datetime.date,
+                      statuses: Optional[List[BookingStatus]] = None) -> GuestMailing:
+        """Resolve the guest segment and queue a job that sends the mailing."""
+        if f"{template_name}.html" not in self.communication_service.template_env.list_templates():
+            raise ValueError(f"Template {template_name} not found")
+        if check_in_from > check_in_to:
+            raise ValueError("check_in_from must not be after check_in_to")
+
+        # Imported here because the job service registers the mailing handler from this module
+        from app.services.job_service import JobService
+
+        booking_ids = self.get_segment_booking_ids(check_in_from, check_in_to, statuses)
+        job = JobService(self.db).enqueue(GuestMailing.JOB_TYPE, {
+            "template_name": template_name,
+            "subject": subject,
+            "message": message,
+            "booking_ids": booking_ids,
+            "total": len(booking_ids),
+        })
+        mailing = GuestMailing(job)
+
+        logger.info("Queued guest mailing %s (%s) for %d guests", mailing.id, template_name, mailing.total)
+        return mailing
+
+    def batch_interval_seconds(self) -> float:
+        """Pause after a batch that keeps the mailing at the configured rate."""
+        return self.batch_size * 60.0 / self.rate_per_minute if self.rate_per_minute > 0 else 0
+
+    def send_next_batch(self, job: Job) -> GuestMailing:
+        """Render and send the next batch of a mailing over one connection and store the progress on the job.
+
+        The job runner queues the job again for the following batch after ``batch_interval_seconds``, so the
+        throttling does not hold up other jobs.
+        """
+        mailing = GuestMailing(job)
+        batch_ids = mailing.booking_ids[mailing.processed:mailing.processed + self.batch_size]
+        backend = self.communication_service.backend
+
+        if batch_ids:
+            with backend:
+                for booking_id, message in self._render_batch(mailing, batch_ids):
+                    try:
+                        self._send_message(backend, message)
+                        mailing.sent += 1
+                    except Exception as e:
+                        logger.error("Guest mailing %s: failed to send for booking %s: %s", mailing.id, booking_id, e)
+                        mailing.failed += 1
+                        mailing.errors.append(f"Booking {booking_id}: {e}")
+
+        mailing.processed += len(batch_ids)
+        job.result_json = json.dumps(mailing.progress())
+        self.db.commit()
+
+        logger.info("Guest mailing %s: %d of %d processed, %d sent, %d failed",
+                    mailing.id, mailing.processed, mailing.total, mailing.sent, mailing.failed)
+        return mailing
+
+    def _send_message(self, backend: EmailBackend, message) -> None:
+        try:
+            backend.send_messages([message])
+        except smtplib.SMTPServerDisconnected:
+            # The server dropped the connection between throttled sends; reconnect once for this message
+            logger.info("Guest mailing: SMTP connection lost, reconnecting")
+            backend.close()
+            backend.open()
+            backend.send_messages([message])
+
+    def _render_batch(self, mailing: GuestMailing, booking_ids: List[int]):
+        """Load one batch of bookings with their guests and render a message for each."""
+        bookings = self.db.query(Booking).options(joinedload(Booking.guest)).filter(
+            Booking.id.in_(booking_ids)
+        ).all()
+
+        positions = {booking_id: position for position, booking_id in enumerate(booking_ids)}
+
+        rendered = []
+        for booking in sorted(bookings, key=lambda b: positions[b.id]):
+            guest = booking.guest
+            context = {
+                "guest_name": f"{guest.first_name} {guest.last_name}",
+                "check_in_formatted": self.communication_service._format_german_date(booking.check_in),
+                "check_out_formatted": self.communication_service._format_german_date(booking.check_out),
+                "booking_id": booking.id,
+                "message": mailing.message or "",
+                "subject": mailing.subject,
+            }
+            message = self.communication_service.build_email(
+                guest.email, mailing.subject, mailing.template_name, context, copy_to_agent=False
+            )
+            rendered.append((booking.id, message))
+
+        # Bookings deleted since the mailing was queued are skipped
+        mailing.failed += len(booking_ids) - len(rendered)
+        return rendered
@@ -0,0 +1,105 @@
+import logging
+import random
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency while its circuit is open."""
+
+
+class CircuitBreaker:
+    """Stop calling a failing dependency for a while after repeated failures."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 60.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failure_count = 0
+        self.opened_at = None
+        self._trial_started_at = None
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go through right now."""
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    raise CircuitOpenError(f"Circuit {self.name} is open")
+                # Let a single trial call through to probe the dependency
+                self.state = self.HALF_OPEN
+                self._trial_started_at = None
+
+            if self.state == self.HALF_OPEN:
+                now = time.monotonic()
+                # A trial that never reported back (e.g. a cancelled task) does not block the circuit forever
+                if self._trial_started_at is not None and now - self._trial_started_at < self.reset_timeout:
+                    raise CircuitOpenError(f"Circuit {self.name} is half open, waiting for trial call")
+                self._trial_started_at = now
+
+    def record_success(self):
+        """The dependency answered; close the circuit."""
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info("Circuit %s closed again", self.name)
+            self.state = self.CLOSED
+            self.failure_count = 0
+            self._trial_started_at = None
+
+    def record_failure(self):
+        """The dependency failed; open the circuit once the threshold is reached."""
+        with self._lock:
+            self.failure_count += 1
+            self._trial_started_at = None
+            if self.state == self.HALF_OPEN or self.failure_count >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning("Circuit %s opened after %d failures", self.name, self.failure_count)
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class RetryBudget:
+    """Allow retries only up to a share of recent requests, so retries cannot multiply load during an outage."""
+
+    def __init__(self, ratio: float = 0.2, min_retries: int = 3, window: float = 60.0):
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.window = window
+        self._requests = deque()
+        self._retries = deque()
+        self._lock = threading.Lock()
+
+    def _prune(self, now: float):
+        for timestamps in (self._requests, self._retries):
+            while timestamps and now - timestamps[0] > self.window:
+                timestamps.popleft()
+
+    def record_request(self):
+        with self._lock:
+            now = time.monotonic()
+            self._prune(now)
+            self._requests.append(now)
+
+    def try_spend(self) -> bool:
+        """Take one retry from the budget; returns False if the budget is exhausted."""
+        with self._lock:
+            now = time.monotonic()
+            self._prune(now)
+            allowed = max(self.min_retries, int(len(self._requests) * self.ratio))
+            if len(self._retries) >= allowed:
+                return False
+            self._retries.append(now)
+            return True
+
+
+def backoff_delay(attempt: int, base: float = 0.5, cap: float = 8.0) -> float:
+    """Exponential backoff with full jitter for the given retry attempt (0-based)."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
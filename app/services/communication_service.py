@@ -1,21 +1,53 @@
+import functools
 import logging
 import os
-import smtplib
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
+from typing import Optional
 
-from jinja2 import Environment, FileSystemLoader
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
 
-from app.config.config import env
+from app.config.config import env, get_template_config
+from app.services.email_backends import EmailBackend, SMTPEmailBackend, get_email_backend
+from app.services.email_transport import AsyncSMTPTransport
 
 logger = logging.getLogger(__name__)
 
 
+@functools.lru_cache(maxsize=None)
+def get_template_env(templates_dir: Optional[str] = None) -> Environment:
+    """Return the process-wide Jinja environment for a templates directory."""
+    config = get_template_config()
+    templates_dir = templates_dir or config["templates_dir"]
+
+    os.makedirs(config["bytecode_cache_dir"], exist_ok=True)
+
+    return Environment(
+        loader=FileSystemLoader(templates_dir),
+        bytecode_cache=FileSystemBytecodeCache(config["bytecode_cache_dir"]),
+        auto_reload=config["auto_reload"],
+        cache_size=-1,  # keep every compiled template, there are only a handful
+    )
+
+
+def precompile_templates(templates_dir: Optional[str] = None) -> int:
+    """Load and compile all email templates into the shared environment."""
+    template_env = get_template_env(templates_dir)
+    template_names = template_env.list_templates(extensions=["html"])
+    for template_name in template_names:
+        template_env.get_template(template_name)
+
+    logger.info("Precompiled %d email templates", len(template_names))
+    return len(template_names)
+
+
 class CommunicationService:
-    def __init__(self, email_config, templates_dir="templates", base_url=None):
+    def __init__(self, email_config, templates_dir=None, base_url=None, backend: Optional[EmailBackend] = None):
         self.email_config = email_config
-        self.template_env = Environment(loader=FileSystemLoader(templates_dir))
+        self.backend = backend or get_email_backend(email_config)
+        self.template_env = get_template_env(templates_dir)
         self.base_url = base_url or os.getenv("FRONTEND_BASE_URL", "http://localhost:8080")
+        self._async_transport = None
 
     def generate_magic_link(self, token: str) -> str:
         """Generate a magic link for guest access"""
@@ -73,8 +105,8 @@ class CommunicationService:
             context=context,
         )
 
-    def send_email(self, recipient, subject, template_name, context):
-        """Send an email using a template."""
+    def build_email(self, recipient, subject, template_name, context, copy_to_agent: bool = True) -> MIMEMultipart:
+        """Render a template into a ready-to-send email message, copied to the agent unless told otherwise."""
         # Get the template
         template = self.template_env.get_template(f"{template_name}.html")
 
@@ -85,36 +117,46 @@ class CommunicationService:
         message = MIMEMultipart()
         message["From"] = self.email_config["sender"]
         message["To"] = recipient
-        message["Cc"] = "hausb@mailbox.org"
+        agent_cc = self.email_config.get("agent_cc")
+        if copy_to_agent and agent_cc:
+            message["Cc"] = agent_cc
         message["Subject"] = subject
 
         # Attach HTML content
         message.attach(MIMEText(html_content, "html"))
+        return message
 
-        # Check if real emails should be sent (defaults to False for safety)
-        # Set SEND_REAL_EMAILS=true in .env file to actually send emails
-        send_real_emails = os.getenv("SEND_REAL_EMAILS", "false").lower() == "true"
-        if not send_real_emails:
-            logger.info(
-                "DEV MODE - email not sent | from=%s to=%s subject=%s body=%s",
-                message["From"], message["To"], message["Subject"], html_content,
-            )
-            return True
-
-        # Send email
-        with smtplib.SMTP(
-            self.email_config["smtp_server"], self.email_config["smtp_port"]
-        ) as server:
-            server.starttls()
-            server.login(self.email_config["username"], self.email_config["password"])
-            refused = server.send_message(message)
-            if refused:
-                logger.warning("Some recipients were refused by SMTP server: %s", refused)
+    def send_email(self, recipient, subject, template_name, context):
+        """Send an email using a template."""
+        message = self.build_email(recipient, subject, template_name, context)
+        self.backend.send_messages([message])
 
         # Log the communication (could be expanded to database logging)
-        self._log_communication(recipient, template_name, "email", "sent")
+        self._log_communication(recipient, template_name, "email", self._delivery_status())
         return True
 
+    @property
+    def async_transport(self) -> AsyncSMTPTransport:
+        if self._async_transport is None:
+            self._async_transport = AsyncSMTPTransport(self.email_config)
+        return self._async_transport
+
+    async def send_email_async(self, recipient, subject, template_name, context):
+        """Send an email using a template without blocking the event loop."""
+        if not isinstance(self.backend, SMTPEmailBackend):
+            # Local backends do not wait on the network
+            return self.send_email(recipient, subject, template_name, context)
+
+        message = self.build_email(recipient, subject, template_name, context)
+        await self.async_transport.send_message(message)
+        self._log_communication(recipient, template_name, "email", self._delivery_status())
+        return True
+
+    def _delivery_status(self) -> str:
+        if isinstance(self.backend, SMTPEmailBackend):
+            return "sent"
+        return f"delivered to {self.backend.name} backend"
+
     def _log_communication(self, recipient, template_type, channel, status):
         """Log communication details."""
         logger.info("Communication sent: %s to %s via %s: %s", template_type, recipient, channel, status)
@@ -0,0 +1,103 @@
+import datetime
+import logging
+from typing import Iterator, List, Optional
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session, selectinload
+
+from app.models import Booking, BookingStatus
+from app.services.invoice_service import InvoiceService
+from app.services.kurkarten_service import KurkartenService
+
+logger = logging.getLogger(__name__)
+
+
+class DailyPlan:
+    """IDs of the bookings any daily job may act on, with the rules each job selects its bookings by.
+
+    Only IDs are kept so the plan stays small however many bookings match; the jobs load them in chunks.
+    The rules are applied to freshly loaded bookings, so they see the changes of the jobs that ran before
+    (e.g. bookings confirmed this morning are picked up by the kurkarten job).
+    """
+
+    def __init__(self, booking_ids: List[int], today: datetime.date, auto_confirm_delay_hours: int):
+        self.booking_ids = booking_ids
+        self.today = today
+        self.auto_confirm_delay_hours = auto_confirm_delay_hours
+
+    def needs_status_update(self, booking: Booking) -> bool:
+        return True
+
+    def needs_confirmation(self, booking: Booking) -> bool:
+        cutoff = datetime.datetime.utcnow() - datetime.timedelta(hours=self.auto_confirm_delay_hours)
+        return not booking.confirmed and booking.modified_at is not None and booking.modified_at <= cutoff
+
+    def needs_kurkarten_email(self, booking: Booking) -> bool:
+        target_date = self.today + datetime.timedelta(days=KurkartenService.get_kurkarten_delay_days())
+        return booking.confirmed and booking.check_in is not None and booking.check_in <= target_date and not booking.kurkarten_email_sent
+
+    def needs_pre_arrival_email(self, booking: Booking) -> bool:
+        target_date = self.today + datetime.timedelta(days=KurkartenService.get_pre_arrival_delay_days())
+        return booking.confirmed and booking.check_in is not None and booking.check_in <= target_date and not booking.pre_arrival_email_sent
+
+    def needs_invoice(self, booking: Booking) -> bool:
+        cutoff_date = self.today - datetime.timedelta(days=InvoiceService.get_invoice_delay_days())
+        return booking.confirmed and booking.check_out is not None and booking.check_out <= cutoff_date and not booking.invoice_created
+
+    def chunks(self, chunk_size: int, after_id: int = 0) -> Iterator[List[int]]:
+        """Booking IDs above ``after_id`` in ascending chunks of at most ``chunk_size``."""
+        remaining = [booking_id for booking_id in self.booking_ids if booking_id > after_id]
+        for start in range(0, len(remaining), chunk_size):
+            yield remaining[start:start + chunk_size]
+
+
+class DailyPlanningService:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def candidate_filter(self, today: datetime.date, auto_confirm_delay_hours: int):
+        """SQL filter matching every booking at least one daily job may act on."""
+        # Settled bookings always evaluate to DEPARTED_DONE again, so the status update can skip them
+        settled = and_(
+            Booking.status == BookingStatus.DEPARTED_DONE,
+            Booking.confirmed == True,
+            Booking.pre_arrival_email_sent == True,
+            Booking.paid == True,
+            Booking.check_out < today,
+        )
+        cutoff = datetime.datetime.utcnow() - datetime.timedelta(hours=auto_confirm_delay_hours)
+        kurkarten_date = today + datetime.timedelta(days=KurkartenService.get_kurkarten_delay_days())
+        pre_arrival_date = today + datetime.timedelta(days=KurkartenService.get_pre_arrival_delay_days())
+        invoice_date = today - datetime.timedelta(days=InvoiceService.get_invoice_delay_days())
+
+        return or_(
+            # IS NOT TRUE also keeps rows where a NULL column leaves the comparison undecided
+            settled.self_group().is_not(True),
+            and_(Booking.confirmed == False, Booking.modified_at <= cutoff),
+            and_(Booking.confirmed == True, Booking.check_in <= kurkarten_date, Booking.kurkarten_email_sent == False),
+            and_(Booking.confirmed == True, Booking.check_in <= pre_arrival_date, Booking.pre_arrival_email_sent == False),
+            and_(Booking.confirmed == True, Booking.check_out <= invoice_date, Booking.invoice_created == False),
+        )
+
+    def build_plan(self, today: Optional[datetime.date] = None, auto_confirm_delay_hours: int = 24) -> DailyPlan:
+        """Collect the IDs of all candidate bookings in one query."""
+        today = today or datetime.date.today()
+        booking_ids = [
+            booking_id for (booking_id,) in self.db.query(Booking.id).filter(
+                self.candidate_filter(today, auto_confirm_delay_hours)
+            ).order_by(Booking.id)
+        ]
+
+        logger.info("Daily plan: %d candidate bookings", len(booking_ids))
+        return DailyPlan(booking_ids, today, auto_confirm_delay_hours)
+
+    def load_bookings(self, booking_ids: List[int]) -> List[Booking]:
+        """Load bookings with everything the jobs read, in a fixed number of batched queries."""
+        if not booking_ids:
+            return []
+        return self.db.query(Booking).options(
+            selectinload(Booking.guest),
+            selectinload(Booking.tokens),
+            selectinload(Booking.meter_readings),
+            selectinload(Booking.invoice_snapshot),
+        ).filter(Booking.id.in_(booking_ids)).order_by(Booking.id).all()
@@ -0,0 +1,158 @@
+import logging
+import mailbox
+import os
+import smtplib
+import threading
+from abc import ABC, abstractmethod
+from email.message import Message
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class EmailBackend(ABC):
+    """Base class for email delivery backends."""
+
+    name = "base"
+
+    def open(self) -> bool:
+        """Open a delivery session. Returns True if a new session was opened."""
+        return False
+
+    def close(self) -> None:
+        """Close the delivery session if one is open."""
+
+    @abstractmethod
+    def send_messages(self, messages: List[Message]) -> int:
+        """Deliver messages and return how many were accepted."""
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class SMTPEmailBackend(EmailBackend):
+    """Deliver messages via SMTP, reusing one connection while the backend is open.
+
+    Not thread-safe: the open connection is shared state, so each thread needs its own backend.
+    """
+
+    name = "smtp"
+
+    def __init__(self, email_config: dict):
+        self.email_config = email_config
+        self.connection: Optional[smtplib.SMTP] = None
+
+    def open(self) -> bool:
+        if self.connection is not None:
+            return False
+
+        connection = smtplib.SMTP(self.email_config["smtp_server"], self.email_config["smtp_port"])
+        try:
+            if self.email_config.get("starttls", True):
+                connection.starttls()
+            if self.email_config.get("username"):
+                connection.login(self.email_config["username"], self.email_config["password"])
+        except Exception:
+            connection.close()
+            raise
+
+        self.connection = connection
+        return True
+
+    def close(self) -> None:
+        if self.connection is None:
+            return
+        try:
+            self.connection.quit()
+        except smtplib.SMTPException:
+            self.connection.close()
+        finally:
+            self.connection = None
+
+    def send_messages(self, messages: List[Message]) -> int:
+        new_connection = self.open()
+        try:
+            for message in messages:
+                refused = self.connection.send_message(message)
+                if refused:
+                    logger.warning("Some recipients were refused by SMTP server: %s", refused)
+        finally:
+            if new_connection:
+                self.close()
+        return len(messages)
+
+
+class FileEmailBackend(EmailBackend):
+    """Write messages to a local maildir or mbox instead of sending them."""
+
+    name = "file"
+
+    def __init__(self, path: str, file_format: str = "maildir"):
+        self.path = path
+        self.file_format = file_format
+        self._mailbox = None
+        # The mailbox file lock only guards against other processes, not other threads of this one
+        self._lock = threading.Lock()
+
+    def _get_mailbox(self) -> mailbox.Mailbox:
+        if self._mailbox is None:
+            if self.file_format == "mbox":
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                self._mailbox = mailbox.mbox(self.path)
+            else:
+                self._mailbox = mailbox.Maildir(self.path, create=True)
+        return self._mailbox
+
+    def send_messages(self, messages: List[Message]) -> int:
+        with self._lock:
+            target = self._get_mailbox()
+            target.lock()
+            try:
+                for message in messages:
+                    target.add(message)
+                target.flush()
+            finally:
+                target.unlock()
+        return len(messages)
+
+
+class InMemoryEmailBackend(EmailBackend):
+    """Keep messages in memory, mainly for tests."""
+
+    name = "memory"
+
+    def __init__(self):
+        self.outbox: List[Message] = []
+
+    def send_messages(self, messages: List[Message]) -> int:
+        self.outbox.extend(messages)
+        return len(messages)
+
+
+class NullEmailBackend(EmailBackend):
+    """Accept and drop all messages."""
+
+    name = "null"
+
+    def send_messages(self, messages: List[Message]) -> int:
+        return len(messages)
+
+
+def get_email_backend(email_config: dict) -> EmailBackend:
+    """Create the delivery backend selected in the email configuration."""
+    backend = email_config.get("backend", "smtp")
+
+    if backend == "smtp":
+        return SMTPEmailBackend(email_config)
+    if backend == "file":
+        return FileEmailBackend(email_config["file_path"], email_config.get("file_format", "maildir"))
+    if backend == "memory":
+        return InMemoryEmailBackend()
+    if backend == "null":
+        return NullEmailBackend()
+
+    raise ValueError(f"Unknown email backend: {backend}")
@@ -0,0 +1,57 @@
+import asyncio
+import logging
+from email.message import Message
+from typing import List, Optional
+
+import aiosmtplib
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncSMTPTransport:
+    """Deliver email messages over SMTP on the event loop with bounded concurrency."""
+
+    def __init__(self, email_config: dict, max_concurrency: Optional[int] = None, timeout: Optional[float] = None):
+        self.email_config = email_config
+        self.max_concurrency = max_concurrency or email_config.get("max_concurrency") or 5
+        self.timeout = timeout or email_config.get("send_timeout") or 30.0
+        self._semaphore = None
+        self._semaphore_loop = None
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        """Return the concurrency limiter for the currently running event loop."""
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphore_loop = loop
+        return self._semaphore
+
+    async def send_message(self, message: Message) -> None:
+        """Send a single message, waiting for a free slot first."""
+        async with self._get_semaphore():
+            await asyncio.wait_for(self._deliver(message), timeout=self.timeout)
+
+    async def send_messages(self, messages: List[Message]) -> List[Optional[BaseException]]:
+        """Send messages concurrently and return the error (or None) for each message."""
+        results = await asyncio.gather(
+            *(self.send_message(message) for message in messages),
+            return_exceptions=True,
+        )
+        for message, result in zip(messages, results):
+            if isinstance(result, BaseException):
+                logger.error("Failed to send email to %s: %s", message["To"], result)
+        return [result if isinstance(result, BaseException) else None for result in results]
+
+    async def _deliver(self, message: Message) -> None:
+        """Open an SMTP session and hand over one message."""
+        refused, _ = await aiosmtplib.send(
+            message,
+            hostname=self.email_config["smtp_server"],
+            port=int(self.email_config["smtp_port"]),
+            username=self.email_config.get("username"),
+            password=self.email_config.get("password"),
+            start_tls=self.email_config.get("starttls", True),
+            timeout=self.timeout,
+        )
+        if refused:
+            logger.warning("Some recipients were refused by SMTP server: %s", refused)
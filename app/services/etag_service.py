@@ -0,0 +1,84 @@
+import datetime
+import hashlib
+from typing import Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.models import Booking, Guest, InvoiceSnapshot, MeterReading, Payment, UnitPrice
+
+
+def make_etag(*parts) -> str:
+    """Strong ETag from the change stamps a response is built from."""
+    digest = hashlib.sha256(repr(parts).encode("utf-8")).hexdigest()[:32]
+    return f'"{digest}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header covers the ETag (weak comparison, as RFC 9110 asks for)."""
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in (candidate.removeprefix("W/") for candidate in candidates)
+
+
+class EtagService:
+    """Cheap version probes for the booking views: one statement reading change stamps only."""
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def _payment_stamps(self):
+        return (
+            select(func.count(Payment.id)).where(Payment.booking_id == Booking.id).scalar_subquery(),
+            select(func.max(Payment.modified_at)).where(Payment.booking_id == Booking.id).scalar_subquery(),
+        )
+
+    def _booking_stamps(self, booking_id: int, *extra_columns):
+        return self.db.execute(
+            select(
+                Booking.updated_at,
+                Guest.modified_at,
+                MeterReading.modified_at,
+                InvoiceSnapshot.modified_at,
+                *self._payment_stamps(),
+                *extra_columns,
+            )
+            .select_from(Booking)
+            .outerjoin(Guest, Guest.id == Booking.guest_id)
+            .outerjoin(MeterReading, MeterReading.booking_id == Booking.id)
+            .outerjoin(InvoiceSnapshot, InvoiceSnapshot.booking_id == Booking.id)
+            .where(Booking.id == booking_id)
+        ).first()
+
+    def guest_booking_etag(self, booking_id: int) -> Optional[str]:
+        """ETag of the guest portal view of a booking, None if the booking does not exist."""
+        stamps = self._booking_stamps(booking_id)
+        return make_etag("guest", booking_id, *stamps) if stamps else None
+
+    def booking_etag(self, booking_id: int) -> Optional[str]:
+        """ETag of the admin view of a booking, None if the booking does not exist.
+
+        The admin view previews invoices from the unit prices and derives the status from today's date,
+        so both go into the tag as well.
+        """
+        stamps = self._booking_stamps(
+            booking_id,
+            select(func.count(UnitPrice.id)).scalar_subquery(),
+            select(func.max(UnitPrice.modified_at)).scalar_subquery(),
+        )
+        return make_etag("booking", booking_id, datetime.date.today(), *stamps) if stamps else None
+
+    def bookings_etag(self) -> str:
+        """ETag of the admin booking list."""
+        stamps = self.db.execute(
+            select(
+                select(func.count(Booking.id)).scalar_subquery(),
+                select(func.max(Booking.updated_at)).scalar_subquery(),
+                select(func.count(MeterReading.id)).scalar_subquery(),
+                select(func.max(MeterReading.modified_at)).scalar_subquery(),
+                select(func.count(Payment.id)).scalar_subquery(),
+                select(func.max(Payment.modified_at)).scalar_subquery(),
+            )
+        ).one()
+        return make_etag("bookings", datetime.date.today(), *stamps)
@@ -10,15 +10,40 @@ from app.models import Booking, UnitPrice, MeterReading, PriceType, InvoiceSnaps
 from app.services.communication_service import CommunicationService
 from app.services.meter_service import MeterService
 from app.services.booking_status_service import BookingStatusService
+from app.services.reminder_service import ReminderCollector
+
+
+def invoice_data_from_snapshot(snapshot: InvoiceSnapshot) -> dict:
+    """Reconstruct the invoice_data dict from a persisted snapshot."""
+    return {
+        'num_days': snapshot.num_days,
+        'stay_rate': snapshot.stay_rate,
+        'accommodation_cost': snapshot.accommodation_cost,
+        'elec_rate': snapshot.elec_rate,
+        'electricity_cost': snapshot.electricity_cost,
+        'gas_rate': snapshot.gas_rate,
+        'gas_cost': snapshot.gas_cost,
+        'firewood_rate': snapshot.firewood_rate,
+        'firewood_cost': snapshot.firewood_cost,
+        'kurtaxe_cost': snapshot.kurtaxe_cost,
+        'total_cost': snapshot.total_cost,
+        'consumption': {
+            'electricity_kwh': snapshot.electricity_kwh,
+            'gas_kwh': snapshot.gas_kwh,
+            'gas_cubic_meters': snapshot.gas_cubic_meters,
+            'firewood_boxes': snapshot.firewood_boxes,
+        },
+    }
 
 
 class InvoiceService:
-    def __init__(self, db: Session, communication_service: CommunicationService, meter_service: MeterService, payment_config: dict = None):
+    def __init__(self, db: Session, communication_service: CommunicationService, meter_service: MeterService, payment_config: dict = None, reminder_collector: Optional[ReminderCollector] = None):
         self.db = db
         self.communication_service = communication_service
         self.meter_service = meter_service
         self.agent_email = "hausb@mailbox.org"
         self.payment_config = payment_config or {}
+        self.reminder_collector = reminder_collector
     
     @classmethod
     def get_invoice_delay_days(cls) -> int:
@@ -38,7 +63,7 @@ class InvoiceService:
     
     def generate_invoice_for_booking(self, booking_id: int) -> Optional[str]:
         """Generate invoice for a booking if all requirements are met."""
-        booking = self.db.query(Booking).filter(Booking.id == booking_id).first()
+        booking = self.db.get(Booking, booking_id)
         if not booking:
             return None
         
@@ -226,28 +251,6 @@ class InvoiceService:
         snapshot.total_cost = invoice_data.get('total_cost', 0)
         self.db.commit()
 
-    def _invoice_data_from_snapshot(self, snapshot: InvoiceSnapshot) -> dict:
-        """Reconstruct the invoice_data dict from a persisted snapshot."""
-        return {
-            'num_days': snapshot.num_days,
-            'stay_rate': snapshot.stay_rate,
-            'accommodation_cost': snapshot.accommodation_cost,
-            'elec_rate': snapshot.elec_rate,
-            'electricity_cost': snapshot.electricity_cost,
-            'gas_rate': snapshot.gas_rate,
-            'gas_cost': snapshot.gas_cost,
-            'firewood_rate': snapshot.firewood_rate,
-            'firewood_cost': snapshot.firewood_cost,
-            'kurtaxe_cost': snapshot.kurtaxe_cost,
-            'total_cost': snapshot.total_cost,
-            'consumption': {
-                'electricity_kwh': snapshot.electricity_kwh,
-                'gas_kwh': snapshot.gas_kwh,
-                'gas_cubic_meters': snapshot.gas_cubic_meters,
-                'firewood_boxes': snapshot.firewood_boxes,
-            },
-        }
-
     def _get_unit_price(self, price_type: PriceType, date: datetime.date) -> Optional[float]:
         """Get unit price for a specific type and date."""
         price = self.db.query(UnitPrice).filter(
@@ -341,16 +344,17 @@ class InvoiceService:
         
         # Use kurkarten service's agent reminder method
         from app.services.kurkarten_service import KurkartenService
-        kurkarten_service = KurkartenService(self.db, self.communication_service)
+        kurkarten_service = KurkartenService(self.db, self.communication_service, self.reminder_collector)
         kurkarten_service._send_agent_reminder(
             booking,
             "Missing meter readings - cannot generate invoice",
             missing_items
         )
     
-    def check_and_generate_invoices(self) -> int:
+    def check_and_generate_invoices(self, bookings: Optional[List[Booking]] = None) -> int:
         """Check for bookings that need invoices (3 days after departure)."""
-        bookings = self.get_pending_invoice_bookings(self.db)
+        if bookings is None:
+            bookings = self.get_pending_invoice_bookings(self.db)
         
         generated_count = 0
         for booking in bookings:
@@ -373,7 +377,7 @@ class InvoiceService:
         snapshot = self.db.query(InvoiceSnapshot).filter(InvoiceSnapshot.booking_id == booking_id).first()
         if not snapshot:
             raise ValueError("Invoice snapshot not found. Please regenerate the invoice.")
-        invoice_data = self._invoice_data_from_snapshot(snapshot)
+        invoice_data = invoice_data_from_snapshot(snapshot)
 
         # Send invoice email
         success = self._send_invoice_email_only(booking, booking.invoice_id, invoice_data)
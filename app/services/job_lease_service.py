@@ -0,0 +1,135 @@
+import datetime
+import logging
+import os
+import socket
+import uuid
+from typing import Optional
+
+from sqlalchemy import or_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.models import SchedulerLease
+
+logger = logging.getLogger(__name__)
+
+# Identifies this process as lease owner, unique across hosts and restarts
+PROCESS_OWNER = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+
+def owner_process_is_gone(owner: str) -> bool:
+    """Whether a lease owner is an earlier process on this host that is no longer running."""
+    try:
+        host, pid, _ = owner.rsplit("-", 2)
+        pid = int(pid)
+    except ValueError:
+        return False
+    if host != socket.gethostname() or owner == PROCESS_OWNER:
+        return False
+    if pid == os.getpid():
+        # Same PID with another suffix: this process replaced it, e.g. after a container restart
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        return False
+    return False
+
+
+class JobLeaseService:
+    """Per-job leases in the database, so a scheduled job runs once even with several app processes."""
+
+    def __init__(self, db: Session, owner: str = PROCESS_OWNER):
+        self.db = db
+        self.owner = owner
+
+    def _ensure_lease_row(self, job_name: str):
+        if self.db.get(SchedulerLease, job_name) is not None:
+            return
+        try:
+            self.db.add(SchedulerLease(job_name=job_name))
+            self.db.commit()
+        except IntegrityError:
+            # Another process created it at the same time
+            self.db.rollback()
+
+    def acquire(self, job_name: str, run_key: str, lease_seconds: int) -> bool:
+        """
+        Take the lease for one run of a job.
+
+        Returns False if another process holds an unexpired lease or the run with this key already completed.
+        """
+        self._ensure_lease_row(job_name)
+
+        now = datetime.datetime.utcnow()
+        # A single conditional UPDATE is atomic on both PostgreSQL and SQLite, so only one process can win
+        result = self.db.execute(
+            update(SchedulerLease)
+            .where(
+                SchedulerLease.job_name == job_name,
+                or_(SchedulerLease.locked_until == None, SchedulerLease.locked_until < now),
+                or_(SchedulerLease.last_completed_key == None, SchedulerLease.last_completed_key != run_key),
+            )
+            .values(owner=self.owner, locked_until=now + datetime.timedelta(seconds=lease_seconds), updated_at=now)
+            .execution_options(synchronize_session=False)
+        )
+        self.db.commit()
+        if result.rowcount == 1:
+            return True
+
+        # A crashed process on this host would otherwise block the job until its lease runs out
+        if self._free_lease_of_stopped_process(job_name):
+            return self.acquire(job_name, run_key, lease_seconds)
+        return False
+
+    def _free_lease_of_stopped_process(self, job_name: str) -> bool:
+        lease = self.db.get(SchedulerLease, job_name)
+        if lease is None:
+            return False
+        self.db.refresh(lease)
+        if lease.locked_until is None or lease.owner is None or not owner_process_is_gone(lease.owner):
+            return False
+
+        result = self.db.execute(
+            update(SchedulerLease)
+            .where(SchedulerLease.job_name == job_name, SchedulerLease.owner == lease.owner)
+            .values(locked_until=None, updated_at=datetime.datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        self.db.commit()
+        if result.rowcount == 1:
+            logger.warning("Freed the lease of %s held by stopped process %s", job_name, lease.owner)
+        return result.rowcount == 1
+
+    def is_completed(self, job_name: str, run_key: str) -> bool:
+        lease = self.db.get(SchedulerLease, job_name)
+        return lease is not None and lease.last_completed_key == run_key
+
+    def renew(self, job_name: str, lease_seconds: float) -> bool:
+        """Extend a lease this process holds; returns False if it was lost to another process."""
+        now = datetime.datetime.utcnow()
+        result = self.db.execute(
+            update(SchedulerLease)
+            .where(SchedulerLease.job_name == job_name, SchedulerLease.owner == self.owner,
+                   SchedulerLease.locked_until != None)
+            .values(locked_until=now + datetime.timedelta(seconds=lease_seconds), updated_at=now)
+            .execution_options(synchronize_session=False)
+        )
+        self.db.commit()
+        return result.rowcount == 1
+
+    def release(self, job_name: str, completed_key: Optional[str] = None) -> None:
+        """Free the lease, marking the run with ``completed_key`` as done; without it the run may be retried."""
+        values = {"locked_until": None, "updated_at": datetime.datetime.utcnow()}
+        if completed_key is not None:
+            values["last_completed_key"] = completed_key
+
+        self.db.execute(
+            update(SchedulerLease)
+            .where(SchedulerLease.job_name == job_name, SchedulerLease.owner == self.owner)
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        self.db.commit()
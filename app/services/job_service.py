@@ -0,0 +1,279 @@
+import asyncio
+import contextlib
+import datetime
+import json
+import logging
+import threading
+import uuid
+from typing import Any, Callable, Dict, Optional
+
+from sqlalchemy import or_, update
+from sqlalchemy.orm import Session
+
+from app.config.config import get_email_config, get_job_config, get_payment_config
+from app.database import SessionLocal
+from app.models import Booking, Job
+from app.services.bulk_mail_service import BulkMailService, GuestMailing
+from app.services.communication_service import CommunicationService
+from app.services.invoice_service import InvoiceService
+from app.services.job_lease_service import PROCESS_OWNER
+from app.services.kurkarten_service import KurkartenService
+from app.services.meter_service import MeterService
+
+logger = logging.getLogger(__name__)
+
+# Job type -> handler(db, job) returning a JSON-serializable result; a raised exception fails the job
+JOB_HANDLERS: Dict[str, Callable[[Session, Job], Any]] = {}
+
+
+class JobDeferred(Exception):
+    """Raised by a handler that finished part of its work; the job is queued again for ``run_after``."""
+
+    def __init__(self, run_after: datetime.datetime):
+        super().__init__(f"Deferred until {run_after}")
+        self.run_after = run_after
+
+
+def job_handler(job_type: str):
+    """Register a function as the handler of a job type."""
+    def register(handler: Callable[[Session, Job], Any]):
+        JOB_HANDLERS[job_type] = handler
+        return handler
+    return register
+
+
+class JobService:
+    """Queue of long-running actions in the database, run by any process with a job runner."""
+
+    def __init__(self, db: Session, owner: str = PROCESS_OWNER, job_config: Optional[dict] = None):
+        self.db = db
+        self.owner = owner
+        job_config = job_config or get_job_config()
+        self.timeout_seconds = job_config["timeout_seconds"]
+        self.max_attempts = job_config["max_attempts"]
+
+    def enqueue(self, job_type: str, payload: Optional[dict] = None) -> Job:
+        if job_type not in JOB_HANDLERS:
+            raise ValueError(f"Unknown job type: {job_type}")
+
+        job = Job(id=uuid.uuid4().hex, job_type=job_type, status="queued", payload_json=json.dumps(payload or {}))
+        self.db.add(job)
+        self.db.commit()
+        logger.info("Queued job %s (%s)", job.id, job_type)
+        return job
+
+    def enqueue_booking_job(self, job_type: str, booking_id: int) -> Job:
+        """Queue a job for one booking, failing right away if the booking does not exist."""
+        if self.db.get(Booking, booking_id) is None:
+            raise ValueError(f"Booking with ID {booking_id} not found")
+        return self.enqueue(job_type, {"booking_id": booking_id})
+
+    def get_job(self, job_id: str) -> Optional[Job]:
+        return self.db.get(Job, job_id)
+
+    def requeue_stale_jobs(self) -> int:
+        """Queue running jobs again whose runner stopped sending heartbeats, failing those out of attempts."""
+        now = datetime.datetime.utcnow()
+        stale = (Job.status == "running", Job.heartbeat_at < now - datetime.timedelta(seconds=self.timeout_seconds))
+
+        # Conditional UPDATEs, so a job another runner already took back is left alone
+        requeued = self.db.execute(
+            update(Job)
+            .where(*stale, Job.attempts < self.max_attempts)
+            .values(status="queued", owner=None)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        failed = self.db.execute(
+            update(Job)
+            .where(*stale, Job.attempts >= self.max_attempts)
+            .values(status="failed", error="Job runner stopped while running the job", finished_at=now)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        self.db.commit()
+
+        if requeued or failed:
+            logger.warning("Requeued %d and failed %d jobs of stopped job runners", requeued, failed)
+        return requeued + failed
+
+    def heartbeat(self, job_id: str) -> bool:
+        """Record that the runner of a job is still alive; returns False if the job was taken from it."""
+        result = self.db.execute(
+            update(Job)
+            .where(Job.id == job_id, Job.owner == self.owner, Job.status == "running")
+            .values(heartbeat_at=datetime.datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        self.db.commit()
+        return result.rowcount == 1
+
+    def claim_next(self) -> Optional[Job]:
+        """Take the oldest queued job, or None if there is none left."""
+        self.requeue_stale_jobs()
+        while True:
+            due = or_(Job.run_after == None, Job.run_after <= datetime.datetime.utcnow())
+            job_id = self.db.query(Job.id).filter(Job.status == "queued", due).order_by(Job.created_at).limit(1).scalar()
+            if job_id is None:
+                return None
+
+            # Conditional UPDATE, so a job is claimed by exactly one runner even with several processes
+            now = datetime.datetime.utcnow()
+            result = self.db.execute(
+                update(Job)
+                .where(Job.id == job_id, Job.status == "queued")
+                .values(status="running", owner=self.owner, started_at=now, heartbeat_at=now,
+                        attempts=Job.attempts + 1)
+                .execution_options(synchronize_session=False)
+            )
+            self.db.commit()
+            if result.rowcount == 1:
+                return self.db.get(Job, job_id)
+
+    def run_job(self, job: Job) -> Job:
+        """Run a claimed job with its handler and store the result or error."""
+        handler = JOB_HANDLERS.get(job.job_type)
+        try:
+            if handler is None:
+                raise ValueError(f"Unknown job type: {job.job_type}")
+            result = handler(self.db, job)
+        except JobDeferred as deferred:
+            # Back in the queue, so other jobs run in between; attempts only count runs that were cut short
+            job.status = "queued"
+            job.owner = None
+            job.attempts = 0
+            job.run_after = deferred.run_after
+            self.db.commit()
+            return job
+        except Exception as e:
+            logger.error("Job %s (%s) failed: %s", job.id, job.job_type, e, exc_info=True)
+            self.db.rollback()
+            job.status = "failed"
+            job.error = str(e) or e.__class__.__name__
+        else:
+            job.status = "succeeded"
+            job.result_json = json.dumps(result, default=str)
+
+        job.finished_at = datetime.datetime.utcnow()
+        self.db.commit()
+        return job
+
+
+class JobRunner:
+    """Polls the job queue and runs queued jobs one at a time, off the event loop.
+
+    One runner is enough and by default it only runs in the worker process (python -m app.worker).
+    """
+
+    def __init__(self, poll_seconds: Optional[float] = None, session_factory: Callable[[], Session] = SessionLocal):
+        self.poll_seconds = poll_seconds or get_job_config()["poll_seconds"]
+        self.session_factory = session_factory
+        self.running = False
+
+    def run_pending(self) -> int:
+        """Run queued jobs until the queue is empty; returns how many ran."""
+        count = 0
+        while True:
+            db = self.session_factory()
+            try:
+                job_service = JobService(db)
+                job = job_service.claim_next()
+                if job is None:
+                    return count
+                with self._heartbeat(job.id, job_service.timeout_seconds):
+                    job_service.run_job(job)
+                count += 1
+            finally:
+                db.close()
+
+    @contextlib.contextmanager
+    def _heartbeat(self, job_id: str, timeout_seconds: float):
+        """Send heartbeats in the background while a job runs, so other runners do not take it back."""
+        stopped = threading.Event()
+
+        def beat_until_stopped():
+            while not stopped.wait(timeout_seconds / 4):
+                db = self.session_factory()
+                try:
+                    if not JobService(db).heartbeat(job_id):
+                        logger.warning("Job %s was taken back from this runner while it was running", job_id)
+                except Exception as e:
+                    logger.warning("Failed to send heartbeat for job %s: %s", job_id, e)
+                finally:
+                    db.close()
+
+        heartbeat = threading.Thread(target=beat_until_stopped, name=f"job-{job_id[:8]}", daemon=True)
+        heartbeat.start()
+        try:
+            yield
+        finally:
+            stopped.set()
+            heartbeat.join()
+
+    async def start(self):
+        if self.running:
+            return
+
+        self.running = True
+        logger.info("Job runner started")
+        while self.running:
+            try:
+                await asyncio.to_thread(self.run_pending)
+            except Exception as e:
+                logger.error("Error in job runner: %s", e, exc_info=True)
+            await asyncio.sleep(self.poll_seconds)
+
+    def stop(self):
+        self.running = False
+        logger.info("Job runner stopped")
+
+
+def _kurkarten_service(db: Session) -> KurkartenService:
+    return KurkartenService(db, CommunicationService(get_email_config()))
+
+
+def _invoice_service(db: Session) -> InvoiceService:
+    return InvoiceService(db, CommunicationService(get_email_config()), MeterService(db), get_payment_config())
+
+
+@job_handler("kurkarten_email")
+def send_kurkarten_email_job(db: Session, job: Job) -> dict:
+    if not _kurkarten_service(db).send_kurkarten_request_email(job.payload["booking_id"]):
+        raise ValueError("Failed to send kurkarten email")
+    return {"message": "Kurkarten email sent successfully"}
+
+
+@job_handler("kurkarten_email_resend")
+def resend_kurkarten_email_job(db: Session, job: Job) -> dict:
+    if not _kurkarten_service(db).resend_kurkarten_request_email(job.payload["booking_id"]):
+        raise ValueError("Failed to resend kurkarten email")
+    return {"message": "Kurkarten email resent successfully"}
+
+
+@job_handler("invoice_generation")
+def generate_invoice_job(db: Session, job: Job) -> dict:
+    invoice_data = _invoice_service(db).generate_invoice_data(job.payload["booking_id"])
+    return {
+        "message": "Invoice generated successfully",
+        "invoice_id": invoice_data["invoice_id"],
+        "invoice_data": invoice_data,
+    }
+
+
+@job_handler("invoice_email")
+def send_invoice_email_job(db: Session, job: Job) -> dict:
+    if not _invoice_service(db).send_invoice_email(job.payload["booking_id"]):
+        raise ValueError("Failed to send invoice email")
+    return {"message": "Invoice email sent successfully"}
+
+
+@job_handler(GuestMailing.JOB_TYPE)
+def send_guest_mailing_job(db: Session, job: Job) -> dict:
+    bulk_mail_service = BulkMailService(db, CommunicationService(get_email_config()))
+    mailing = bulk_mail_service.send_next_batch(job)
+    if mailing.processed < mailing.total:
+        # The throttle wait happens in the queue instead of blocking the runner
+        raise JobDeferred(datetime.datetime.utcnow() + datetime.timedelta(seconds=bulk_mail_service.batch_interval_seconds()))
+    return mailing.progress()
+
+
+# Global job runner instance
+job_runner = JobRunner()
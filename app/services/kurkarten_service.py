@@ -1,47 +1,43 @@
+import asyncio
+import concurrent.futures
 import datetime
 import logging
-import re
 from typing import Optional, List
 from sqlalchemy.orm import Session
 import httpx
 
+from app.config.config import get_email_config, get_kurkarten_config
+from app.database import SessionLocal
 from app.models import Booking, Guest
+from app.services.avs_client import AsyncAvsClient, AvsClient
 from app.services.communication_service import CommunicationService
 from app.services.booking_status_service import BookingStatusService
-from app.config.config import get_kurkarten_config
+from app.services.circuit_breaker import CircuitOpenError
+from app.services.reminder_service import ReminderCollector
 
 logger = logging.getLogger(__name__)
 
 
-def extract_url_group_from_html(html: str, pattern: str) -> str:
-    """
-    Extract URL from HTML using a regex pattern.
+def _run_coroutine(coro):
+    """Run a coroutine to completion from sync code, also when called from an event loop thread."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
 
-    Args:
-        html: HTML string to search
-        pattern: Regex pattern with a capturing group for the URL
-
-    Returns:
-        The extracted URL string
-
-    Raises:
-        ValueError: If the URL pattern is not found in the HTML
-    """
-    match = re.search(pattern, html)
-    if not match:
-        raise ValueError(f"URL pattern not found in HTML response")
-
-    # Return the first capturing group (the URL)
-    if match.groups():
-        return match.group(1)
-    else:
-        raise ValueError("Regex pattern must contain a capturing group for the URL")
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coro).result()
 
 
 class KurkartenService:
-    def __init__(self, db: Session, communication_service: CommunicationService):
+    def __init__(self, db: Session, communication_service: CommunicationService, reminder_collector: Optional[ReminderCollector] = None):
         self.db = db
         self.communication_service = communication_service
+        self.reminder_collector = reminder_collector
+        self.avs_client: Optional[AvsClient] = None
+        kurkarten_config = get_kurkarten_config()
+        self.url_ttl_days = kurkarten_config["url_ttl_days"]
+        self.prefetch_lead_days = kurkarten_config["prefetch_lead_days"]
         self.status_service = BookingStatusService(db)
         self.dummy_kurkarten_url = "https://example.com/kurkarten-placeholder"
         self.agent_email = "hausb@mailbox.org"
@@ -62,6 +58,18 @@ class KurkartenService:
             Booking.kurkarten_email_sent == False
         ).all()
 
+    def get_prefetch_kurkarten_bookings(self) -> List[Booking]:
+        """Get bookings whose kurkarten email is coming up soon and that have no valid URL stored yet."""
+        horizon = datetime.date.today() + datetime.timedelta(days=self.get_kurkarten_delay_days() + self.prefetch_lead_days)
+        stale_before = datetime.datetime.utcnow() - datetime.timedelta(days=self.url_ttl_days)
+
+        return self.db.query(Booking).filter(
+            Booking.confirmed == True,
+            Booking.check_in <= horizon,
+            Booking.kurkarten_email_sent == False,
+            (Booking.kurkarten_url == None) | (Booking.kurkarten_url_fetched_at < stale_before)
+        ).all()
+
     @classmethod
     def get_pre_arrival_delay_days(cls) -> int:
         """Get the number of days before arrival to send pre-arrival emails."""
@@ -78,9 +86,9 @@ class KurkartenService:
             Booking.pre_arrival_email_sent == False
         ).all()
 
-    def send_kurkarten_request_email(self, booking_id: int) -> bool:
+    def send_kurkarten_request_email(self, booking_id: int, kurkarten_url: Optional[str] = None) -> bool:
         """Send kurkarten request email with real URL fetched from external service 25 days before arrival."""
-        booking = self.db.query(Booking).filter(Booking.id == booking_id).first()
+        booking = self.db.get(Booking, booking_id)
         if not booking:
             return False
 
@@ -88,28 +96,38 @@ class KurkartenService:
         if not guest:
             return False
 
-        # Fetch real kurkarten URL from external service
+        # Fetch real kurkarten URL from external service unless it was fetched already
+        if kurkarten_url is None:
+            try:
+                kurkarten_url = self.get_or_fetch_kurkarten_url(booking)
+            except Exception as e:
+                logger.error("Failed to fetch kurkarten URL for booking %s: %s", booking_id, e)
+                return False
+        elif kurkarten_url != booking.kurkarten_url:
+            self.store_kurkarten_url(booking, kurkarten_url)
+
         try:
-            kurkarten_url = self._fetch_kurkarten_url(guest.email)
+            self.communication_service.send_email(**self._kurkarten_email(booking, kurkarten_url))
+
+            # Update booking record and status
+            self.status_service.update_status_on_kurkarten_sent(booking)
+
+            return True
         except Exception as e:
-            logger.error("Failed to fetch kurkarten URL for booking %s: %s", booking_id, e)
+            logger.error("Failed to send kurkarten email for booking %s: %s", booking_id, e)
             return False
 
-        context = {
-            "guest_name": f"{guest.first_name} {guest.last_name}",
-            "check_in_date": booking.check_in.strftime("%B %d, %Y"),
-            "check_out_date": booking.check_out.strftime("%B %d, %Y"),
-            "kurkarten_url": kurkarten_url,
-            "subject": "Tourist Card Information Required"
-        }
+    async def send_kurkarten_request_email_async(self, booking_id: int, kurkarten_url: str) -> bool:
+        """Send the kurkarten email with an already fetched URL, waiting on SMTP without blocking the event loop."""
+        booking = self.db.get(Booking, booking_id)
+        if not booking or not booking.guest:
+            return False
+
+        if kurkarten_url != booking.kurkarten_url:
+            self.store_kurkarten_url(booking, kurkarten_url)
 
         try:
-            self.communication_service.send_email(
-                recipient=guest.email,
-                subject="Tourist Card Information Required",
-                template_name="kurkarten_request",
-                context=context
-            )
+            await self.communication_service.send_email_async(**self._kurkarten_email(booking, kurkarten_url))
 
             # Update booking record and status
             self.status_service.update_status_on_kurkarten_sent(booking)
@@ -119,9 +137,26 @@ class KurkartenService:
             logger.error("Failed to send kurkarten email for booking %s: %s", booking_id, e)
             return False
 
+    def _kurkarten_email(self, booking: Booking, kurkarten_url: str) -> dict:
+        """Build the send_email arguments of the kurkarten request email."""
+        guest = booking.guest
+        context = {
+            "guest_name": f"{guest.first_name} {guest.last_name}",
+            "check_in_date": booking.check_in.strftime("%B %d, %Y"),
+            "check_out_date": booking.check_out.strftime("%B %d, %Y"),
+            "kurkarten_url": kurkarten_url,
+            "subject": "Tourist Card Information Required"
+        }
+        return {
+            "recipient": guest.email,
+            "subject": "Tourist Card Information Required",
+            "template_name": "kurkarten_request",
+            "context": context,
+        }
+
     def send_pre_arrival_email(self, booking_id: int) -> bool:
         """Send pre-arrival info email 5 days before arrival."""
-        booking = self.db.query(Booking).filter(Booking.id == booking_id).first()
+        booking = self.db.get(Booking, booking_id)
         if not booking:
             return False
 
@@ -180,7 +215,11 @@ class KurkartenService:
             return False
 
     def _send_agent_reminder(self, booking: Booking, reason: str, missing_items: list = None):
-        """Send reminder email to booking agent."""
+        """Send reminder email to booking agent, or queue it for the digest during scheduler runs."""
+        if self.reminder_collector is not None:
+            self.reminder_collector.add(booking, reason, missing_items)
+            return
+
         guest = booking.guest
         context = {
             "guest_name": f"{guest.first_name} {guest.last_name}",
@@ -203,6 +242,52 @@ class KurkartenService:
         except Exception as e:
             logger.error("Failed to send agent reminder for booking %s: %s", booking.id, e)
 
+    def get_stored_kurkarten_url(self, booking: Booking) -> Optional[str]:
+        """Get the kurkarten URL stored on the booking, if it has not expired yet."""
+        if not booking.kurkarten_url or not booking.kurkarten_url_fetched_at:
+            return None
+
+        expires_at = booking.kurkarten_url_fetched_at + datetime.timedelta(days=self.url_ttl_days)
+        if datetime.datetime.utcnow() >= expires_at:
+            return None
+        return booking.kurkarten_url
+
+    def store_kurkarten_url(self, booking: Booking, kurkarten_url: str) -> None:
+        """Store a fetched URL on the booking right away, so a failed send does not cost another portal call."""
+        booking.kurkarten_url = kurkarten_url
+        booking.kurkarten_url_fetched_at = datetime.datetime.utcnow()
+        self.db.commit()
+
+    def get_or_fetch_kurkarten_url(self, booking: Booking) -> str:
+        """Get the stored kurkarten URL of a booking, fetching and storing a new one only if needed."""
+        kurkarten_url = self.get_stored_kurkarten_url(booking)
+        if kurkarten_url:
+            logger.info("Kurkarten: reusing stored URL for booking %s", booking.id)
+            return kurkarten_url
+
+        kurkarten_url = self._fetch_kurkarten_url(booking.guest.email)
+        self.store_kurkarten_url(booking, kurkarten_url)
+        return kurkarten_url
+
+    def resend_kurkarten_request_email(self, booking_id: int) -> bool:
+        """Send the kurkarten email again with the stored URL, leaving the status and sent date as they are."""
+        booking = self.db.get(Booking, booking_id)
+        if not booking or not booking.guest or not booking.kurkarten_email_sent:
+            return False
+
+        try:
+            kurkarten_url = self.get_or_fetch_kurkarten_url(booking)
+        except Exception as e:
+            logger.error("Failed to fetch kurkarten URL for booking %s: %s", booking_id, e)
+            return False
+
+        try:
+            self.communication_service.send_email(**self._kurkarten_email(booking, kurkarten_url))
+            return True
+        except Exception as e:
+            logger.error("Failed to resend kurkarten email for booking %s: %s", booking_id, e)
+            return False
+
     def _fetch_kurkarten_url(self, guest_email: str) -> str:
         """
         Fetch kurkarten URL from external AVS service.
@@ -216,101 +301,136 @@ class KurkartenService:
         Raises:
             Exception: If URL fetching fails (network error, authentication failure, etc.)
         """
-        config = get_kurkarten_config()
-
-        # Validate that all required config values are present
-        if not all([config.get("kennung"), config.get("passwort"), config.get("ort"), config.get("hotel")]):
-            raise ValueError("Missing required kurkarten configuration. Please set KURKARTEN_KENNUNG, KURKARTEN_PASSWORT, KURKARTEN_ORT, and KURKARTEN_HOTEL environment variables.")
-
-        base_url = "https://meldeschein.avs.de"
-        login_url = f"{base_url}/amrum/login.do"
-        form_action_url = f"{base_url}/amrum/createGastlink.do"
-
-        login_data = {
-            "event": "verifyLogin",
-            "target": "success",
-            "kennung": config["kennung"],
-            "passwort": config["passwort"],
-            "ort": config["ort"],
-            "hotel": config["hotel"],
-        }
-
-        form_data = {
-            "event": "Submit",
-            "value(GastEmail)": guest_email,
-            "value(ObjektBezeichnung)": "Brodersen-153031",
-            "value(ObjektId)": "412",
-            "value(hiddenFirmaName)": "Brodersen, Nils-153031",
-            "value(hiddenFirmaId)": "387",
-        }
+        # Reuse the run-wide AVS session if there is one, otherwise log in just for this guest
+        try:
+            avs_client = self.avs_client or AvsClient()
+        except ValueError as e:
+            raise self._avs_configuration_error(e)
 
-        # Configure timeouts: connect (5s), read (30s), write (10s)
-        timeout = httpx.Timeout(
-            connect=5.0,
-            read=30.0,
-            write=10.0,
-            pool=5.0
-        )
+        try:
+            return avs_client.create_guest_link(guest_email)
+        except Exception as e:
+            raise self._kurkarten_fetch_error(e)
+        finally:
+            if avs_client is not self.avs_client:
+                avs_client.close()
+
+    def _avs_configuration_error(self, error: ValueError) -> Exception:
+        """Report missing portal settings as a fetch error of each booking rather than failing the whole run."""
+        return Exception(f"Kurkarten portal is not configured: {error}")
+
+    def _kurkarten_fetch_error(self, error: Exception) -> Exception:
+        """Translate an AVS client error into the exception reported to callers."""
+        if isinstance(error, CircuitOpenError):
+            return Exception(f"AVS portal is failing, not calling it for now: {error}")
+        if isinstance(error, httpx.TimeoutException):
+            return Exception(f"Timeout while fetching kurkarten URL: {error}. The external service may be slow or unavailable.")
+        if isinstance(error, httpx.HTTPError):
+            logger.error("Kurkarten: HTTP error — %s", error)
+            return Exception(f"HTTP error while fetching kurkarten URL: {error}")
+        if isinstance(error, ValueError):
+            return Exception(f"Failed to extract kurkarten URL from response: {error}")
+        return Exception(f"Unexpected error while fetching kurkarten URL: {error}")
+
+    async def _fetch_guest_links(self, bookings: List[Booking]):
+        """Fetch guest links for all bookings concurrently over one AVS session, yielding each as soon as it arrives."""
+        targets = [(booking.id, booking.guest.email) for booking in bookings if booking.guest]
 
         try:
-            with httpx.Client(timeout=timeout, follow_redirects=True) as client:
-                # Step 1: authenticate
-                logger.info("Kurkarten: POSTing login to %s (kennung=%s)", login_url, config["kennung"])
-                login_response = client.post(login_url, data=login_data)
-                logger.info("Kurkarten: login response — status=%s, final_url=%s", login_response.status_code, login_response.url)
-                login_response.raise_for_status()
-
-                # Step 2: create guest link
-                logger.info("Kurkarten: POSTing createGastlink to %s (guest_email=%s)", form_action_url, guest_email)
-                form_response = client.post(form_action_url, data=form_data)
-                logger.info("Kurkarten: form response — status=%s, final_url=%s, content_length=%s",
-                            form_response.status_code, form_response.url, len(form_response.text))
-                form_response.raise_for_status()
-
-                # Step 3: extract URL from HTML
-                html_string = form_response.text
-                match_string = r"(https://selfcheck-in-meldeschein\.avs\.de/\?hash=[a-f0-9]+)"
-                logger.info("Kurkarten: searching for URL pattern in HTML (%d chars)", len(html_string))
+            avs_client = AsyncAvsClient()
+        except ValueError as e:
+            error = self._avs_configuration_error(e)
+            for booking_id, _ in targets:
+                yield booking_id, None, error
+            return
 
+        async with avs_client:
+            async def fetch(booking_id: int, guest_email: str):
                 try:
-                    kurkarten_url = extract_url_group_from_html(html_string, match_string)
-                except ValueError:
-                    logger.error(
-                        "Kurkarten: URL pattern not found in HTML response.\n"
-                        "Pattern: %s\n"
-                        "HTML snippet (first 2000 chars):\n%s",
-                        match_string,
-                        html_string[:2000],
-                    )
-                    raise
-
-                logger.info("Kurkarten: successfully extracted URL: %s", kurkarten_url)
-                return kurkarten_url
-
-        except httpx.TimeoutException as e:
-            raise Exception(f"Timeout while fetching kurkarten URL: {e}. The external service may be slow or unavailable.")
-        except httpx.HTTPError as e:
-            logger.error("Kurkarten: HTTP error — %s", e)
-            raise Exception(f"HTTP error while fetching kurkarten URL: {e}")
-        except ValueError as e:
-            raise Exception(f"Failed to extract kurkarten URL from response: {e}")
+                    return booking_id, await avs_client.create_guest_link(guest_email), None
+                except Exception as e:
+                    return booking_id, None, self._kurkarten_fetch_error(e)
+
+            tasks = [asyncio.create_task(fetch(booking_id, guest_email)) for booking_id, guest_email in targets]
+            for next_result in asyncio.as_completed(tasks):
+                yield await next_result
+
+    async def _fetch_and_send_kurkarten_emails(self, bookings: List[Booking]) -> int:
+        """Fetch guest links for all bookings concurrently and send each email as soon as its link arrives."""
+        sent_count = 0
+        async for booking_id, kurkarten_url, error in self._fetch_guest_links(bookings):
+            if error:
+                logger.error("Failed to fetch kurkarten URL for booking %s: %s", booking_id, error)
+                continue
+
+            # The session belongs to this thread, so sending stays on this loop; pending fetches go on while SMTP answers
+            if await self.send_kurkarten_request_email_async(booking_id, kurkarten_url):
+                sent_count += 1
+
+        return sent_count
+
+    async def _prefetch_guest_links(self, bookings: List[Booking]) -> int:
+        stored_count = 0
+        async for booking_id, kurkarten_url, error in self._fetch_guest_links(bookings):
+            if error:
+                logger.warning("Failed to prefetch kurkarten URL for booking %s: %s", booking_id, error)
+                continue
+
+            self.store_kurkarten_url(self.db.get(Booking, booking_id), kurkarten_url)
+            stored_count += 1
+
+        return stored_count
+
+    def prefetch_kurkarten_urls(self) -> int:
+        """Fetch and store guest links for upcoming bookings ahead of the kurkarten email run."""
+        bookings = self.get_prefetch_kurkarten_bookings()
+        if not bookings:
+            return 0
+        return _run_coroutine(self._prefetch_guest_links(bookings))
+
+    def prefetch_kurkarten_url(self, booking_id: int) -> bool:
+        """Fetch and store the guest link of one booking if its kurkarten email is coming up soon."""
+        booking = self.db.get(Booking, booking_id)
+        if not booking or not booking.guest or not booking.confirmed or booking.kurkarten_email_sent:
+            return False
+
+        # Links fetched too early could expire before the guest arrives; the off-peak run picks these up later
+        horizon = datetime.date.today() + datetime.timedelta(days=self.get_kurkarten_delay_days() + self.prefetch_lead_days)
+        if booking.check_in > horizon:
+            return False
+
+        try:
+            self.get_or_fetch_kurkarten_url(booking)
+            return True
         except Exception as e:
-            raise Exception(f"Unexpected error while fetching kurkarten URL: {e}")
+            logger.warning("Failed to prefetch kurkarten URL for booking %s: %s", booking_id, e)
+            return False
 
-    def check_and_send_kurkarten_emails(self) -> int:
+    def check_and_send_kurkarten_emails(self, bookings: Optional[List[Booking]] = None) -> int:
         """Check for bookings that need kurkarten emails (25 days before arrival)."""
-        bookings = self.get_pending_kurkarten_bookings(self.db)
+        if bookings is None:
+            bookings = self.get_pending_kurkarten_bookings(self.db)
 
+        # Bookings with a stored URL are sent without calling the portal
         sent_count = 0
+        to_fetch = []
         for booking in bookings:
-            if self.send_kurkarten_request_email(booking.id):
-                sent_count += 1
+            if self.get_stored_kurkarten_url(booking):
+                if self.send_kurkarten_request_email(booking.id):
+                    sent_count += 1
+            else:
+                to_fetch.append(booking)
 
-        return sent_count
+        if not to_fetch:
+            return sent_count
+
+        # One AVS login for the whole run, guest links are fetched concurrently
+        return sent_count + _run_coroutine(self._fetch_and_send_kurkarten_emails(to_fetch))
 
-    def check_and_send_pre_arrival_emails(self) -> int:
+    def check_and_send_pre_arrival_emails(self, bookings: Optional[List[Booking]] = None) -> int:
         """Check for bookings that need pre-arrival emails (5 days before arrival)."""
-        bookings = self.get_pending_pre_arrival_bookings(self.db)
+        if bookings is None:
+            bookings = self.get_pending_pre_arrival_bookings(self.db)
 
         sent_count = 0
         for booking in bookings:
@@ -318,3 +438,13 @@ class KurkartenService:
                 sent_count += 1
 
         return sent_count
+
+
+def prefetch_kurkarten_url_in_background(booking_id: int) -> None:
+    """Prefetch the guest link of a booking with its own database session (for background tasks)."""
+    db = SessionLocal()
+    try:
+        communication_service = CommunicationService(get_email_config())
+        KurkartenService(db, communication_service).prefetch_kurkarten_url(booking_id)
+    finally:
+        db.close()
@@ -0,0 +1,61 @@
+import logging
+import threading
+from typing import List
+
+from app.models import Booking
+from app.services.communication_service import CommunicationService
+
+logger = logging.getLogger(__name__)
+
+
+class ReminderCollector:
+    """Collect agent reminders during a scheduler run and send them as one digest email."""
+
+    def __init__(self, communication_service: CommunicationService, agent_email: str = "hausb@mailbox.org"):
+        self.communication_service = communication_service
+        self.agent_email = agent_email
+        self.reminders: List[dict] = []
+        self._lock = threading.Lock()
+
+    def add(self, booking: Booking, reason: str, missing_items: list = None):
+        """Queue a reminder for a booking."""
+        guest = booking.guest
+        reminder = {
+            "guest_name": f"{guest.first_name} {guest.last_name}",
+            "guest_email": guest.email,
+            "check_in_date": booking.check_in.strftime("%B %d, %Y"),
+            "check_out_date": booking.check_out.strftime("%B %d, %Y"),
+            "booking_id": booking.id,
+            "reminder_reason": reason,
+            "missing_items": missing_items or [],
+        }
+        with self._lock:
+            self.reminders.append(reminder)
+
+    def flush(self) -> int:
+        """Send all queued reminders as a single digest email and return how many it contained."""
+        with self._lock:
+            reminders, self.reminders = self.reminders, []
+
+        if not reminders:
+            return 0
+
+        subject = f"Action Required - {len(reminders)} booking(s)"
+        context = {
+            "reminders": reminders,
+            "subject": subject,
+        }
+
+        try:
+            self.communication_service.send_email(
+                recipient=self.agent_email,
+                subject=subject,
+                template_name="agent_reminder_digest",
+                context=context
+            )
+        except Exception as e:
+            logger.error("Failed to send agent reminder digest (%d reminders): %s", len(reminders), e)
+            return 0
+
+        logger.info("Sent agent reminder digest with %d reminders", len(reminders))
+        return len(reminders)
@@ -0,0 +1,108 @@
+import datetime
+import logging
+import math
+from typing import List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.models import SchedulerCheckpoint, SchedulerRun
+
+logger = logging.getLogger(__name__)
+
+
+def _percentile(sorted_values: List[float], percentile: float) -> Optional[float]:
+    """Nearest-rank percentile of already sorted values."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(percentile / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class SchedulerRunService:
+    """History of scheduled job runs with their duration, item counts and errors."""
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def start_run(self, job_name: str, run_key: str, owner: Optional[str] = None) -> SchedulerRun:
+        run = SchedulerRun(job_name=job_name, run_key=run_key, owner=owner, status="running",
+                           started_at=datetime.datetime.utcnow())
+        self.db.add(run)
+        self.db.commit()
+        return run
+
+    def fail_abandoned_runs(self, job_name: str, owner: str) -> int:
+        """Mark runs of a job left running by other processes as failed; call only while holding its lease."""
+        runs = self.db.query(SchedulerRun).filter(
+            SchedulerRun.job_name == job_name,
+            SchedulerRun.status == "running",
+            SchedulerRun.owner != owner,
+        ).all()
+        for run in runs:
+            run.status = "failed"
+            run.finished_at = datetime.datetime.utcnow()
+            run.error = f"Process {run.owner} stopped before the run finished"
+        if runs:
+            self.db.commit()
+        return len(runs)
+
+    def finish_run(self, run: SchedulerRun, items_processed: Optional[int] = None, error: Optional[str] = None) -> SchedulerRun:
+        run.finished_at = datetime.datetime.utcnow()
+        run.duration_seconds = (run.finished_at - run.started_at).total_seconds()
+        run.items_processed = items_processed
+        run.error = error
+        run.status = "failed" if error else "succeeded"
+        self.db.commit()
+        return run
+
+    def get_runs(self, job_name: Optional[str] = None, limit: int = 50) -> List[SchedulerRun]:
+        query = self.db.query(SchedulerRun)
+        if job_name:
+            query = query.filter(SchedulerRun.job_name == job_name)
+        return query.order_by(SchedulerRun.started_at.desc(), SchedulerRun.id.desc()).limit(limit).all()
+
+    def get_stats(self, days: int = 30) -> List[dict]:
+        """Per-job run counts and duration percentiles over the last days."""
+        since = datetime.datetime.utcnow() - datetime.timedelta(days=days)
+        runs = self.db.query(SchedulerRun).filter(SchedulerRun.started_at >= since).order_by(SchedulerRun.started_at).all()
+
+        runs_by_job = {}
+        for run in runs:
+            runs_by_job.setdefault(run.job_name, []).append(run)
+
+        stats = []
+        for job_name, job_runs in sorted(runs_by_job.items()):
+            durations = sorted(run.duration_seconds for run in job_runs if run.duration_seconds is not None)
+            last_run = job_runs[-1]
+            stats.append({
+                "job_name": job_name,
+                "runs": len(job_runs),
+                "failed": sum(1 for run in job_runs if run.status == "failed"),
+                "items_processed": sum(run.items_processed or 0 for run in job_runs),
+                "avg_duration_seconds": sum(durations) / len(durations) if durations else None,
+                "p95_duration_seconds": _percentile(durations, 95),
+                "max_duration_seconds": durations[-1] if durations else None,
+                "last_started_at": last_run.started_at,
+                "last_status": last_run.status,
+            })
+        return stats
+
+    def get_checkpoint(self, job_name: str, run_key: str) -> int:
+        """Highest booking ID the run already processed, or 0 if it has not started."""
+        checkpoint = self.db.get(SchedulerCheckpoint, (job_name, run_key))
+        return checkpoint.last_booking_id if checkpoint else 0
+
+    def save_checkpoint(self, job_name: str, run_key: str, last_booking_id: int) -> None:
+        checkpoint = self.db.get(SchedulerCheckpoint, (job_name, run_key))
+        if checkpoint is None:
+            # Checkpoints of earlier runs are no longer needed once a new run makes progress
+            self.db.query(SchedulerCheckpoint).filter(
+                SchedulerCheckpoint.job_name == job_name,
+                SchedulerCheckpoint.run_key != run_key,
+            ).delete(synchronize_session=False)
+            checkpoint = SchedulerCheckpoint(job_name=job_name, run_key=run_key)
+            self.db.add(checkpoint)
+
+        checkpoint.last_booking_id = last_booking_id
+        checkpoint.updated_at = datetime.datetime.utcnow()
+        self.db.commit()
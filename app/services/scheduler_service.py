@@ -1,66 +1,160 @@
 import asyncio
+import contextlib
+import functools
 import logging
 import schedule
+import threading
 import time
-from datetime import datetime
-from typing import Optional
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from datetime import date, datetime
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
 from sqlalchemy.orm import Session
 
 logger = logging.getLogger(__name__)
 
+from app.booking_repository import BookingRepository
 from app.database import SessionLocal
-from app.config.config import get_email_config
+from app.models import Booking
+from app.guest_repository import GuestRepository
+from app.config.config import get_email_config, get_kurkarten_config, get_scheduler_config, get_token_config
+from app.services.booking_service import BookingService
 from app.services.communication_service import CommunicationService
+from app.services.daily_planning_service import DailyPlan, DailyPlanningService
 from app.services.kurkarten_service import KurkartenService
 from app.services.meter_service import MeterService
 from app.services.invoice_service import InvoiceService
+from app.services.job_lease_service import PROCESS_OWNER, JobLeaseService
+from app.services.scheduler_run_service import SchedulerRunService
 from app.services.booking_status_service import BookingStatusService
+from app.services.reminder_service import ReminderCollector
+from app.services.token_service import TokenService
 
 
 class SchedulerService:
-    def __init__(self):
+    def __init__(self, workers: Optional[int] = None):
         self.running = False
-    
-    def get_db_session(self) -> Session:
-        """Get a database session for scheduled tasks."""
-        return SessionLocal()
-    
-    def run_booking_status_update(self):
-        """Run booking status update for all bookings."""
-        logger.info("Running booking status update...")
+        scheduler_config = get_scheduler_config()
+        self.workers = workers or scheduler_config["workers"]
+        self.lease_seconds = scheduler_config["lease_seconds"]
+        self.catch_up = scheduler_config["catch_up"]
+        self.retry_minutes = scheduler_config["retry_minutes"]
+        self.pipeline_time = scheduler_config["pipeline_time"]
+        self.chunk_size = scheduler_config["chunk_size"]
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self._running_jobs: Dict[str, Future] = {}
+        self._jobs_lock = threading.Lock()
+
+    def submit_job(self, job: Callable) -> Optional[Future]:
+        """Hand a job to the worker pool; skipped while the previous run of the same job is still going."""
+        name = job.__name__
+        with self._jobs_lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="scheduler")
+
+            previous = self._running_jobs.get(name)
+            if previous is not None and not previous.done():
+                logger.warning("Skipping %s, the previous run is still in progress", name)
+                return None
+
+            future = self.executor.submit(self.run_exclusive, job)
+            self._running_jobs[name] = future
+            return future
+
+    def run_exclusive(self, job: Callable):
+        """Run today's run of a job unless another process already ran it or is running it, and record it."""
+        name = job.__name__
+        run_key = date.today().isoformat()
 
         db = self.get_db_session()
         try:
-            status_service = BookingStatusService(db)
-            updated_count = status_service.update_all_booking_statuses()
-            logger.info("Updated %d booking statuses", updated_count)
-
-        except Exception as e:
-            logger.error("Error in booking status update: %s", e, exc_info=True)
+            lease_service = JobLeaseService(db)
+            if not lease_service.acquire(name, run_key, self.lease_seconds):
+                logger.info("Skipping %s for %s, it ran or is running in another process", name, run_key)
+                return None
+
+            run_service = SchedulerRunService(db)
+            run_service.fail_abandoned_runs(name, lease_service.owner)
+            run = run_service.start_run(name, run_key, lease_service.owner)
+            completed_key = None
+            try:
+                with self._lease_heartbeat(name, lease_service.owner):
+                    items_processed = job()
+            except Exception as e:
+                run_service.finish_run(run, error=str(e) or e.__class__.__name__)
+                return None
+            else:
+                run_service.finish_run(run, items_processed=items_processed)
+                completed_key = run_key
+                return items_processed
+            finally:
+                # A failed run frees the lease without completing, so it can be retried today
+                lease_service.release(name, completed_key)
         finally:
             db.close()
 
-    def run_kurkarten_emails(self):
-        """Run kurkarten email check (25 days before arrival)."""
-        logger.info("Running kurkarten email check...")
-
+    @contextlib.contextmanager
+    def _lease_heartbeat(self, job_name: str, owner: str):
+        """Renew the lease in the background while the job runs, so runs longer than the lease keep it."""
+        stopped = threading.Event()
+
+        def renew_until_stopped():
+            while not stopped.wait(self.lease_seconds / 3):
+                db = self.get_db_session()
+                try:
+                    if not JobLeaseService(db, owner).renew(job_name, self.lease_seconds):
+                        logger.warning("Lease of %s was lost while the job was running", job_name)
+                except Exception as e:
+                    logger.warning("Failed to renew the lease of %s: %s", job_name, e)
+                finally:
+                    db.close()
+
+        heartbeat = threading.Thread(target=renew_until_stopped, name=f"lease-{job_name}", daemon=True)
+        heartbeat.start()
+        try:
+            yield
+        finally:
+            stopped.set()
+            heartbeat.join()
+
+    def submit_catch_up(self) -> Future:
+        """Look for missed runs in the worker pool, so the lease queries stay off the event loop."""
+        with self._jobs_lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="scheduler")
+            return self.executor.submit(self.catch_up_missed_runs)
+
+    def catch_up_missed_runs(self) -> List[Future]:
+        """
+        Run today's jobs whose time already passed and that have not completed yet.
+
+        This covers jobs missed while the process was restarting, runs that failed, and runs of a process that
+        crashed: its lease is taken over right away if it ran on this host, otherwise once it expires because
+        its heartbeat stopped renewing it.
+        """
+        now = datetime.now().strftime("%H:%M")
+        run_key = date.today().isoformat()
         db = self.get_db_session()
         try:
-            email_config = get_email_config()
-            communication_service = CommunicationService(email_config)
-            kurkarten_service = KurkartenService(db, communication_service)
-
-            count = kurkarten_service.check_and_send_kurkarten_emails()
-            logger.info("Sent %d kurkarten emails", count)
-
-        except Exception as e:
-            logger.error("Error in kurkarten email check: %s", e, exc_info=True)
+            lease_service = JobLeaseService(db)
+            missed_jobs = [job for at, job in self.daily_jobs()
+                           if at <= now and not lease_service.is_completed(job.__name__, run_key)]
         finally:
             db.close()
 
-    def run_pre_arrival_emails(self):
-        """Run pre-arrival email check (5 days before arrival)."""
-        logger.info("Running pre-arrival email check...")
+        if missed_jobs:
+            logger.info("Catching up on %d scheduled jobs due earlier today", len(missed_jobs))
+        # Each job is submitted on its own, the latest due first: the early jobs only prepare work that the
+        # later ones also do themselves, so the daily pipeline does not wait behind the link prefetch
+        futures = [self.submit_job(job) for job in reversed(missed_jobs)]
+        return [future for future in futures if future is not None]
+
+    def get_db_session(self, **options) -> Session:
+        """Get a database session for scheduled tasks."""
+        return SessionLocal(**options)
+    
+    def run_kurkarten_prefetch(self):
+        """Prefetch guest links for upcoming kurkarten emails (off-peak)."""
+        logger.info("Running kurkarten link prefetch...")
 
         db = self.get_db_session()
         try:
@@ -68,73 +162,185 @@ class SchedulerService:
             communication_service = CommunicationService(email_config)
             kurkarten_service = KurkartenService(db, communication_service)
 
-            count = kurkarten_service.check_and_send_pre_arrival_emails()
-            logger.info("Sent %d pre-arrival emails", count)
+            count = kurkarten_service.prefetch_kurkarten_urls()
+            logger.info("Prefetched %d kurkarten links", count)
+            return count
 
         except Exception as e:
-            logger.error("Error in pre-arrival email check: %s", e, exc_info=True)
+            logger.error("Error in kurkarten link prefetch: %s", e, exc_info=True)
+            raise
         finally:
             db.close()
 
-    def run_invoice_generation(self):
-        """Run invoice generation check (3 days after departure)."""
-        logger.info("Running invoice generation check...")
+    def run_token_purge(self):
+        """Delete expired guest tokens."""
+        logger.info("Running token purge...")
 
         db = self.get_db_session()
         try:
-            email_config = get_email_config()
-            communication_service = CommunicationService(email_config)
-            meter_service = MeterService(db)
-            invoice_service = InvoiceService(db, communication_service, meter_service)
-
-            count = invoice_service.check_and_generate_invoices()
-            logger.info("Generated %d invoices", count)
-
+            return TokenService(db).purge_expired_tokens()
         except Exception as e:
-            logger.error("Error in invoice generation: %s", e, exc_info=True)
+            logger.error("Error in token purge: %s", e, exc_info=True)
+            raise
         finally:
             db.close()
 
-    def run_booking_confirmation(self):
-        """Run booking confirmation check (24 hours after creation/modification)."""
-        logger.info("Running booking confirmation check...")
+    def run_daily_pipeline(self):
+        """Run the daily booking jobs along their dependencies, all working on one shared list of candidate bookings."""
+        logger.info("Running daily booking pipeline...")
 
+        run_key = date.today().isoformat()
         db = self.get_db_session()
         try:
-            email_config = get_email_config()
-            communication_service = CommunicationService(email_config)
-
-            from app.booking_repository import BookingRepository
-            from app.guest_repository import GuestRepository
-            from app.services.booking_service import BookingService
+            plan = DailyPlanningService(db).build_plan(auto_confirm_delay_hours=24)
+        finally:
+            db.close()
 
-            booking_repository = BookingRepository(db)
-            guest_repository = GuestRepository(db)
-            booking_service = BookingService(booking_repository, guest_repository, communication_service)
+        # Steps run in parallel threads and an email backend holds one connection, so every chunk gets its own
+        email_config = get_email_config()
+        reminder_collector = ReminderCollector(CommunicationService(email_config))
+
+        def booking_service(db):
+            return BookingService(BookingRepository(db), GuestRepository(db), CommunicationService(email_config))
+
+        def kurkarten_service(db):
+            return KurkartenService(db, CommunicationService(email_config), reminder_collector)
+
+        def invoice_service(db):
+            return InvoiceService(db, CommunicationService(email_config), MeterService(db),
+                                  reminder_collector=reminder_collector)
+
+        # Each step lists the steps whose changes it needs to see. Kurkarten and pre-arrival emails can both
+        # be due for a booking in its last days before arrival and both set its status, so they stay in order.
+        steps = {
+            "booking_status_update": ((), plan.needs_status_update,
+                                      lambda db, bookings: BookingStatusService(db).update_all_booking_statuses(bookings)),
+            "booking_confirmation": (("booking_status_update",), plan.needs_confirmation,
+                                     lambda db, bookings: booking_service(db).check_and_confirm_bookings(bookings=bookings)),
+            "kurkarten_emails": (("booking_confirmation",), plan.needs_kurkarten_email,
+                                 lambda db, bookings: kurkarten_service(db).check_and_send_kurkarten_emails(bookings)),
+            "pre_arrival_emails": (("kurkarten_emails",), plan.needs_pre_arrival_email,
+                                   lambda db, bookings: kurkarten_service(db).check_and_send_pre_arrival_emails(bookings)),
+            "invoice_generation": (("booking_status_update",), plan.needs_invoice,
+                                   lambda db, bookings: invoice_service(db).check_and_generate_invoices(bookings)),
+        }
+        graph = {
+            name: (depends_on, functools.partial(self._run_step, name, run_key, plan, select, process))
+            for name, (depends_on, select, process) in steps.items()
+        }
+        try:
+            results = self.run_job_graph(graph)
+        finally:
+            reminder_collector.flush()
+
+        # Failing here keeps the day open, so the retry resumes the unfinished steps from their checkpoints
+        unfinished = sorted(name for name, (_, finished) in results.items() if not finished)
+        if unfinished:
+            raise RuntimeError(f"Unfinished pipeline steps: {', '.join(unfinished)}")
+        return sum(count for count, _ in results.values())
+
+    def run_job_graph(self, steps: Dict[str, Tuple[Sequence[str], Callable[[], Tuple[int, bool]]]]
+                      ) -> Dict[str, Tuple[int, bool]]:
+        """Run each step as soon as the steps it depends on finished, independent steps in parallel.
+
+        ``steps`` maps a step name to the names it depends on and the callable running it. Returns the
+        ``(count, finished)`` result of every step by name.
+        """
+        unknown = {dep for depends_on, _ in steps.values() for dep in depends_on if dep not in steps}
+        if unknown:
+            raise ValueError(f"Unknown step dependencies: {', '.join(sorted(unknown))}")
+
+        results: Dict[str, Tuple[int, bool]] = {}
+        pending = dict(steps)
+        running: Dict[Future, str] = {}
+        # A pool of its own, the scheduler pool is busy running the job that called us
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="pipeline") as pool:
+            while pending or running:
+                for name, (depends_on, step) in list(pending.items()):
+                    if all(dep in results for dep in depends_on):
+                        running[pool.submit(step)] = name
+                        del pending[name]
+
+                if not running:
+                    raise ValueError(f"Circular step dependencies: {', '.join(sorted(pending))}")
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[running.pop(future)] = future.result()
+
+        return results
+
+    def _run_step(self, name: str, run_key: str, plan: DailyPlan,
+                  select: Callable[[Booking], bool], process: Callable[[Session, List[Booking]], int]) -> Tuple[int, bool]:
+        """Run one pipeline step chunk by chunk and record it in the run history.
+
+        A failing chunk is recorded and the step goes on with the next one, but the checkpoint stays before
+        it, so a rerun of the same day continues with the first chunk that failed. A failing step does not
+        stop the others. Returns the number of processed bookings and whether every chunk finished.
+        """
+        db = self.get_db_session()
+        run_service = SchedulerRunService(db)
+        # The pipeline holds its lease, so runs of this step still marked running belong to a stopped process
+        run_service.fail_abandoned_runs(name, PROCESS_OWNER)
+        run = run_service.start_run(name, run_key, PROCESS_OWNER)
+        count = 0
+        errors = []
+        try:
+            after_id = run_service.get_checkpoint(name, run_key)
+            if after_id:
+                logger.info("Resuming %s after booking %d", name, after_id)
+
+            for chunk in plan.chunks(self.chunk_size, after_id):
+                try:
+                    count += self._run_chunk(name, run_key, chunk, select, process, checkpoint=not errors)
+                except Exception as e:
+                    logger.error("Error in %s for bookings %d to %d: %s", name, chunk[0], chunk[-1], e, exc_info=True)
+                    errors.append(f"Bookings {chunk[0]} to {chunk[-1]}: {str(e) or e.__class__.__name__}")
+        except Exception as e:
+            logger.error("Error in %s: %s", name, e, exc_info=True)
+            errors.append(str(e) or e.__class__.__name__)
 
-            count = booking_service.check_and_confirm_bookings(auto_confirm_delay_hours=24)
-            logger.info("Confirmed %d bookings", count)
+        try:
+            run_service.finish_run(run, items_processed=count, error="; ".join(errors) or None)
+            logger.info("%s: processed %d bookings", name, count)
+            return count, not errors
+        finally:
+            db.close()
 
-        except Exception as e:
-            logger.error("Error in booking confirmation: %s", e, exc_info=True)
+    def _run_chunk(self, name: str, run_key: str, booking_ids: List[int],
+                   select: Callable[[Booking], bool], process: Callable[[Session, List[Booking]], int],
+                   checkpoint: bool = True) -> int:
+        """Process one chunk of bookings in its own short-lived session and checkpoint it."""
+        # Objects stay loaded across the per-booking commits instead of being reloaded one by one
+        db = self.get_db_session(expire_on_commit=False)
+        try:
+            bookings = [b for b in DailyPlanningService(db).load_bookings(booking_ids) if select(b)]
+            count = process(db, bookings) if bookings else 0
+            if checkpoint:
+                SchedulerRunService(db).save_checkpoint(name, run_key, booking_ids[-1])
+            return count
         finally:
             db.close()
 
+    def daily_jobs(self) -> List[Tuple[str, Callable]]:
+        """The daily jobs with their start time, in the order they run."""
+        jobs = [
+            (get_kurkarten_config()["prefetch_time"], self.run_kurkarten_prefetch),
+            (get_token_config()["purge_time"], self.run_token_purge),
+            (self.pipeline_time, self.run_daily_pipeline),
+        ]
+        return sorted(jobs, key=lambda item: item[0])
+
     def setup_schedule(self):
         """Setup the scheduled tasks."""
-        schedule.every().day.at("08:45").do(self.run_booking_status_update)
-        schedule.every().day.at("09:00").do(self.run_booking_confirmation)
-        schedule.every().day.at("09:15").do(self.run_kurkarten_emails)
-        schedule.every().day.at("09:30").do(self.run_pre_arrival_emails)
-        schedule.every().day.at("09:45").do(self.run_invoice_generation)
+        for at, job in self.daily_jobs():
+            schedule.every().day.at(at).do(self.submit_job, job)
+        if self.catch_up:
+            schedule.every(self.retry_minutes).minutes.do(self.submit_catch_up)
 
         logger.info(
-            "Scheduler setup complete. Tasks will run daily at: "
-            "08:45 booking status update, "
-            "09:00 booking confirmation, "
-            "09:15 kurkarten emails, "
-            "09:30 pre-arrival emails, "
-            "09:45 invoice generation"
+            "Scheduler setup complete. Tasks will run daily at: %s",
+            ", ".join(f"{at} {job.__name__}" for at, job in self.daily_jobs()),
         )
 
     async def start_scheduler(self):
@@ -144,9 +350,12 @@ class SchedulerService:
 
         self.running = True
         self.setup_schedule()
+        if self.catch_up:
+            self.submit_catch_up()
 
         logger.info("Scheduler started")
 
+        # The loop only triggers jobs; they run in the worker pool
         while self.running:
             schedule.run_pending()
             await asyncio.sleep(60)  # Check every minute
@@ -155,6 +364,11 @@ class SchedulerService:
         """Stop the scheduler."""
         self.running = False
         schedule.clear()
+        with self._jobs_lock:
+            if self.executor is not None:
+                # Running jobs finish in the background, queued ones are dropped
+                self.executor.shutdown(wait=False, cancel_futures=True)
+                self.executor = None
         logger.info("Scheduler stopped")
 
 
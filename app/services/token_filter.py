@@ -0,0 +1,154 @@
+import datetime
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from app.models import BookingToken
+
+
+class BloomFilter:
+    """Set membership with false positives but no false negatives, in a fixed-size bit array."""
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        capacity = max(capacity, 1)
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str):
+        digest = hashlib.sha256(item.encode("utf-8")).digest()
+        # Double hashing: k positions from two independent 64-bit halves of one digest
+        first = int.from_bytes(digest[:8], "big")
+        second = int.from_bytes(digest[8:16], "big") | 1
+        return ((first + i * second) % self.size for i in range(self.hash_count))
+
+    def add(self, item: str) -> None:
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class LiveTokenFilter:
+    """Bloom filter of the unexpired tokens, so guessed tokens are rejected without a query.
+
+    Tokens issued by this process are added right away. Tokens issued by other processes are picked up
+    when a lookup misses, by one indexed query for the missing token together with the rows created since
+    the last load. The window reaches ``overlap_seconds`` back, because rows of other processes can commit
+    after rows created later. That query runs at most every ``probe_seconds``, so a flood of unknown tokens
+    costs at most one query per interval; a token issued elsewhere within that interval can be rejected
+    once until the next probe. The filter is rebuilt every ``rebuild_seconds`` to drop revoked and
+    expired tokens.
+    """
+
+    def __init__(self, capacity: int, probe_seconds: float, rebuild_seconds: float, error_rate: float = 0.01,
+                 overlap_seconds: float = 60):
+        self.capacity = capacity
+        self.probe_seconds = probe_seconds
+        self.rebuild_seconds = rebuild_seconds
+        self.error_rate = error_rate
+        self.overlap_seconds = overlap_seconds
+        self._bloom: Optional[BloomFilter] = None
+        self._loaded_until: Optional[datetime.datetime] = None
+        self._built_at = 0.0
+        self._probed_at = 0.0
+        self._lock = threading.Lock()
+
+    def might_exist(self, db: Session, token: str) -> bool:
+        with self._lock:
+            stale = self._bloom is None or time.monotonic() - self._built_at > self.rebuild_seconds
+        if stale:
+            self.rebuild(db)
+
+        with self._lock:
+            if token in self._bloom:
+                return True
+            probe_due = time.monotonic() - self._probed_at >= self.probe_seconds
+        if not probe_due:
+            return False
+
+        self._load_new_tokens(db, token)
+        with self._lock:
+            return token in self._bloom
+
+    def add(self, token: str) -> None:
+        with self._lock:
+            # Not built yet: the first lookup loads all tokens, this one included
+            if self._bloom is not None:
+                self._bloom.add(token)
+
+    def rebuild(self, db: Session) -> None:
+        now = datetime.datetime.utcnow()
+        live_count = db.query(BookingToken.id).filter(BookingToken.expires_at > now).count()
+        bloom = BloomFilter(max(self.capacity, live_count * 2), self.error_rate)
+        rows = db.query(BookingToken.token).filter(BookingToken.expires_at > now).yield_per(1000)
+        for (token,) in rows:
+            bloom.add(token)
+
+        with self._lock:
+            self._bloom = bloom
+            self._loaded_until = now
+            self._built_at = self._probed_at = time.monotonic()
+
+    def _load_new_tokens(self, db: Session, token: str) -> None:
+        now = datetime.datetime.utcnow()
+        with self._lock:
+            self._probed_at = time.monotonic()
+            created_since = self._loaded_until - datetime.timedelta(seconds=self.overlap_seconds)
+        rows = db.query(BookingToken.token).filter(
+            BookingToken.expires_at > now,
+            or_(BookingToken.created_at >= created_since, BookingToken.token == token),
+        ).all()
+        with self._lock:
+            for (loaded_token,) in rows:
+                self._bloom.add(loaded_token)
+            self._loaded_until = max(self._loaded_until, now)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._bloom = None
+            self._loaded_until = None
+
+
+class NegativeTokenCache:
+    """Tokens recently found invalid in the database, so repeated probes do not query again."""
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, token: str) -> bool:
+        with self._lock:
+            rejected_at = self._entries.get(token)
+            if rejected_at is None:
+                return False
+            if time.monotonic() - rejected_at > self.ttl_seconds:
+                del self._entries[token]
+                return False
+            return True
+
+    def add(self, token: str) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[token] = time.monotonic()
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def discard(self, token: str) -> None:
+        with self._lock:
+            self._entries.pop(token, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
@@ -1,22 +1,205 @@
+import base64
 import datetime
+import hashlib
+import hmac
+import logging
 import secrets
-from typing import Optional
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional, Tuple
 
-from sqlalchemy.orm import Session
+from sqlalchemy import bindparam
+from sqlalchemy.orm import Session, joinedload, load_only, selectinload
 
-from app.models import Booking, BookingToken
+from app.config.config import get_token_config
+from app.database import SessionLocal
+from app.models import Booking, BookingToken, Guest, TokenRevocation
 from app.schemas import BookingTokenResponse, GuestBookingResponse
+from app.services.invoice_service import invoice_data_from_snapshot
+from app.services.token_filter import LiveTokenFilter, NegativeTokenCache
+
+logger = logging.getLogger(__name__)
+
+
+class TokenCache:
+    """LRU cache of validated tokens: token -> (booking_id, expires_at), each entry trusted for ``ttl_seconds``."""
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[int, datetime.datetime, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> Optional[Tuple[int, datetime.datetime]]:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            booking_id, expires_at, cached_at = entry
+            if time.monotonic() - cached_at > self.ttl_seconds or expires_at <= datetime.datetime.utcnow():
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+            return booking_id, expires_at
+
+    def put(self, token: str, booking_id: int, expires_at: datetime.datetime) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[token] = (booking_id, expires_at, time.monotonic())
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, token: str) -> None:
+        with self._lock:
+            self._entries.pop(token, None)
+
+    def invalidate_booking(self, booking_id: int) -> None:
+        with self._lock:
+            for token in [t for t, entry in self._entries.items() if entry[0] == booking_id]:
+                del self._entries[token]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class LastUsedBuffer:
+    """Latest use of each token since the last flush, so page views do not each write to the database."""
+
+    def __init__(self, flush_seconds: float):
+        self.flush_seconds = flush_seconds
+        self._pending: Dict[str, datetime.datetime] = {}
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+    def touch(self, token: str, used_at: datetime.datetime) -> None:
+        with self._lock:
+            self._pending[token] = used_at
+
+    def get(self, token: str) -> Optional[datetime.datetime]:
+        with self._lock:
+            return self._pending.get(token)
+
+    def due(self) -> bool:
+        with self._lock:
+            return bool(self._pending) and time.monotonic() - self._last_flush >= self.flush_seconds
+
+    def drain(self) -> Dict[str, datetime.datetime]:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+            return pending
+
+    def restore(self, pending: Dict[str, datetime.datetime]) -> None:
+        """Put back entries of a failed flush, keeping newer uses recorded in the meantime."""
+        with self._lock:
+            for token, used_at in pending.items():
+                self._pending.setdefault(token, used_at)
+
+
+class RevocationSet:
+    """Minimum valid signed-token version per booking, mirrored from token_revocations.
+
+    Reloaded every ``ttl_seconds`` so revocations made by other processes apply here as well.
+    """
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._min_versions: Dict[int, int] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def min_version(self, db: Session, booking_id: int) -> int:
+        with self._lock:
+            stale = self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl_seconds
+        if stale:
+            self.load(db)
+        with self._lock:
+            return self._min_versions.get(booking_id, 0)
+
+    def load(self, db: Session) -> None:
+        rows = db.query(TokenRevocation.booking_id, TokenRevocation.min_version).all()
+        with self._lock:
+            self._min_versions = {booking_id: min_version for booking_id, min_version in rows}
+            self._loaded_at = time.monotonic()
+
+    def set(self, booking_id: int, min_version: int) -> None:
+        with self._lock:
+            self._min_versions[booking_id] = min_version
+
+    def clear(self) -> None:
+        with self._lock:
+            self._min_versions.clear()
+            self._loaded_at = None
+
+
+class SignedTokenClaims(NamedTuple):
+    booking_id: int
+    version: int
+    expires_at: datetime.datetime
+
+
+SIGNED_TOKEN_PREFIX = "s1."
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def sign_token(signing_key: str, booking_id: int, version: int, expires_at: datetime.datetime) -> str:
+    """Build a signed token s1.<payload>.<signature> embedding booking, revocation version and expiry."""
+    expires_epoch = int(expires_at.replace(tzinfo=datetime.timezone.utc).timestamp())
+    # The nonce keeps tokens issued for the same booking and expiry distinct
+    payload = _b64encode(f"{booking_id}.{version}.{expires_epoch}.{secrets.token_hex(4)}".encode("ascii"))
+    signature = hmac.new(signing_key.encode("utf-8"), f"{SIGNED_TOKEN_PREFIX}{payload}".encode("ascii"), hashlib.sha256)
+    return f"{SIGNED_TOKEN_PREFIX}{payload}.{_b64encode(signature.digest())}"
+
+
+def verify_signed_token(signing_key: str, token: str) -> Optional[SignedTokenClaims]:
+    """Check signature and expiry of a signed token; None if it is forged, malformed or expired."""
+    if not signing_key or not token.startswith(SIGNED_TOKEN_PREFIX):
+        return None
+    try:
+        payload, signature = token[len(SIGNED_TOKEN_PREFIX):].split(".")
+        expected = hmac.new(signing_key.encode("utf-8"), f"{SIGNED_TOKEN_PREFIX}{payload}".encode("ascii"), hashlib.sha256)
+        if not hmac.compare_digest(_b64decode(signature), expected.digest()):
+            return None
+        booking_id, version, expires_epoch, _ = _b64decode(payload).decode("ascii").split(".")
+        expires_at = datetime.datetime.utcfromtimestamp(int(expires_epoch))
+    except (ValueError, UnicodeError):
+        return None
+
+    if expires_at <= datetime.datetime.utcnow():
+        return None
+    return SignedTokenClaims(int(booking_id), int(version), expires_at)
+
+
+_token_config = get_token_config()
+# Shared by all requests of this process
+token_cache = TokenCache(_token_config["cache_size"], _token_config["cache_ttl_seconds"])
+last_used_buffer = LastUsedBuffer(_token_config["last_used_flush_seconds"])
+token_revocations = RevocationSet(_token_config["cache_ttl_seconds"])
+live_token_filter = LiveTokenFilter(
+    _token_config["filter_capacity"], _token_config["filter_probe_seconds"], _token_config["filter_rebuild_seconds"],
+    overlap_seconds=_token_config["filter_overlap_seconds"],
+)
+negative_token_cache = NegativeTokenCache(_token_config["negative_cache_size"], _token_config["negative_cache_ttl_seconds"])
 
 
 class TokenService:
-    def __init__(self, db: Session):
+    def __init__(self, db: Session, token_config: dict = None):
         self.db = db
+        self.token_config = token_config or _token_config
 
     def generate_token(self, booking_id: int, expiry_months: int = 3) -> str:
         """Generate a secure token for guest access to a booking"""
-        # Generate a cryptographically secure token
-        token = secrets.token_urlsafe(32)
-        
         # Calculate expiry date (3 months after departure by default)
         booking = self.db.query(Booking).filter(Booking.id == booking_id).first()
         if not booking:
@@ -28,10 +211,17 @@ class TokenService:
             base_date, 
             datetime.time.min
         ) + datetime.timedelta(days=expiry_months * 30)
+
+        if self.token_config["format"] == "signed":
+            revocation = self.db.get(TokenRevocation, booking_id)
+            token = sign_token(self.token_config["signing_key"], booking_id, revocation.min_version if revocation else 0, expiry_date)
+        else:
+            # Generate a cryptographically secure token
+            token = secrets.token_urlsafe(32)
         
-        # Create token record
+        # Create token record (signed tokens too, for the admin token info and last_used_at)
         booking_token = BookingToken(
-            booking_id=booking_id,
+            booking=booking,
             token=token,
             expires_at=expiry_date
         )
@@ -44,41 +234,120 @@ class TokenService:
         booking.access_token = token
         booking.token_expires_at = expiry_date
         self.db.commit()
+
+        live_token_filter.add(token)
+        negative_token_cache.discard(token)
         
         return token
 
     def validate_token(self, token: str) -> Optional[Booking]:
         """Validate a token and return the associated booking if valid"""
-        booking_token = self.db.query(BookingToken).filter(
+        booking_id = self.get_booking_id_for_token(token)
+        if booking_id is None:
+            return None
+
+        booking = self.db.get(Booking, booking_id)
+        if not booking:
+            # Booking deleted since the token was cached
+            token_cache.invalidate(token)
+        return booking
+
+    def get_booking_id_for_token(self, token: str) -> Optional[int]:
+        """Check a token and record its use; returns the booking ID without loading the booking."""
+        if token.startswith(SIGNED_TOKEN_PREFIX):
+            booking_id = self._check_signed_token(token)
+        else:
+            booking_id = self._check_opaque_token(token)
+
+        if booking_id is None:
+            return None
+
+        # last_used_at is written in batches instead of on every page view
+        last_used_buffer.touch(token, datetime.datetime.utcnow())
+        if last_used_buffer.due():
+            self.flush_last_used()
+
+        return booking_id
+
+    def _check_signed_token(self, token: str) -> Optional[int]:
+        """Signature, expiry and revocation are all checked in memory."""
+        claims = verify_signed_token(self.token_config["signing_key"], token)
+        if not claims or claims.version < token_revocations.min_version(self.db, claims.booking_id):
+            return None
+        return claims.booking_id
+
+    def _check_opaque_token(self, token: str) -> Optional[int]:
+        cached = token_cache.get(token)
+        if cached:
+            return cached[0]
+
+        # Guessed and repeatedly probed tokens are rejected from memory
+        if token in negative_token_cache or not live_token_filter.might_exist(self.db, token):
+            return None
+
+        row = self.db.query(BookingToken.booking_id, BookingToken.expires_at).filter(
             BookingToken.token == token,
             BookingToken.expires_at > datetime.datetime.utcnow()
         ).first()
-        
-        if not booking_token:
+        if not row:
+            negative_token_cache.add(token)
             return None
-        
-        # Update last used timestamp
-        booking_token.last_used_at = datetime.datetime.utcnow()
-        self.db.commit()
-        
-        return booking_token.booking
+
+        token_cache.put(token, row.booking_id, row.expires_at)
+        return row.booking_id
+
+    def flush_last_used(self) -> int:
+        """Write the buffered last_used_at timestamps in one batched UPDATE."""
+        pending = last_used_buffer.drain()
+        if not pending:
+            return 0
+
+        table = BookingToken.__table__
+        try:
+            self.db.execute(
+                table.update().where(table.c.token == bindparam("b_token")).values(last_used_at=bindparam("b_used_at")),
+                [{"b_token": token, "b_used_at": used_at} for token, used_at in pending.items()],
+            )
+            self.db.commit()
+        except Exception as e:
+            logger.error("Failed to write last_used_at of %d tokens: %s", len(pending), e)
+            self.db.rollback()
+            last_used_buffer.restore(pending)
+            return 0
+        return len(pending)
 
     def get_booking_by_token(self, token: str) -> Optional[GuestBookingResponse]:
         """Get booking details for guest access via token"""
-        booking = self.validate_token(token)
+        booking_id = self.get_booking_id_for_token(token)
+        if booking_id is None:
+            return None
+
+        guest_booking = self.get_guest_booking(booking_id)
+        if guest_booking is None:
+            token_cache.invalidate(token)
+        return guest_booking
+
+    def get_guest_booking(self, booking_id: int) -> Optional[GuestBookingResponse]:
+        """Build the guest view of a booking whose token was already checked."""
+        # One joined query for the booking and its single-row relations, one more for all payments
+        booking = self.db.query(Booking).options(
+            load_only(
+                Booking.id, Booking.check_in, Booking.check_out, Booking.confirmed, Booking.status,
+                Booking.kurtaxe_amount, Booking.kurtaxe_notes, Booking.created_at, Booking.invoice_created,
+            ),
+            joinedload(Booking.guest).load_only(Guest.first_name, Guest.last_name, Guest.email),
+            joinedload(Booking.meter_readings),
+            joinedload(Booking.invoice_snapshot),
+            selectinload(Booking.payments),
+        ).filter(Booking.id == booking_id).first()
         if not booking:
             return None
-        
-        # Build guest name
-        guest_name = f"{booking.guest.first_name} {booking.guest.last_name}"
-        
-        # Get invoice details from persisted snapshot if available
+
+        guest = booking.guest
         invoice_details = None
         if booking.invoice_created and booking.invoice_snapshot:
-            from app.services.invoice_service import InvoiceService
-            invoice_service = InvoiceService(self.db, None, None)
-            invoice_details = invoice_service._invoice_data_from_snapshot(booking.invoice_snapshot)
-        
+            invoice_details = invoice_data_from_snapshot(booking.invoice_snapshot)
+
         return GuestBookingResponse(
             id=booking.id,
             check_in=booking.check_in,
@@ -88,8 +357,8 @@ class TokenService:
             kurtaxe_amount=booking.kurtaxe_amount,
             kurtaxe_notes=booking.kurtaxe_notes,
             created_at=booking.created_at,
-            guest_name=guest_name,
-            guest_email=booking.guest.email,
+            guest_name=f"{guest.first_name} {guest.last_name}",
+            guest_email=guest.email,
             meter_readings=booking.meter_readings,
             payments=booking.payments,
             invoice_details=invoice_details
@@ -100,6 +369,15 @@ class TokenService:
         tokens = self.db.query(BookingToken).filter(BookingToken.booking_id == booking_id).all()
         for token in tokens:
             self.db.delete(token)
+        token_cache.invalidate_booking(booking_id)
+
+        # Signed tokens cannot be deleted, so every version issued so far is revoked instead
+        revocation = self.db.get(TokenRevocation, booking_id)
+        if revocation is None:
+            revocation = TokenRevocation(booking_id=booking_id, min_version=0)
+            self.db.add(revocation)
+        revocation.min_version += 1
+        revocation.revoked_at = datetime.datetime.utcnow()
         
         # Clear token info from booking
         booking = self.db.query(Booking).filter(Booking.id == booking_id).first()
@@ -108,13 +386,51 @@ class TokenService:
             booking.token_expires_at = None
         
         self.db.commit()
+        token_revocations.set(booking_id, revocation.min_version)
         return True
 
+    def purge_expired_tokens(self, batch_size: Optional[int] = None) -> int:
+        """Delete expired tokens and clear expired token copies on bookings, one batch per transaction.
+
+        Returns the number of deleted tokens.
+        """
+        batch_size = batch_size or self.token_config["purge_batch_size"]
+        now = datetime.datetime.utcnow()
+
+        deleted = 0
+        while True:
+            token_ids = [token_id for (token_id,) in self.db.query(BookingToken.id).filter(
+                BookingToken.expires_at <= now
+            ).order_by(BookingToken.id).limit(batch_size)]
+            if not token_ids:
+                break
+            self.db.query(BookingToken).filter(BookingToken.id.in_(token_ids)).delete(synchronize_session=False)
+            self.db.commit()
+            deleted += len(token_ids)
+
+        cleared = 0
+        while True:
+            booking_ids = [booking_id for (booking_id,) in self.db.query(Booking.id).filter(
+                Booking.access_token != None,
+                Booking.token_expires_at <= now
+            ).order_by(Booking.id).limit(batch_size)]
+            if not booking_ids:
+                break
+            self.db.query(Booking).filter(Booking.id.in_(booking_ids)).update(
+                {Booking.access_token: None, Booking.token_expires_at: None}, synchronize_session=False
+            )
+            self.db.commit()
+            cleared += len(booking_ids)
+
+        logger.info("Purged %d expired tokens, cleared expired tokens of %d bookings", deleted, cleared)
+        return deleted
+
     def get_token_info(self, booking_id: int) -> Optional[BookingTokenResponse]:
         """Get token information for a booking"""
-        token = self.db.query(BookingToken).filter(
-            BookingToken.booking_id == booking_id
-        ).order_by(BookingToken.created_at.desc()).first()
+        # Goes through the booking so tokens loaded with it (e.g. by the daily plan) are not queried again
+        booking = self.db.get(Booking, booking_id)
+        tokens = booking.tokens if booking else []
+        token = max(tokens, key=lambda t: t.created_at or datetime.datetime.min, default=None)
         
         if not token:
             return None
@@ -123,5 +439,14 @@ class TokenService:
             token=token.token,
             expires_at=token.expires_at,
             created_at=token.created_at,
-            last_used_at=token.last_used_at
-        ) 
\ No newline at end of file
+            last_used_at=last_used_buffer.get(token.token) or token.last_used_at
+        )
+
+
+def flush_last_used_tokens() -> int:
+    """Write buffered last_used_at timestamps with its own database session (e.g. on shutdown)."""
+    db = SessionLocal()
+    try:
+        return TokenService(db).flush_last_used()
+    finally:
+        db.close()
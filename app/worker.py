@@ -0,0 +1,56 @@
+"""
+Background worker that runs the scheduled jobs and queued jobs outside the web processes.
+
+    python -m app.worker
+
+Queued jobs only run here unless a web process sets JOB_RUNNER_ENABLED=true; start the web processes with
+SCHEDULER_ENABLED=false to leave the scheduled jobs to the worker as well. Scheduled jobs take database leases
+and queued jobs are claimed atomically, so several workers never send the same emails twice.
+"""
+import asyncio
+import logging
+import signal
+
+from app.services.communication_service import precompile_templates
+from app.services.job_service import job_runner
+from app.services.scheduler_service import scheduler_service
+
+logger = logging.getLogger(__name__)
+
+
+async def run_worker():
+    """Run the scheduler and the job runner until the process receives SIGINT or SIGTERM."""
+    precompile_templates()
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signal_number, stop_event.set)
+
+    logger.info("Starting worker...")
+    scheduler_task = asyncio.create_task(scheduler_service.start_scheduler())
+    job_runner_task = asyncio.create_task(job_runner.start())
+
+    await stop_event.wait()
+
+    logger.info("Stopping worker...")
+    scheduler_service.stop_scheduler()
+    job_runner.stop()
+    for task in (scheduler_task, job_runner_task):
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(levelname)s:     %(name)s - %(message)s",
+    )
+    asyncio.run(run_worker())
+
+
+if __name__ == "__main__":
+    main()
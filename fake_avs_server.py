@@ -0,0 +1,117 @@
+"""
+Local stand-in for the AVS Meldeschein portal, for testing kurkarten timeouts and failures offline.
+
+Run it and point the app at it:
+
+    FAKE_AVS_DELAY=2 FAKE_AVS_FAILURE_RATE=0.3 uvicorn fake_avs_server:app --port 8900
+    KURKARTEN_BASE_URL=http://localhost:8900
+
+Behaviour can also be changed while it runs, e.g. to simulate an outage during a load test:
+
+    curl -X POST localhost:8900/_fake/settings -H 'Content-Type: application/json' -d '{"failure_rate": 1}'
+"""
+import asyncio
+import hashlib
+import os
+import random
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import HTMLResponse, RedirectResponse
+
+SESSION_COOKIE = "JSESSIONID"
+
+LOGIN_PAGE = """<html><body>
+<form action="/amrum/login.do" method="post">
+<input name="kennung"><input type="password" name="passwort">
+</form>
+</body></html>"""
+
+app = FastAPI(title="Fake AVS portal")
+
+settings = {
+    # Seconds to wait before answering createGastlink
+    "delay": float(os.getenv("FAKE_AVS_DELAY", "0")),
+    # Share of createGastlink requests answered with a 500
+    "failure_rate": float(os.getenv("FAKE_AVS_FAILURE_RATE", "0")),
+    # Seconds after which a session is forgotten and the login page is served again
+    "session_ttl": float(os.getenv("FAKE_AVS_SESSION_TTL", "900")),
+    # Characters of filler markup after the link, like the real portal's large pages
+    "page_padding": float(os.getenv("FAKE_AVS_PAGE_PADDING", "0")),
+}
+
+sessions = {}
+stats = {"logins": 0, "guest_links": 0, "failures": 0}
+
+
+def _has_session(request: Request) -> bool:
+    session_id = request.cookies.get(SESSION_COOKIE)
+    created_at = sessions.get(session_id)
+    loop_time = asyncio.get_running_loop().time()
+    return created_at is not None and loop_time - created_at < settings["session_ttl"]
+
+
+@app.get("/amrum/login.do", response_class=HTMLResponse)
+async def login_page():
+    return LOGIN_PAGE
+
+
+@app.post("/amrum/login.do")
+async def login(request: Request):
+    form = await request.form()
+    if not form.get("kennung") or not form.get("passwort"):
+        return HTMLResponse(LOGIN_PAGE)
+
+    session_id = uuid.uuid4().hex
+    sessions[session_id] = asyncio.get_running_loop().time()
+    stats["logins"] += 1
+
+    response = HTMLResponse("<html><body>Willkommen</body></html>")
+    response.set_cookie(SESSION_COOKIE, session_id)
+    return response
+
+
+@app.post("/amrum/createGastlink.do")
+async def create_guest_link(request: Request):
+    if settings["delay"]:
+        await asyncio.sleep(settings["delay"])
+
+    if random.random() < settings["failure_rate"]:
+        stats["failures"] += 1
+        return HTMLResponse("<html><body>Interner Fehler</body></html>", status_code=500)
+
+    if not _has_session(request):
+        return RedirectResponse("/amrum/login.do", status_code=302)
+
+    form = await request.form()
+    guest_email = form.get("value(GastEmail)", "")
+    link_hash = hashlib.sha1(f"{guest_email}:{uuid.uuid4()}".encode()).hexdigest()
+    stats["guest_links"] += 1
+
+    padding = "<div>" + "x" * int(settings["page_padding"]) + "</div>" if settings["page_padding"] else ""
+    return HTMLResponse(
+        "<html><body><p>Gastlink erstellt:</p>"
+        f'<a href="https://selfcheck-in-meldeschein.avs.de/?hash={link_hash}">Link</a>'
+        f"{padding}</body></html>"
+    )
+
+
+@app.get("/_fake/settings")
+async def get_settings():
+    return {"settings": settings, "stats": stats, "sessions": len(sessions)}
+
+
+@app.post("/_fake/settings")
+async def update_settings(updates: dict):
+    for key, value in updates.items():
+        if key in settings:
+            settings[key] = float(value)
+    if updates.get("expire_sessions"):
+        sessions.clear()
+    return {"settings": settings, "stats": stats, "sessions": len(sessions)}
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("FAKE_AVS_PORT", "8900")))
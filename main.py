@@ -16,26 +16,55 @@ from fastapi import FastAPI, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.api.routes import booking_router, guest_router, admin_router, alert_router, guest_booking_router, auth_router, dashboard_router
-from app.api.routes import availability_router
-from app.config.config import get_rate_limit_config, get_cors_config
-from app.services.scheduler_service import scheduler_service
+from app.api.routes import availability_router, job_router
+from app.config.config import get_rate_limit_config, get_cors_config, get_job_config, get_scheduler_config
+from app.services.communication_service import precompile_templates
+from app.services.token_service import flush_last_used_tokens
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
-    logger.info("Starting scheduler service...")
-    scheduler_task = asyncio.create_task(scheduler_service.start_scheduler())
+    precompile_templates()
+
+    job_runner = None
+    job_runner_task = None
+    if get_job_config()["runner_enabled"]:
+        from app.services.job_service import job_runner
+
+        logger.info("Starting job runner...")
+        job_runner_task = asyncio.create_task(job_runner.start())
+    else:
+        logger.info("Job runner disabled in this process, queued jobs run in the worker")
+
+    scheduler_service = None
+    scheduler_task = None
+    if get_scheduler_config()["enabled"]:
+        # Imported here so web processes without the scheduler do not load it
+        from app.services.scheduler_service import scheduler_service
+
+        logger.info("Starting scheduler service...")
+        scheduler_task = asyncio.create_task(scheduler_service.start_scheduler())
+    else:
+        logger.info("Scheduler disabled in this process, jobs run in the worker")
 
     yield
 
     # Shutdown
-    logger.info("Stopping scheduler service...")
-    scheduler_service.stop_scheduler()
-    scheduler_task.cancel()
-    try:
-        await scheduler_task
-    except asyncio.CancelledError:
-        pass
+    flush_last_used_tokens()
+    if scheduler_service is not None:
+        logger.info("Stopping scheduler service...")
+        scheduler_service.stop_scheduler()
+    if job_runner is not None:
+        job_runner.stop()
+
+    for task in (scheduler_task, job_runner_task):
+        if task is None:
+            continue
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
 
 
 app = FastAPI(lifespan=lifespan)
@@ -133,6 +162,7 @@ app.include_router(guest_booking_router.router)
 app.include_router(auth_router.router)
 app.include_router(dashboard_router.router)
 app.include_router(availability_router.router)
+app.include_router(job_router.router)
 
 
 if __name__ == "__main__":
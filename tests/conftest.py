@@ -1,4 +1,5 @@
-from datetime import date
+import asyncio
+from datetime import date, timedelta
 
 import pytest
 from fastapi.testclient import TestClient
@@ -81,7 +82,7 @@ def test_booking(db_session, test_guest):
     booking = Booking(
         guest_id=test_guest.id,
         check_in=date.today(),
-        check_out=date.today(),
+        check_out=date.today() + timedelta(days=7),
     )
     db_session.add(booking)
     db_session.commit()
@@ -91,3 +92,35 @@ def test_booking(db_session, test_guest):
 
     db_session.delete(booking)
     db_session.commit()
+
+
+@pytest.fixture
+def add_booking(db_session):
+    def _add_booking(guest, check_in=date(2026, 7, 1), nights=7, **fields):
+        booking = Booking(guest_id=guest.id, check_in=check_in, check_out=check_in + timedelta(days=nights), **fields)
+        db_session.add(booking)
+        db_session.commit()
+        return booking
+
+    return _add_booking
+
+
+class RecordingCommunicationService:
+    def __init__(self, fail=False):
+        self.sent = []
+        self.fail = fail
+
+    def send_email(self, recipient, subject, template_name, context):
+        if self.fail:
+            raise RuntimeError("SMTP down")
+        self.sent.append({"recipient": recipient, "template_name": template_name, "context": context})
+        return True
+
+    async def send_email_async(self, recipient, subject, template_name, context):
+        await asyncio.sleep(0)
+        return self.send_email(recipient, subject, template_name, context)
+
+
+@pytest.fixture
+def communication_service():
+    return RecordingCommunicationService()
@@ -0,0 +1,206 @@
+import asyncio
+
+import httpx
+import pytest
+
+import fake_avs_server
+from app.services import avs_client as avs_client_module
+from app.services.avs_client import AsyncAvsClient, AvsClient, GuestLinkScanner
+from app.services.circuit_breaker import CircuitBreaker, CircuitOpenError, RetryBudget
+
+AVS_CONFIG = {
+    "kennung": "kennung",
+    "passwort": "passwort",
+    "ort": "amrum",
+    "hotel": "haus-b",
+    "base_url": "https://avs.test",
+    "session_max_age": 900,
+}
+
+
+class FakePortal:
+    """Mock transport handler that counts logins and can expire the session."""
+
+    def __init__(self):
+        self.logins = 0
+        self.logged_in = False
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        if request.url.path.endswith("/login.do"):
+            self.logins += 1
+            self.logged_in = True
+            return httpx.Response(200, text="<html>Willkommen</html>")
+
+        if not self.logged_in:
+            return httpx.Response(200, text='<form><input name="passwort"></form>')
+        return httpx.Response(200, text='<a href="https://selfcheck-in-meldeschein.avs.de/?hash=abc123">Link</a>')
+
+
+def test_avs_client_logs_in_once_for_many_guests():
+    portal = FakePortal()
+    with AvsClient(AVS_CONFIG, transport=httpx.MockTransport(portal)) as client:
+        urls = [client.create_guest_link(f"guest{i}@example.com") for i in range(3)]
+
+    assert portal.logins == 1
+    assert urls == ["https://selfcheck-in-meldeschein.avs.de/?hash=abc123"] * 3
+
+
+def test_avs_client_logs_in_again_when_session_expired():
+    portal = FakePortal()
+    with AvsClient(AVS_CONFIG, transport=httpx.MockTransport(portal)) as client:
+        client.create_guest_link("first@example.com")
+        portal.logged_in = False
+        url = client.create_guest_link("second@example.com")
+
+    assert portal.logins == 2
+    assert url == "https://selfcheck-in-meldeschein.avs.de/?hash=abc123"
+
+
+def test_async_avs_client_fetches_links_concurrently_with_one_login():
+    portal = FakePortal()
+    in_flight = 0
+    max_in_flight = 0
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.05)
+        in_flight -= 1
+        return portal(request)
+
+    async def fetch_all():
+        config = dict(AVS_CONFIG, max_concurrency=2)
+        async with AsyncAvsClient(config, transport=httpx.MockTransport(handler)) as client:
+            return await asyncio.gather(*(client.create_guest_link(f"guest{i}@example.com") for i in range(5)))
+
+    urls = asyncio.run(fetch_all())
+
+    assert portal.logins == 1
+    assert max_in_flight == 2
+    assert len(urls) == 5
+
+
+@pytest.fixture
+def fake_avs(monkeypatch):
+    """The local fake AVS server, reset to healthy defaults and without retry backoff."""
+    monkeypatch.setattr(avs_client_module, "backoff_delay", lambda attempt: 0)
+    monkeypatch.setitem(fake_avs_server.settings, "delay", 0)
+    monkeypatch.setitem(fake_avs_server.settings, "failure_rate", 0)
+    fake_avs_server.sessions.clear()
+    return fake_avs_server
+
+
+def test_avs_client_retries_transient_failures(fake_avs):
+    responses = iter([httpx.Response(503), httpx.Response(502)])
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path.endswith("/createGastlink.do"):
+            response = next(responses, None)
+            if response:
+                return response
+        return portal(request)
+
+    portal = FakePortal()
+    breaker = CircuitBreaker("avs-test", failure_threshold=5)
+    with AvsClient(AVS_CONFIG, transport=httpx.MockTransport(handler), circuit_breaker=breaker,
+                   retry_budget=RetryBudget()) as client:
+        url = client.create_guest_link("guest@example.com")
+
+    assert url == "https://selfcheck-in-meldeschein.avs.de/?hash=abc123"
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_async_avs_client_fails_fast_once_circuit_opens(fake_avs):
+    fake_avs.settings["failure_rate"] = 1
+    breaker = CircuitBreaker("avs-test", failure_threshold=2, reset_timeout=60)
+    config = dict(AVS_CONFIG, base_url="http://fake-avs", max_concurrency=1, max_retries=1)
+
+    async def fetch_all():
+        transport = httpx.ASGITransport(app=fake_avs.app)
+        async with AsyncAvsClient(config, transport=transport, circuit_breaker=breaker,
+                                  retry_budget=RetryBudget()) as client:
+            return await asyncio.gather(
+                *(client.create_guest_link(f"guest{i}@example.com") for i in range(5)),
+                return_exceptions=True,
+            )
+
+    results = asyncio.run(fetch_all())
+
+    assert breaker.state == CircuitBreaker.OPEN
+    assert sum(isinstance(result, httpx.HTTPStatusError) for result in results) == 1
+    assert sum(isinstance(result, CircuitOpenError) for result in results) == 4
+    # Two failed attempts opened the circuit; the other guests never reached the portal
+    assert fake_avs.stats["failures"] == 2
+
+
+def test_async_avs_client_against_fake_server(fake_avs):
+    config = dict(AVS_CONFIG, base_url="http://fake-avs")
+    breaker = CircuitBreaker("avs-test")
+
+    async def fetch_all():
+        transport = httpx.ASGITransport(app=fake_avs.app)
+        async with AsyncAvsClient(config, transport=transport, circuit_breaker=breaker,
+                                  retry_budget=RetryBudget()) as client:
+            return await asyncio.gather(*(client.create_guest_link(f"guest{i}@example.com") for i in range(3)))
+
+    urls = asyncio.run(fetch_all())
+
+    assert len(set(urls)) == 3
+    assert all(url.startswith("https://selfcheck-in-meldeschein.avs.de/?hash=") for url in urls)
+
+
+def test_guest_link_scanner_finds_link_split_across_chunks():
+    scanner = GuestLinkScanner(tail_size=64)
+    page = "<html>" + "x" * 500 + '<a href="https://selfcheck-in-meldeschein.avs.de/?hash=abc123">Link</a></html>'
+    chunks = [page[i:i + 7] for i in range(0, len(page), 7)]
+
+    found = None
+    for chunk in chunks:
+        found = scanner.feed(chunk)
+        if found:
+            break
+
+    assert found == "https://selfcheck-in-meldeschein.avs.de/?hash=abc123"
+
+
+def test_guest_link_scanner_waits_for_complete_hash():
+    scanner = GuestLinkScanner()
+
+    assert scanner.feed('<a href="https://selfcheck-in-meldeschein.avs.de/?hash=abc') is None
+    assert scanner.feed("123") is None
+    assert scanner.finish() == "https://selfcheck-in-meldeschein.avs.de/?hash=abc123"
+
+
+def test_avs_client_stops_scanning_once_link_is_found(monkeypatch):
+    chunks_read = 0
+    chunks_scanned = 0
+
+    class CountingScanner(GuestLinkScanner):
+        def feed(self, chunk):
+            nonlocal chunks_scanned
+            chunks_scanned += 1
+            return super().feed(chunk)
+
+    monkeypatch.setattr(avs_client_module, "GuestLinkScanner", CountingScanner)
+
+    def page():
+        nonlocal chunks_read
+        yield b'<html><a href="https://selfcheck-in-meldeschein.avs.de/?hash=abc123">Link</a>'
+        for _ in range(100):
+            chunks_read += 1
+            yield b"<div>" + b"x" * 1000 + b"</div>"
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path.endswith("/login.do"):
+            return httpx.Response(200, text="<html>Willkommen</html>")
+        return httpx.Response(200, content=page())
+
+    with AvsClient(AVS_CONFIG, transport=httpx.MockTransport(handler), circuit_breaker=CircuitBreaker("avs-test"),
+                   retry_budget=RetryBudget()) as client:
+        url = client.create_guest_link("guest@example.com")
+
+    assert url == "https://selfcheck-in-meldeschein.avs.de/?hash=abc123"
+    # The rest of the page is drained so the connection goes back to the pool, but not scanned
+    assert chunks_read == 100
+    assert chunks_scanned == 1
@@ -0,0 +1,78 @@
+import smtplib
+from datetime import date
+
+from app.models import BookingStatus, Guest, Job
+from app.services.bulk_mail_service import BulkMailService, get_mailing
+from app.services.communication_service import CommunicationService
+from app.services.email_backends import InMemoryEmailBackend
+
+
+def test_guest_mailing_sends_one_message_per_guest_in_segment(db_session, test_guest, add_booking):
+    other_guest = Guest(first_name="Jane", last_name="Roe", email="jane.roe@example.com", hashed_password="x")
+    db_session.add(other_guest)
+    db_session.commit()
+
+    add_booking(test_guest, date(2025, 6, 1), status=BookingStatus.CONFIRMED)
+    add_booking(test_guest, date(2025, 8, 1), status=BookingStatus.CONFIRMED)
+    add_booking(other_guest, date(2025, 7, 1), status=BookingStatus.CONFIRMED)
+    add_booking(other_guest, date(2024, 7, 1), status=BookingStatus.CONFIRMED)
+    add_booking(other_guest, date(2025, 9, 1), status=BookingStatus.NEW)
+
+    backend = InMemoryEmailBackend()
+    communication_service = CommunicationService(
+        {"sender": "haus@example.com", "agent_cc": "agent@example.com"}, backend=backend
+    )
+    service = BulkMailService(db_session, communication_service, {"batch_size": 1, "rate_per_minute": 0})
+
+    mailing = service.queue_mailing(
+        template_name="guest_announcement",
+        subject="Neue Hausordnung",
+        message="Bitte beachten",
+        check_in_from=date(2025, 1, 1),
+        check_in_to=date(2025, 12, 31),
+        statuses=[BookingStatus.CONFIRMED],
+    )
+    assert mailing.status == "queued"
+    job = db_session.get(Job, mailing.id)
+    assert service.send_next_batch(job).processed == 1
+    assert get_mailing(db_session, mailing.id).status == "running"
+    assert service.send_next_batch(job).processed == 2
+
+    progress = get_mailing(db_session, mailing.id)
+    assert (progress.total, progress.processed, progress.sent, progress.failed) == (2, 2, 2, 0)
+    assert [message["To"] for message in backend.outbox] == ["john.doe@example.com", "jane.roe@example.com"]
+    assert all(message["Cc"] is None for message in backend.outbox)
+
+
+class DroppingBackend(InMemoryEmailBackend):
+    """Drops the connection once, like an SMTP server closing an idle session."""
+
+    def __init__(self):
+        super().__init__()
+        self.opened = 0
+        self.dropped = False
+
+    def open(self):
+        self.opened += 1
+        return True
+
+    def send_messages(self, messages):
+        if not self.dropped:
+            self.dropped = True
+            raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+        return super().send_messages(messages)
+
+
+def test_guest_mailing_reconnects_after_disconnect(db_session, test_guest, add_booking):
+    add_booking(test_guest, date(2025, 6, 1), status=BookingStatus.CONFIRMED)
+
+    backend = DroppingBackend()
+    communication_service = CommunicationService({"sender": "haus@example.com"}, backend=backend)
+    service = BulkMailService(db_session, communication_service, {"batch_size": 10, "rate_per_minute": 0})
+
+    mailing = service.queue_mailing("guest_announcement", "Neue Hausordnung", None, date(2025, 1, 1), date(2025, 12, 31))
+    service.send_next_batch(db_session.get(Job, mailing.id))
+
+    assert backend.opened == 2
+    assert get_mailing(db_session, mailing.id).sent == 1
+    assert len(backend.outbox) == 1
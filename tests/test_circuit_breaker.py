@@ -0,0 +1,59 @@
+import pytest
+
+from app.services import circuit_breaker as circuit_breaker_module
+from app.services.circuit_breaker import CircuitBreaker, CircuitOpenError, RetryBudget
+
+
+def test_circuit_opens_after_threshold_and_fails_fast():
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=60)
+
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_circuit_allows_one_trial_after_reset_timeout(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(circuit_breaker_module.time, "monotonic", lambda: now[0])
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=30)
+
+    breaker.before_call()
+    breaker.record_failure()
+    now[0] += 31
+
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.before_call()
+
+
+def test_failed_trial_opens_circuit_again(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(circuit_breaker_module.time, "monotonic", lambda: now[0])
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=30)
+
+    for _ in range(3):
+        breaker.record_failure()
+    now[0] += 31
+    breaker.before_call()
+    breaker.record_failure()
+
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_retry_budget_limits_retries_to_share_of_requests():
+    budget = RetryBudget(ratio=0.1, min_retries=1, window=60)
+    for _ in range(20):
+        budget.record_request()
+
+    assert [budget.try_spend() for _ in range(3)] == [True, True, False]
@@ -0,0 +1,26 @@
+from app.services.communication_service import (
+    CommunicationService,
+    get_template_env,
+    precompile_templates,
+)
+
+
+def test_communication_services_share_template_env(tmp_path):
+    (tmp_path / "hello.html").write_text("Hello {{ name }}")
+
+    first = CommunicationService({}, templates_dir=str(tmp_path))
+    second = CommunicationService({}, templates_dir=str(tmp_path))
+
+    assert first.template_env is second.template_env
+
+
+def test_precompile_templates_fills_template_cache(tmp_path):
+    (tmp_path / "hello.html").write_text("Hello {{ name }}")
+    (tmp_path / "bye.html").write_text("Bye {{ name }}")
+
+    count = precompile_templates(str(tmp_path))
+
+    template_env = get_template_env(str(tmp_path))
+    assert count == 2
+    assert len(template_env.cache) == 2
+    assert template_env.get_template("hello.html").render(name="Anna") == "Hello Anna"
@@ -0,0 +1,71 @@
+import datetime
+
+from sqlalchemy import event
+
+from app.models import BookingStatus, BookingToken
+from app.services.daily_planning_service import DailyPlanningService
+
+
+def test_plan_selects_candidates_per_job(db_session, test_guest, add_booking):
+    today = datetime.date.today()
+    old = datetime.datetime.utcnow() - datetime.timedelta(days=2)
+    unconfirmed = add_booking(test_guest, today + datetime.timedelta(days=60), modified_at=old)
+    kurkarten_due = add_booking(test_guest, today + datetime.timedelta(days=20), confirmed=True)
+    pre_arrival_due = add_booking(test_guest, today + datetime.timedelta(days=3), confirmed=True,
+                                  kurkarten_email_sent=True)
+    invoice_due = add_booking(test_guest, today - datetime.timedelta(days=14), confirmed=True,
+                              kurkarten_email_sent=True, pre_arrival_email_sent=True)
+    settled = add_booking(test_guest, today - datetime.timedelta(days=60), confirmed=True,
+                          kurkarten_email_sent=True, pre_arrival_email_sent=True, invoice_created=True, paid=True,
+                          status=BookingStatus.DEPARTED_DONE)
+
+    planning_service = DailyPlanningService(db_session)
+    plan = planning_service.build_plan(today=today)
+    bookings = planning_service.load_bookings(plan.booking_ids)
+
+    assert settled.id not in plan.booking_ids
+    assert [b for b in bookings if plan.needs_confirmation(b)] == [unconfirmed]
+    assert [b for b in bookings if plan.needs_kurkarten_email(b)] == [kurkarten_due]
+    assert [b for b in bookings if plan.needs_pre_arrival_email(b)] == [pre_arrival_due]
+    assert [b for b in bookings if plan.needs_invoice(b)] == [invoice_due]
+
+
+def test_plan_chunks_resume_after_checkpoint(db_session, test_guest, add_booking):
+    today = datetime.date.today()
+    booking_ids = [add_booking(test_guest, today + datetime.timedelta(days=30 + offset)).id
+                   for offset in range(5)]
+
+    plan = DailyPlanningService(db_session).build_plan(today=today)
+
+    assert list(plan.chunks(2)) == [booking_ids[0:2], booking_ids[2:4], booking_ids[4:]]
+    assert list(plan.chunks(2, after_id=booking_ids[1])) == [booking_ids[2:4], booking_ids[4:]]
+
+
+def test_plan_loads_related_rows_up_front(db_session, test_guest, add_booking, test_db_engine):
+    today = datetime.date.today()
+    for offset in range(5):
+        booking = add_booking(test_guest, today + datetime.timedelta(days=10 + offset * 10), confirmed=True)
+        db_session.add(BookingToken(booking_id=booking.id, token=f"token-{offset}",
+                                    expires_at=datetime.datetime.utcnow() + datetime.timedelta(days=90)))
+    db_session.commit()
+    db_session.expire_all()
+
+    planning_service = DailyPlanningService(db_session)
+    bookings = planning_service.load_bookings(planning_service.build_plan(today=today).booking_ids)
+
+    statements = []
+
+    def record_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(test_db_engine, "before_cursor_execute", record_statement)
+    try:
+        for booking in bookings:
+            assert booking.guest.email
+            assert booking.tokens
+            assert booking.meter_readings is None
+            assert booking.invoice_snapshot is None
+    finally:
+        event.remove(test_db_engine, "before_cursor_execute", record_statement)
+
+    assert statements == []
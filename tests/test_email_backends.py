@@ -0,0 +1,51 @@
+import mailbox
+
+import pytest
+
+from app.services.communication_service import CommunicationService
+from app.services.email_backends import EmailBackend, FileEmailBackend, InMemoryEmailBackend, NullEmailBackend, get_email_backend
+
+
+def make_service(tmp_path, backend):
+    (tmp_path / "hello.html").write_text("<p>Hallo {{ name }}</p>")
+    return CommunicationService({"sender": "haus@example.com"}, templates_dir=str(tmp_path), backend=backend)
+
+
+def test_in_memory_backend_collects_rendered_messages(tmp_path):
+    backend = InMemoryEmailBackend()
+    service = make_service(tmp_path, backend)
+
+    service.send_email("guest@example.com", "Hallo", "hello", {"name": "Anna"})
+
+    assert len(backend.outbox) == 1
+    message = backend.outbox[0]
+    assert message["To"] == "guest@example.com"
+    assert "Hallo Anna" in message.get_payload(0).get_payload(decode=True).decode()
+
+
+def test_file_backend_writes_maildir(tmp_path):
+    maildir_path = tmp_path / "sent"
+    service = make_service(tmp_path, FileEmailBackend(str(maildir_path)))
+
+    service.send_email("guest@example.com", "Hallo", "hello", {"name": "Anna"})
+    service.send_email("other@example.com", "Hallo", "hello", {"name": "Ben"})
+
+    recipients = sorted(message["To"] for message in mailbox.Maildir(str(maildir_path)))
+    assert recipients == ["guest@example.com", "other@example.com"]
+
+
+def test_get_email_backend_selects_configured_backend(tmp_path):
+    assert isinstance(get_email_backend({"backend": "null"}), NullEmailBackend)
+    assert isinstance(get_email_backend({"backend": "memory"}), InMemoryEmailBackend)
+    assert isinstance(
+        get_email_backend({"backend": "file", "file_path": str(tmp_path / "mbox"), "file_format": "mbox"}),
+        FileEmailBackend,
+    )
+
+
+def test_backends_must_implement_send_messages():
+    class IncompleteBackend(EmailBackend):
+        name = "incomplete"
+
+    with pytest.raises(TypeError):
+        IncompleteBackend()
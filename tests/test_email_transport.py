@@ -0,0 +1,125 @@
+import asyncio
+import time
+from email.mime.text import MIMEText
+
+import pytest
+
+from app.services.email_transport import AsyncSMTPTransport
+
+
+class FakeSMTPServer:
+    """Minimal asyncio SMTP stand-in that records messages and open sessions."""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.messages = []
+        self.active_sessions = 0
+        self.max_active_sessions = 0
+        self.server = None
+        self.sessions = set()
+
+    @property
+    def port(self) -> int:
+        return self.server.sockets[0].getsockname()[1]
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+
+    async def stop(self):
+        self.server.close()
+        for session in self.sessions:
+            session.cancel()
+        await asyncio.gather(*self.sessions, return_exceptions=True)
+        await self.server.wait_closed()
+
+    async def handle(self, reader, writer):
+        self.sessions.add(asyncio.current_task())
+        self.active_sessions += 1
+        self.max_active_sessions = max(self.max_active_sessions, self.active_sessions)
+        try:
+            writer.write(b"220 localhost ESMTP\r\n")
+            await writer.drain()
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                command = line.decode().strip().upper()
+                if command.startswith("EHLO"):
+                    writer.write(b"250-localhost\r\n250 8BITMIME\r\n")
+                elif command.startswith(("HELO", "MAIL", "RCPT", "RSET", "NOOP")):
+                    writer.write(b"250 OK\r\n")
+                elif command == "DATA":
+                    writer.write(b"354 End data with <CR><LF>.<CR><LF>\r\n")
+                    await writer.drain()
+                    data = []
+                    while True:
+                        data_line = await reader.readline()
+                        if data_line in (b".\r\n", b".\n", b""):
+                            break
+                        data.append(data_line)
+                    await asyncio.sleep(self.delay)
+                    self.messages.append(b"".join(data))
+                    writer.write(b"250 OK\r\n")
+                elif command == "QUIT":
+                    writer.write(b"221 Bye\r\n")
+                    await writer.drain()
+                    break
+                else:
+                    writer.write(b"502 Command not implemented\r\n")
+                await writer.drain()
+        finally:
+            self.active_sessions -= 1
+            writer.close()
+
+
+def make_message(recipient: str) -> MIMEText:
+    message = MIMEText("<p>Hallo</p>", "html")
+    message["From"] = "haus@example.com"
+    message["To"] = recipient
+    message["Subject"] = "Test"
+    return message
+
+
+def make_transport(server: FakeSMTPServer, **kwargs) -> AsyncSMTPTransport:
+    email_config = {
+        "smtp_server": "127.0.0.1",
+        "smtp_port": server.port,
+        "username": None,
+        "password": None,
+        "starttls": False,
+    }
+    return AsyncSMTPTransport(email_config, **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_async_transport_overlaps_sends_within_limit():
+    server = FakeSMTPServer(delay=0.2)
+    await server.start()
+    try:
+        transport = make_transport(server, max_concurrency=3)
+        messages = [make_message(f"guest{i}@example.com") for i in range(6)]
+
+        started = time.monotonic()
+        errors = await transport.send_messages(messages)
+        elapsed = time.monotonic() - started
+    finally:
+        await server.stop()
+
+    assert errors == [None] * 6
+    assert len(server.messages) == 6
+    assert server.max_active_sessions <= 3
+    # Six sequential sends would take at least 1.2 s
+    assert elapsed < 1.0
+
+
+@pytest.mark.asyncio
+async def test_async_transport_times_out_slow_messages():
+    server = FakeSMTPServer(delay=1.0)
+    await server.start()
+    try:
+        transport = make_transport(server, timeout=0.2)
+        errors = await transport.send_messages([make_message("guest@example.com")])
+    finally:
+        await server.stop()
+
+    assert isinstance(errors[0], asyncio.TimeoutError)
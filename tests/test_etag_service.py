@@ -0,0 +1,94 @@
+import datetime
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base, get_db
+from app.models import Booking, Guest, Payment
+from app.services import token_service
+from app.services.etag_service import EtagService, etag_matches
+from app.services.token_filter import LiveTokenFilter
+from app.services.token_service import TokenCache, TokenService
+from main import app
+
+
+@pytest.fixture
+def file_session(tmp_path):
+    # A file database, since the app runs sync endpoints in a worker thread
+    engine = create_engine(f"sqlite:///{tmp_path / 'etag.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+@pytest.fixture
+def guest_client(file_session, monkeypatch):
+    monkeypatch.setattr(token_service, "token_cache", TokenCache(max_size=10, ttl_seconds=60))
+    monkeypatch.setattr(token_service, "live_token_filter", LiveTokenFilter(capacity=100, probe_seconds=0, rebuild_seconds=3600))
+    app.dependency_overrides[get_db] = lambda: file_session
+    # Without the lifespan, so no scheduler or job runner is started
+    yield TestClient(app)
+    app.dependency_overrides.clear()
+
+
+def test_etag_changes_with_booking_and_related_rows(db_session, test_booking):
+    etag_service = EtagService(db_session)
+    etag = etag_service.guest_booking_etag(test_booking.id)
+    assert etag == etag_service.guest_booking_etag(test_booking.id)
+
+    test_booking.kurtaxe_notes = "2 adults"
+    db_session.commit()
+    after_update = etag_service.guest_booking_etag(test_booking.id)
+    assert after_update != etag
+
+    db_session.add(Payment(booking_id=test_booking.id, amount=100.0, payment_date=datetime.date.today()))
+    db_session.commit()
+    after_payment = etag_service.guest_booking_etag(test_booking.id)
+    assert after_payment != after_update
+
+    db_session.query(Payment).delete()
+    db_session.commit()
+    assert etag_service.guest_booking_etag(test_booking.id) != after_payment
+    assert etag_service.guest_booking_etag(999) is None
+
+
+def test_bookings_etag_changes_when_a_booking_is_added(db_session, test_booking, test_guest):
+    etag = EtagService(db_session).bookings_etag()
+    db_session.add(Booking(guest_id=test_guest.id, check_in=datetime.date(2026, 8, 1), check_out=datetime.date(2026, 8, 8)))
+    db_session.commit()
+
+    assert EtagService(db_session).bookings_etag() != etag
+
+
+def test_etag_matches_if_none_match_lists():
+    assert etag_matches('"a", W/"b"', '"b"')
+    assert etag_matches("*", '"b"')
+    assert not etag_matches('"a"', '"b"')
+    assert not etag_matches(None, '"b"')
+
+
+def test_guest_booking_returns_304_for_unchanged_booking(file_session, guest_client):
+    guest = Guest(first_name="John", last_name="Doe", email="john.doe@example.com", hashed_password="x")
+    booking = Booking(guest=guest, check_in=datetime.date.today(), check_out=datetime.date.today() + datetime.timedelta(days=7))
+    file_session.add(booking)
+    file_session.commit()
+    token = TokenService(file_session).generate_token(booking.id)
+
+    first = guest_client.get(f"/guest/booking/{token}")
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+
+    unchanged = guest_client.get(f"/guest/booking/{token}", headers={"If-None-Match": etag})
+    assert unchanged.status_code == 304
+    assert unchanged.content == b""
+
+    booking.kurtaxe_amount = 12.5
+    file_session.commit()
+    changed = guest_client.get(f"/guest/booking/{token}", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.json()["kurtaxe_amount"] == 12.5
+    assert changed.headers["etag"] != etag
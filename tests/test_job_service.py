@@ -0,0 +1,128 @@
+import datetime
+
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+from app.models import Booking, Guest, Job
+from app.schemas import JobResponse
+from app.services.bulk_mail_service import BulkMailService, get_mailing
+from app.services.communication_service import CommunicationService
+from app.services.email_backends import InMemoryEmailBackend
+from app.services.job_service import JOB_HANDLERS, JobRunner, JobService, job_handler
+
+
+@pytest.fixture
+def echo_jobs():
+    @job_handler("test_echo")
+    def echo(db, job):
+        if job.payload.get("fail"):
+            raise ValueError("Failed to send email")
+        return {"echo": job.payload["value"]}
+
+    yield
+    JOB_HANDLERS.pop("test_echo")
+
+
+def test_job_runs_once_and_stores_result(db_session, echo_jobs):
+    job_service = JobService(db_session, owner="worker-1")
+    job = job_service.enqueue("test_echo", {"value": 42})
+    assert job.status == "queued"
+
+    claimed = job_service.claim_next()
+    assert claimed.id == job.id
+    assert claimed.status == "running"
+    # Another runner finds nothing left to claim
+    assert JobService(db_session, owner="worker-2").claim_next() is None
+
+    job_service.run_job(claimed)
+
+    assert job_service.get_job(job.id).status == "succeeded"
+    assert job_service.get_job(job.id).result == {"echo": 42}
+
+
+def test_failing_job_records_error(db_session, echo_jobs, test_db_engine):
+    job = JobService(db_session).enqueue("test_echo", {"fail": True})
+
+    assert JobRunner(poll_seconds=1, session_factory=sessionmaker(bind=test_db_engine)).run_pending() == 1
+
+    db_session.expire_all()
+    assert job.status == "failed"
+    assert job.error == "Failed to send email"
+    assert job.finished_at is not None
+
+
+def test_booking_job_requires_existing_booking(db_session, test_guest):
+    job_service = JobService(db_session)
+    with pytest.raises(ValueError):
+        job_service.enqueue_booking_job("kurkarten_email", 999)
+    with pytest.raises(ValueError):
+        job_service.enqueue("unknown_job")
+
+    booking = Booking(guest_id=test_guest.id, check_in=datetime.date(2026, 7, 1), check_out=datetime.date(2026, 7, 8))
+    db_session.add(booking)
+    db_session.commit()
+
+    job = job_service.enqueue_booking_job("kurkarten_email", booking.id)
+    assert job.payload == {"booking_id": booking.id}
+
+
+def test_job_of_stopped_runner_is_queued_again(db_session, echo_jobs):
+    job_config = {"timeout_seconds": 60, "max_attempts": 2}
+    job = JobService(db_session, job_config=job_config).enqueue("test_echo", {"value": 1})
+
+    for attempt in range(2):
+        crashed_runner = JobService(db_session, owner=f"worker-{attempt}", job_config=job_config)
+        assert crashed_runner.claim_next().id == job.id
+        # The runner dies: no heartbeat for longer than the timeout
+        job.heartbeat_at = datetime.datetime.utcnow() - datetime.timedelta(seconds=120)
+        db_session.commit()
+
+    other_runner = JobService(db_session, owner="worker-3", job_config=job_config)
+    assert other_runner.claim_next() is None
+
+    db_session.expire_all()
+    assert job.status == "failed"
+    assert job.attempts == 2
+
+
+def test_running_job_with_heartbeat_is_not_taken_back(db_session, echo_jobs):
+    job_config = {"timeout_seconds": 60, "max_attempts": 3}
+    job = JobService(db_session, job_config=job_config).enqueue("test_echo", {"value": 1})
+    runner = JobService(db_session, owner="worker-1", job_config=job_config)
+    assert runner.claim_next().id == job.id
+
+    assert runner.heartbeat(job.id)
+    assert JobService(db_session, owner="worker-2", job_config=job_config).claim_next() is None
+    assert job.status == "running"
+
+
+def test_mailing_waits_in_the_queue_between_batches(db_session, echo_jobs, test_guest, test_db_engine, monkeypatch):
+    monkeypatch.setenv("BULK_MAIL_BATCH_SIZE", "1")
+    monkeypatch.setenv("BULK_MAIL_RATE_PER_MINUTE", "30")
+    monkeypatch.setattr("app.services.job_service.get_email_config",
+                        lambda: {"backend": "memory", "sender": "haus@example.com"})
+    for check_in in (datetime.date(2025, 6, 1), datetime.date(2025, 7, 1)):
+        db_session.add(Booking(guest_id=test_guest.id, check_in=check_in, check_out=check_in + datetime.timedelta(days=5)))
+    other_guest = Guest(first_name="Jane", last_name="Roe", email="jane.roe@example.com", hashed_password="x")
+    db_session.add(other_guest)
+    db_session.commit()
+    db_session.add(Booking(guest_id=other_guest.id, check_in=datetime.date(2025, 8, 1), check_out=datetime.date(2025, 8, 6)))
+    db_session.commit()
+
+    communication_service = CommunicationService({"sender": "haus@example.com"}, backend=InMemoryEmailBackend())
+    mailing = BulkMailService(db_session, communication_service).queue_mailing(
+        "guest_announcement", "Neue Hausordnung", None, datetime.date(2025, 1, 1), datetime.date(2025, 12, 31)
+    )
+    echo = JobService(db_session).enqueue("test_echo", {"value": 1})
+
+    # The first batch is sent, then the echo job runs while the mailing waits for its next batch
+    assert JobRunner(poll_seconds=1, session_factory=sessionmaker(bind=test_db_engine)).run_pending() == 2
+
+    db_session.expire_all()
+    job = db_session.get(Job, mailing.id)
+    assert echo.status == "succeeded"
+    assert job.status == "queued"
+    assert job.run_after > datetime.datetime.utcnow()
+    assert get_mailing(db_session, mailing.id).processed == 1
+    progress = JobResponse.model_validate(job)
+    assert (progress.processed, progress.total) == (1, 2)
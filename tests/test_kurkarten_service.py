@@ -0,0 +1,125 @@
+import asyncio
+import datetime
+
+from app.models import BookingStatus
+from app.services.kurkarten_service import KurkartenService
+
+
+def make_service(db_session, communication_service, urls):
+    service = KurkartenService(db_session, communication_service)
+    fetched = []
+
+    def fetch(guest_email):
+        fetched.append(guest_email)
+        return urls.pop(0)
+
+    service._fetch_kurkarten_url = fetch
+    return service, fetched
+
+
+def test_fetched_url_is_kept_when_sending_fails(db_session, test_guest, add_booking, communication_service):
+    booking = add_booking(test_guest, confirmed=True)
+
+    communication_service.fail = True
+    service, fetched = make_service(db_session, communication_service, ["https://avs.test/?hash=a1"])
+    assert not service.send_kurkarten_request_email(booking.id)
+    assert booking.kurkarten_url == "https://avs.test/?hash=a1"
+
+    communication_service.fail = False
+    service, fetched = make_service(db_session, communication_service, [])
+    assert service.send_kurkarten_request_email(booking.id)
+    assert fetched == []
+    assert communication_service.sent[0]["context"]["kurkarten_url"] == "https://avs.test/?hash=a1"
+
+
+def test_resend_reuses_stored_url(db_session, test_guest, add_booking, communication_service):
+    booking = add_booking(test_guest, confirmed=True)
+    service, fetched = make_service(db_session, communication_service, ["https://avs.test/?hash=a1"])
+
+    assert not service.resend_kurkarten_request_email(booking.id)
+    assert service.send_kurkarten_request_email(booking.id)
+    assert service.resend_kurkarten_request_email(booking.id)
+
+    assert len(fetched) == 1
+    assert len(communication_service.sent) == 2
+
+
+def test_expired_url_is_fetched_again(db_session, test_guest, add_booking, communication_service):
+    booking = add_booking(
+        test_guest, confirmed=True,
+        kurkarten_url="https://avs.test/?hash=old",
+        kurkarten_url_fetched_at=datetime.datetime.utcnow() - datetime.timedelta(days=365),
+    )
+    service, fetched = make_service(db_session, communication_service, ["https://avs.test/?hash=new"])
+
+    assert service.get_or_fetch_kurkarten_url(booking) == "https://avs.test/?hash=new"
+    assert fetched == [test_guest.email]
+    assert booking.kurkarten_url == "https://avs.test/?hash=new"
+
+
+def test_prefetch_stores_urls_only_for_upcoming_bookings(db_session, test_guest, add_booking, communication_service):
+    today = datetime.date.today()
+    upcoming = add_booking(test_guest, confirmed=True)
+    upcoming.check_in, upcoming.check_out = today + datetime.timedelta(days=30), today + datetime.timedelta(days=37)
+    far_away = add_booking(test_guest, confirmed=True)
+    far_away.check_in, far_away.check_out = today + datetime.timedelta(days=200), today + datetime.timedelta(days=207)
+    db_session.commit()
+
+    service, fetched = make_service(db_session, communication_service, ["https://avs.test/?hash=a1"])
+
+    assert service.prefetch_kurkarten_url(upcoming.id)
+    assert not service.prefetch_kurkarten_url(far_away.id)
+    assert service.get_prefetch_kurkarten_bookings() == []
+    assert upcoming.kurkarten_url == "https://avs.test/?hash=a1"
+    assert far_away.kurkarten_url is None
+    assert len(fetched) == 1
+
+
+def test_fetched_links_are_sent_on_the_event_loop(db_session, test_guest, add_booking, communication_service):
+    booking = add_booking(test_guest, confirmed=True)
+    service = KurkartenService(db_session, communication_service)
+
+    async def fetch_guest_links(bookings):
+        for fetched_booking in bookings:
+            yield fetched_booking.id, "https://avs.test/?hash=a1", None
+
+    service._fetch_guest_links = fetch_guest_links
+
+    assert asyncio.run(service._fetch_and_send_kurkarten_emails([booking])) == 1
+    assert communication_service.sent[0]["context"]["kurkarten_url"] == "https://avs.test/?hash=a1"
+    assert booking.kurkarten_email_sent
+    assert booking.kurkarten_url == "https://avs.test/?hash=a1"
+
+
+def test_missing_portal_configuration_fails_each_booking(db_session, test_guest, add_booking, communication_service, monkeypatch):
+    monkeypatch.setattr("app.services.avs_client.get_kurkarten_config", lambda: {})
+    stored = add_booking(test_guest, confirmed=True, kurkarten_url="https://avs.test/?hash=a1",
+                         kurkarten_url_fetched_at=datetime.datetime.utcnow())
+    to_fetch = add_booking(test_guest, confirmed=True)
+    service = KurkartenService(db_session, communication_service)
+
+    assert service.check_and_send_kurkarten_emails([stored, to_fetch]) == 1
+    assert not service.send_kurkarten_request_email(to_fetch.id)
+    assert stored.kurkarten_email_sent
+    assert not to_fetch.kurkarten_email_sent
+
+
+def test_resend_keeps_status_and_sent_date(db_session, test_guest, add_booking, communication_service):
+    sent_date = datetime.datetime(2026, 6, 6, 9, 15)
+    booking = add_booking(
+        test_guest, confirmed=True,
+        status=BookingStatus.READY_FOR_ARRIVAL,
+        kurkarten_email_sent=True,
+        kurkarten_email_sent_date=sent_date,
+        kurkarten_url="https://avs.test/?hash=a1",
+        kurkarten_url_fetched_at=datetime.datetime.utcnow(),
+    )
+    service, fetched = make_service(db_session, communication_service, [])
+
+    assert service.resend_kurkarten_request_email(booking.id)
+
+    db_session.refresh(booking)
+    assert booking.status == BookingStatus.READY_FOR_ARRIVAL
+    assert booking.kurkarten_email_sent_date == sent_date
+    assert fetched == []
+    assert communication_service.sent[0]["context"]["kurkarten_url"] == "https://avs.test/?hash=a1"
@@ -0,0 +1,33 @@
+from datetime import date
+
+from app.models import Booking, Guest
+from app.services.kurkarten_service import KurkartenService
+from app.services.reminder_service import ReminderCollector
+
+
+def make_booking(booking_id: int) -> Booking:
+    guest = Guest(first_name="Jane", last_name=f"Doe{booking_id}", email=f"jane{booking_id}@example.com")
+    return Booking(id=booking_id, guest=guest, check_in=date(2026, 7, 1), check_out=date(2026, 7, 8))
+
+
+def test_agent_reminders_are_sent_as_one_digest(db_session, communication_service):
+    collector = ReminderCollector(communication_service)
+    kurkarten_service = KurkartenService(db_session, communication_service, collector)
+
+    for booking_id in (1, 2, 3):
+        kurkarten_service._send_agent_reminder(make_booking(booking_id), "Missing meter readings", ["Gas readings"])
+
+    assert communication_service.sent == []
+    assert collector.flush() == 3
+
+    assert len(communication_service.sent) == 1
+    digest = communication_service.sent[0]
+    assert digest["template_name"] == "agent_reminder_digest"
+    assert [reminder["booking_id"] for reminder in digest["context"]["reminders"]] == [1, 2, 3]
+
+
+def test_empty_reminder_digest_is_not_sent(communication_service):
+    collector = ReminderCollector(communication_service)
+
+    assert collector.flush() == 0
+    assert communication_service.sent == []
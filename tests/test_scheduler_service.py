@@ -0,0 +1,355 @@
+import datetime
+import os
+import smtplib
+import socket
+import threading
+import time
+from email.mime.text import MIMEText
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+from app.models import Booking, Guest
+from app.services.booking_service import BookingService
+from app.services.daily_planning_service import DailyPlan, DailyPlanningService
+from app.services.invoice_service import InvoiceService
+from app.services.job_lease_service import JobLeaseService
+from app.services.scheduler_run_service import SchedulerRunService
+from app.services.scheduler_service import SchedulerService
+
+
+@pytest.fixture
+def scheduler_engine(tmp_path):
+    # A file database, since jobs open their sessions from worker threads
+    engine = create_engine(f"sqlite:///{tmp_path / 'scheduler.db'}")
+    Base.metadata.create_all(bind=engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def scheduler(scheduler_engine):
+    scheduler = SchedulerService(workers=2)
+    scheduler.get_db_session = sessionmaker(bind=scheduler_engine)
+    yield scheduler
+    scheduler.stop_scheduler()
+
+
+def test_jobs_run_in_worker_pool_and_do_not_overlap(scheduler):
+    release = threading.Event()
+    threads = []
+
+    def run_slow_job():
+        threads.append(threading.current_thread().name)
+        release.wait(timeout=5)
+
+    first = scheduler.submit_job(run_slow_job)
+    assert scheduler.submit_job(run_slow_job) is None
+
+    release.set()
+    first.result(timeout=5)
+
+    assert threads and threads[0].startswith("scheduler")
+
+
+def test_job_runs_once_per_day_across_processes(scheduler, scheduler_engine):
+    runs = []
+
+    def run_daily_job():
+        runs.append(1)
+        return "done"
+
+    assert scheduler.run_exclusive(run_daily_job) == "done"
+    # Another process whose schedule fires a moment later finds the run completed
+    other_process = SchedulerService(workers=1)
+    other_process.get_db_session = sessionmaker(bind=scheduler_engine)
+    assert other_process.run_exclusive(run_daily_job) is None
+
+    assert len(runs) == 1
+
+
+def test_lease_is_exclusive_until_released(db_session):
+    first = JobLeaseService(db_session, owner="web-1")
+    second = JobLeaseService(db_session, owner="web-2")
+
+    assert first.acquire("run_invoice_generation", "2026-10-19", lease_seconds=60)
+    assert not second.acquire("run_invoice_generation", "2026-10-19", lease_seconds=60)
+
+    first.release("run_invoice_generation", "2026-10-19")
+    assert not second.acquire("run_invoice_generation", "2026-10-19", lease_seconds=60)
+    assert second.acquire("run_invoice_generation", "2026-10-20", lease_seconds=60)
+
+
+def test_failed_run_is_not_marked_completed(scheduler):
+    attempts = []
+
+    def run_flaky_job():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("SMTP down")
+        return 1
+
+    assert scheduler.run_exclusive(run_flaky_job) is None
+    # The retry the same day runs again, and only the successful run completes the day
+    assert scheduler.run_exclusive(run_flaky_job) == 1
+    assert scheduler.run_exclusive(run_flaky_job) is None
+
+    assert len(attempts) == 2
+
+
+def test_lease_is_renewed_while_a_long_job_runs(scheduler, scheduler_engine):
+    scheduler.lease_seconds = 0.3
+    other_process = JobLeaseService(sessionmaker(bind=scheduler_engine)(), owner="web-2")
+    taken_over = []
+
+    def run_long_job():
+        for _ in range(5):
+            time.sleep(0.15)
+            taken_over.append(other_process.acquire("run_long_job", datetime.date.today().isoformat(), 60))
+
+    scheduler.run_exclusive(run_long_job)
+    other_process.db.close()
+
+    assert taken_over == [False] * 5
+
+
+def test_runs_are_recorded_with_counts_and_errors(scheduler, scheduler_engine):
+    def run_sending_job():
+        return 3
+
+    def run_failing_job():
+        raise RuntimeError("SMTP down")
+
+    scheduler.run_exclusive(run_sending_job)
+    scheduler.run_exclusive(run_failing_job)
+
+    db = sessionmaker(bind=scheduler_engine)()
+    try:
+        runs = {run.job_name: run for run in SchedulerRunService(db).get_runs()}
+        stats = {entry["job_name"]: entry for entry in SchedulerRunService(db).get_stats()}
+    finally:
+        db.close()
+
+    assert runs["run_sending_job"].status == "succeeded"
+    assert runs["run_sending_job"].items_processed == 3
+    assert runs["run_failing_job"].status == "failed"
+    assert runs["run_failing_job"].error == "SMTP down"
+    assert stats["run_sending_job"]["p95_duration_seconds"] is not None
+    assert stats["run_failing_job"]["failed"] == 1
+
+
+def test_catch_up_runs_jobs_due_earlier_today(scheduler):
+    runs = []
+
+    def run_early_job():
+        runs.append("early")
+
+    def run_late_job():
+        runs.append("late")
+
+    scheduler.daily_jobs = lambda: [("00:00", run_early_job), ("23:59:59", run_late_job)]
+    for future in scheduler.submit_catch_up().result(timeout=5):
+        future.result(timeout=5)
+    # A second start the same day does not repeat the completed run
+    assert scheduler.catch_up_missed_runs() == []
+
+    assert runs == ["early"]
+
+
+def test_catch_up_runs_the_latest_due_job_first(scheduler):
+    scheduler.workers = 1
+    runs = []
+
+    def run_prefetch():
+        runs.append("prefetch")
+
+    def run_pipeline():
+        runs.append("pipeline")
+
+    scheduler.daily_jobs = lambda: [("00:00", run_prefetch), ("00:00", run_pipeline)]
+    for future in scheduler.catch_up_missed_runs():
+        future.result(timeout=5)
+
+    assert runs == ["pipeline", "prefetch"]
+
+
+def test_run_of_crashed_process_is_taken_over_on_restart(scheduler, scheduler_engine):
+    run_key = datetime.date.today().isoformat()
+    # The process before the restart had this PID too, but its own random suffix
+    crashed_owner = f"{socket.gethostname()}-{os.getpid()}-deadbeef"
+    db = sessionmaker(bind=scheduler_engine)()
+    try:
+        assert JobLeaseService(db, owner=crashed_owner).acquire("run_daily_job", run_key, lease_seconds=3600)
+        SchedulerRunService(db).start_run("run_daily_job", run_key, crashed_owner)
+    finally:
+        db.close()
+
+    runs = []
+
+    def run_daily_job():
+        runs.append(1)
+        return 1
+
+    scheduler.daily_jobs = lambda: [("00:00", run_daily_job)]
+    for future in scheduler.catch_up_missed_runs():
+        future.result(timeout=5)
+
+    db = sessionmaker(bind=scheduler_engine)()
+    try:
+        statuses = sorted(run.status for run in SchedulerRunService(db).get_runs("run_daily_job"))
+    finally:
+        db.close()
+
+    assert runs == [1]
+    assert statuses == ["failed", "succeeded"]
+
+
+def test_lease_of_other_host_is_kept_until_it_expires(db_session):
+    other_host = JobLeaseService(db_session, owner="other-host-1234-abcd1234")
+    assert other_host.acquire("run_daily_job", "2026-10-19", lease_seconds=0.1)
+
+    assert not JobLeaseService(db_session).acquire("run_daily_job", "2026-10-19", lease_seconds=60)
+    time.sleep(0.2)
+    assert JobLeaseService(db_session).acquire("run_daily_job", "2026-10-19", lease_seconds=60)
+
+
+def test_pipeline_step_resumes_after_last_finished_chunk(scheduler, scheduler_engine):
+    db = sessionmaker(bind=scheduler_engine)()
+    try:
+        guest = Guest(first_name="John", last_name="Doe", email="john.doe@example.com", hashed_password="x")
+        check_in = datetime.date.today() + datetime.timedelta(days=30)
+        bookings = [Booking(guest=guest, check_in=check_in, check_out=check_in + datetime.timedelta(days=7))
+                    for _ in range(5)]
+        db.add_all(bookings)
+        db.commit()
+        booking_ids = [booking.id for booking in bookings]
+    finally:
+        db.close()
+
+    scheduler.chunk_size = 2
+    plan = DailyPlan(booking_ids, datetime.date.today(), auto_confirm_delay_hours=24)
+    processed = []
+
+    def process_until_crash(db, chunk):
+        if chunk[0].id == booking_ids[2]:
+            raise RuntimeError("SMTP down")
+        processed.extend(booking.id for booking in chunk)
+        return len(chunk)
+
+    def not_processed(booking):
+        return booking.id not in processed
+
+    # The chunk after the failing one still runs, but the step is not finished
+    assert scheduler._run_step("kurkarten_emails", "2026-10-19", plan, not_processed, process_until_crash) == (3, False)
+
+    def process(db, chunk):
+        processed.extend(booking.id for booking in chunk)
+        return len(chunk)
+
+    # The rerun continues with the chunk that failed instead of starting over
+    assert scheduler._run_step("kurkarten_emails", "2026-10-19", plan, not_processed, process) == (2, True)
+    assert sorted(processed) == booking_ids
+    assert scheduler._run_step("kurkarten_emails", "2026-10-19", plan, not_processed, process) == (0, True)
+
+
+def test_pipeline_with_unfinished_step_does_not_complete_the_day(scheduler, monkeypatch):
+    steps_finished = {"booking_status_update": False}
+
+    def run_step(name, run_key, plan, select, process):
+        return 1, steps_finished.get(name, True)
+
+    monkeypatch.setattr(scheduler, "_run_step", run_step)
+
+    assert scheduler.run_exclusive(scheduler.run_daily_pipeline) is None
+    steps_finished["booking_status_update"] = True
+    # The retry the same day runs the pipeline again
+    assert scheduler.run_exclusive(scheduler.run_daily_pipeline) == 5
+
+
+def test_job_graph_runs_independent_steps_in_parallel(scheduler):
+    order = []
+    both_started = threading.Barrier(2, timeout=5)
+
+    def step(name, wait_for_sibling=False):
+        def run():
+            order.append(name)
+            if wait_for_sibling:
+                # Only passes if the other independent step runs at the same time
+                both_started.wait()
+            return 1
+        return run
+
+    results = scheduler.run_job_graph({
+        "status": ((), step("status")),
+        "kurkarten": (("status",), step("kurkarten", wait_for_sibling=True)),
+        "pre_arrival": (("kurkarten",), step("pre_arrival")),
+        "invoices": (("status",), step("invoices", wait_for_sibling=True)),
+    })
+
+    assert results == {"status": 1, "kurkarten": 1, "pre_arrival": 1, "invoices": 1}
+    assert order[0] == "status"
+    assert order.index("pre_arrival") > order.index("kurkarten")
+
+
+def test_job_graph_rejects_unknown_and_circular_dependencies(scheduler):
+    with pytest.raises(ValueError):
+        scheduler.run_job_graph({"kurkarten": (("confirmation",), lambda: 0)})
+    with pytest.raises(ValueError):
+        scheduler.run_job_graph({"a": (("b",), lambda: 0), "b": (("a",), lambda: 0)})
+
+
+class FakeSMTP:
+    """SMTP connection stand-in that records which threads use it."""
+
+    connections = []
+
+    def __init__(self, host, port):
+        self.threads = set()
+        self.messages = []
+        self.closed = False
+        FakeSMTP.connections.append(self)
+
+    def send_message(self, message):
+        if self.closed:
+            raise smtplib.SMTPServerDisconnected("Connection closed")
+        self.threads.add(threading.current_thread().name)
+        time.sleep(0.02)
+        self.messages.append(message)
+
+    def quit(self):
+        self.closed = True
+
+    def close(self):
+        self.closed = True
+
+
+def test_parallel_pipeline_steps_do_not_share_an_smtp_connection(scheduler, monkeypatch):
+    FakeSMTP.connections = []
+    monkeypatch.setattr("app.services.email_backends.smtplib.SMTP", FakeSMTP)
+    monkeypatch.setattr("app.services.scheduler_service.get_email_config", lambda: {
+        "backend": "smtp", "smtp_server": "localhost", "smtp_port": 25, "sender": "haus@example.com", "starttls": False,
+    })
+    plan = DailyPlan([1], datetime.date.today(), auto_confirm_delay_hours=24)
+    monkeypatch.setattr(DailyPlanningService, "build_plan", lambda self, **kwargs: plan)
+    monkeypatch.setattr(DailyPlanningService, "load_bookings", lambda self, booking_ids: [object()])
+    for predicate in ("needs_status_update", "needs_kurkarten_email", "needs_pre_arrival_email"):
+        monkeypatch.setattr(plan, predicate, lambda booking: False)
+    for predicate in ("needs_confirmation", "needs_invoice"):
+        monkeypatch.setattr(plan, predicate, lambda booking: True)
+
+    both_started = threading.Barrier(2, timeout=5)
+
+    def send_two_emails(self, bookings):
+        both_started.wait()
+        self.communication_service.backend.send_messages([MIMEText("first"), MIMEText("second")])
+        return 2
+
+    monkeypatch.setattr(BookingService, "check_and_confirm_bookings", lambda self, bookings: send_two_emails(self, bookings))
+    monkeypatch.setattr(InvoiceService, "check_and_generate_invoices", send_two_emails)
+
+    # The confirmation and invoice steps both only wait for the status update, so they send at the same time
+    assert scheduler.run_daily_pipeline() == 4
+    assert sum(len(connection.messages) for connection in FakeSMTP.connections) == 4
+    assert all(len(connection.threads) == 1 for connection in FakeSMTP.connections)
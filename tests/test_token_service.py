@@ -0,0 +1,279 @@
+import datetime
+
+import pytest
+from sqlalchemy import event
+
+from app.booking_repository import BookingRepository
+from app.config.config import get_token_config
+from app.guest_repository import GuestRepository
+from app.models import Booking, BookingToken, MeterReading, Payment
+from app.services import token_service
+from app.services.booking_service import BookingService
+from app.services.communication_service import CommunicationService
+from app.services.email_backends import InMemoryEmailBackend
+from app.services.token_filter import BloomFilter, LiveTokenFilter, NegativeTokenCache
+from app.services.token_service import (
+    LastUsedBuffer, RevocationSet, TokenCache, TokenService, sign_token, verify_signed_token
+)
+
+SIGNED_CONFIG = {"format": "signed", "signing_key": "test-signing-key"}
+
+
+@pytest.fixture(autouse=True)
+def fresh_token_cache(monkeypatch):
+    monkeypatch.setattr(token_service, "token_cache", TokenCache(max_size=10, ttl_seconds=60))
+    monkeypatch.setattr(token_service, "last_used_buffer", LastUsedBuffer(flush_seconds=3600))
+    monkeypatch.setattr(token_service, "token_revocations", RevocationSet(ttl_seconds=60))
+    monkeypatch.setattr(token_service, "live_token_filter", LiveTokenFilter(capacity=100, probe_seconds=3600, rebuild_seconds=3600))
+    monkeypatch.setattr(token_service, "negative_token_cache", NegativeTokenCache(max_size=10, ttl_seconds=60))
+
+
+def record_statements(engine):
+    statements = []
+
+    def record_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record_statement)
+    return statements, lambda: event.remove(engine, "before_cursor_execute", record_statement)
+
+
+def test_cached_token_skips_token_lookup_and_write(db_session, test_booking, test_db_engine):
+    token_svc = TokenService(db_session)
+    token = token_svc.generate_token(test_booking.id)
+    assert token_svc.validate_token(token) == test_booking
+
+    statements, stop = record_statements(test_db_engine)
+    try:
+        assert token_svc.validate_token(token) == test_booking
+    finally:
+        stop()
+
+    assert not any("booking_tokens" in statement for statement in statements)
+    assert not any(statement.startswith("UPDATE") for statement in statements)
+
+
+def test_revoked_token_is_rejected_right_away(db_session, test_booking):
+    token_svc = TokenService(db_session)
+    token = token_svc.generate_token(test_booking.id)
+    assert token_svc.validate_token(token) == test_booking
+
+    token_svc.revoke_token(test_booking.id)
+
+    assert token_svc.validate_token(token) is None
+
+
+def test_last_used_is_written_in_one_batch(db_session, test_booking):
+    token_svc = TokenService(db_session)
+    tokens = [token_svc.generate_token(test_booking.id) for _ in range(3)]
+    for token in tokens:
+        token_svc.validate_token(token)
+
+    assert db_session.query(BookingToken).filter(BookingToken.last_used_at != None).count() == 0
+    assert token_svc.get_token_info(test_booking.id).last_used_at is not None
+
+    assert token_svc.flush_last_used() == 3
+    assert db_session.query(BookingToken).filter(BookingToken.last_used_at != None).count() == 3
+
+
+def test_token_cache_evicts_least_recently_used():
+    cache = TokenCache(max_size=2, ttl_seconds=60)
+    expires_at = datetime.datetime.utcnow() + datetime.timedelta(days=1)
+    cache.put("a", 1, expires_at)
+    cache.put("b", 2, expires_at)
+    cache.get("a")
+    cache.put("c", 3, expires_at)
+
+    assert cache.get("a") == (1, expires_at)
+    assert cache.get("b") is None
+    assert cache.get("c") == (3, expires_at)
+
+
+def test_signed_token_is_validated_without_token_lookup(db_session, test_booking, test_db_engine):
+    token_svc = TokenService(db_session, SIGNED_CONFIG)
+    token = token_svc.generate_token(test_booking.id)
+    assert token.startswith("s1.")
+    token_svc.validate_token(token)
+
+    statements, stop = record_statements(test_db_engine)
+    try:
+        assert token_svc.validate_token(token) == test_booking
+    finally:
+        stop()
+
+    assert not any("booking_tokens" in statement or "token_revocations" in statement for statement in statements)
+
+
+def test_signed_token_rejects_forged_and_expired_tokens(test_booking):
+    expires_at = datetime.datetime.utcnow() + datetime.timedelta(days=1)
+    token = sign_token("test-signing-key", test_booking.id, 0, expires_at)
+
+    assert verify_signed_token("test-signing-key", token).booking_id == test_booking.id
+    assert verify_signed_token("other-key", token) is None
+    assert verify_signed_token("test-signing-key", token[:-2] + "AA") is None
+    assert verify_signed_token("test-signing-key", "s1.garbage") is None
+    expired = sign_token("test-signing-key", test_booking.id, 0, datetime.datetime.utcnow() - datetime.timedelta(minutes=1))
+    assert verify_signed_token("test-signing-key", expired) is None
+
+
+def test_regenerating_revokes_earlier_signed_tokens(db_session, test_booking):
+    token_svc = TokenService(db_session, SIGNED_CONFIG)
+    old_token = token_svc.generate_token(test_booking.id)
+
+    token_svc.revoke_token(test_booking.id)
+    new_token = token_svc.generate_token(test_booking.id)
+
+    assert token_svc.validate_token(old_token) is None
+    assert token_svc.validate_token(new_token) == test_booking
+
+
+def test_signed_token_of_deleted_booking_does_not_open_a_reused_id(db_session, test_guest):
+    today = datetime.date.today()
+    booking = Booking(guest_id=test_guest.id, check_in=today, check_out=today + datetime.timedelta(days=7))
+    db_session.add(booking)
+    db_session.commit()
+    booking_id = booking.id
+    old_token = TokenService(db_session, SIGNED_CONFIG).generate_token(booking_id)
+
+    communication_service = CommunicationService({"sender": "haus@example.com"}, backend=InMemoryEmailBackend())
+    BookingService(BookingRepository(db_session), GuestRepository(db_session), communication_service).delete_booking(booking_id)
+    # SQLite hands the freed ID to the next booking
+    next_booking = Booking(guest_id=test_guest.id, check_in=today + datetime.timedelta(days=30),
+                           check_out=today + datetime.timedelta(days=37))
+    db_session.add(next_booking)
+    db_session.commit()
+    assert next_booking.id == booking_id
+
+    token_svc = TokenService(db_session, SIGNED_CONFIG)
+    assert token_svc.validate_token(old_token) is None
+    assert token_svc.validate_token(token_svc.generate_token(booking_id)) == next_booking
+
+
+def test_opaque_tokens_stay_valid_with_signed_format(db_session, test_booking):
+    opaque_token = TokenService(db_session).generate_token(test_booking.id)
+
+    assert TokenService(db_session, SIGNED_CONFIG).validate_token(opaque_token) == test_booking
+
+
+def test_guest_landing_page_costs_two_statements(db_session, test_booking, test_db_engine):
+    token_svc = TokenService(db_session)
+    token = token_svc.generate_token(test_booking.id)
+    token_svc.validate_token(token)
+    db_session.add_all([
+        Payment(booking_id=test_booking.id, amount=100.0 + i, payment_date=datetime.date.today()) for i in range(5)
+    ])
+    db_session.add(MeterReading(booking_id=test_booking.id, electricity_start=1.0, electricity_end=2.0))
+    db_session.commit()
+    db_session.expire_all()
+
+    statements, stop = record_statements(test_db_engine)
+    try:
+        response = token_svc.get_booking_by_token(token)
+    finally:
+        stop()
+
+    assert len(statements) == 2
+    assert response.guest_name == "John Doe"
+    assert len(response.payments) == 5
+    assert response.meter_readings.electricity_end == 2.0
+
+
+def test_purge_deletes_expired_tokens_in_batches(db_session, test_booking, test_guest):
+    token_svc = TokenService(db_session)
+    live_token = token_svc.generate_token(test_booking.id)
+    expired_at = datetime.datetime.utcnow() - datetime.timedelta(days=1)
+    db_session.add_all([BookingToken(booking_id=test_booking.id, token=f"expired-{i}", expires_at=expired_at) for i in range(5)])
+    old_booking = Booking(guest_id=test_guest.id, check_in=datetime.date(2025, 6, 1), check_out=datetime.date(2025, 6, 8),
+                          access_token="expired-0", token_expires_at=expired_at)
+    db_session.add(old_booking)
+    db_session.commit()
+
+    assert token_svc.purge_expired_tokens(batch_size=2) == 5
+
+    db_session.expire_all()
+    assert [t.token for t in db_session.query(BookingToken)] == [live_token]
+    assert old_booking.access_token is None
+    assert test_booking.access_token == live_token
+
+
+def test_unknown_tokens_are_rejected_without_a_query(db_session, test_booking, test_db_engine):
+    token_svc = TokenService(db_session)
+    token_svc.generate_token(test_booking.id)
+    token_svc.validate_token("warm-up")
+
+    statements, stop = record_statements(test_db_engine)
+    try:
+        for i in range(20):
+            assert token_svc.validate_token(f"guessed-{i}") is None
+    finally:
+        stop()
+
+    assert statements == []
+
+
+def test_revoked_token_probes_hit_the_database_once(db_session, test_booking, test_db_engine):
+    token_svc = TokenService(db_session)
+    token = token_svc.generate_token(test_booking.id)
+    token_svc.validate_token(token)
+    token_svc.revoke_token(test_booking.id)
+
+    statements, stop = record_statements(test_db_engine)
+    try:
+        for _ in range(5):
+            assert token_svc.validate_token(token) is None
+    finally:
+        stop()
+
+    assert len([statement for statement in statements if "booking_tokens" in statement]) == 1
+
+
+def test_tokens_issued_by_other_processes_are_picked_up(db_session, test_booking, monkeypatch):
+    monkeypatch.setattr(token_service, "live_token_filter", LiveTokenFilter(capacity=100, probe_seconds=0, rebuild_seconds=3600))
+    token_svc = TokenService(db_session)
+    token_svc.validate_token("warm-up")
+
+    # Written directly, as another process would
+    db_session.add(BookingToken(booking_id=test_booking.id, token="from-other-process",
+                                expires_at=datetime.datetime.utcnow() + datetime.timedelta(days=1)))
+    db_session.commit()
+
+    assert token_svc.validate_token("from-other-process") == test_booking
+
+
+def test_tokens_committed_out_of_order_are_picked_up(db_session, test_booking, monkeypatch):
+    monkeypatch.setattr(token_service, "live_token_filter", LiveTokenFilter(capacity=100, probe_seconds=0, rebuild_seconds=3600))
+    token_svc = TokenService(db_session)
+    expires_at = datetime.datetime.utcnow() + datetime.timedelta(days=1)
+    db_session.add(BookingToken(id=100, booking_id=test_booking.id, token="committed-first", expires_at=expires_at))
+    db_session.commit()
+    token_svc.validate_token("warm-up")
+
+    # Another process got the lower ID first but committed after this process loaded the newer row
+    db_session.add(BookingToken(id=50, booking_id=test_booking.id, token="committed-late", expires_at=expires_at,
+                                created_at=datetime.datetime.utcnow() - datetime.timedelta(seconds=5)))
+    db_session.add(BookingToken(id=60, booking_id=test_booking.id, token="created-long-ago", expires_at=expires_at,
+                                created_at=datetime.datetime.utcnow() - datetime.timedelta(days=1)))
+    db_session.commit()
+
+    assert token_svc.validate_token("committed-late") == test_booking
+    assert token_svc.validate_token("created-long-ago") == test_booking
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    tokens = [f"token-{i}" for i in range(1000)]
+    for token in tokens:
+        bloom.add(token)
+
+    assert all(token in bloom for token in tokens)
+    assert sum(f"other-{i}" in bloom for i in range(1000)) < 50
+
+
+def test_signed_format_without_key_fails_at_startup(monkeypatch):
+    monkeypatch.setenv("TOKEN_FORMAT", "signed")
+    monkeypatch.delenv("TOKEN_SIGNING_KEY", raising=False)
+    with pytest.raises(ValueError, match="TOKEN_SIGNING_KEY"):
+        get_token_config()
+
+    monkeypatch.setenv("TOKEN_SIGNING_KEY", "secret")
+    assert get_token_config()["format"] == "signed"